@@ -1,16 +1,25 @@
 import os
 import json
+import hashlib
 import logging
+import time
 from typing import Optional, Dict, Tuple
 from openai import AsyncOpenAI
+from asyncio_throttle import Throttler
 import config
 import aiofiles
+from database.db_functions import save_grading_call
+from database.models import ModelTier
+from utils.rendering import format_final_report
 
 logger = logging.getLogger(__name__)
 
 # Глобальная переменная для клиента OpenAI
 openai_client = None
 
+# Общий лимит частоты запросов к OpenAI для всех проверок процесса
+openai_throttler = Throttler(rate_limit=config.OPENAI_RATE_LIMIT, period=1.0)
+
 def get_openai_client():
     """Получить или создать OpenAI клиент"""
     global openai_client
@@ -23,6 +32,14 @@ def get_openai_client():
             raise
     return openai_client
 
+async def close_openai_client():
+    """Закрыть HTTP-сессию OpenAI клиента"""
+    global openai_client
+    if openai_client is not None:
+        await openai_client.close()
+        openai_client = None
+        logger.info("OpenAI клиент закрыт")
+
 async def load_prompt_template() -> str:
     """Загрузить шаблон промпта из файла"""
     template_path = os.path.join(config.PROMPTS_DIR, "check_answer_prompt.txt")
@@ -47,7 +64,7 @@ async def load_prompt_template() -> str:
 Оцени ответ и дай рекомендацию.
 
 ### Формат вывода (ТОЛЬКО JSON):
-{{"is_sufficient": boolean, "recommendation": "краткая рекомендация для студента"}}"""
+{{"is_sufficient": boolean, "confidence": число от 0 до 1 (уверенность в вердикте), "recommendation": "краткая рекомендация для студента"}}"""
 
 async def build_check_answer_prompt(theory_text: str, question_text: str, user_answer_text: str) -> str:
     """Собрать промпт для проверки ответа"""
@@ -86,19 +103,22 @@ async def transcribe_voice(voice_file_data: bytes) -> Optional[str]:
         logger.error(f"❌ Ошибка распознавания голоса: {e}")
         return "Извините, не удалось распознать голосовое сообщение. Попробуйте написать ответ текстом."
 
-async def analyze_answer(theory_text: str, question_text: str, user_answer_text: str) -> Optional[Tuple[bool, str]]:
-    """Анализировать ответ пользователя через OpenAI"""
-    try:
-        client = get_openai_client()
-        if client is None:
-            # Fallback анализ без OpenAI
-            logger.warning("⚠️ OpenAI недоступен, используем базовый анализ")
-            return analyze_answer_fallback(user_answer_text)
-        
-        prompt = await build_check_answer_prompt(theory_text, question_text, user_answer_text)
-        
+async def request_verdict(prompt: str, tier: str) -> Optional[Dict]:
+    """Запросить вердикт у модели указанного уровня и записать статистику вызова
+    
+    Возвращает словарь с is_sufficient, recommendation и confidence или None,
+    если модель вернула невалидный JSON.
+    """
+    client = get_openai_client()
+    if tier == ModelTier.STRONG:
+        model, max_tokens = config.OPENAI_STRONG_MODEL, config.OPENAI_MAX_TOKENS
+    else:
+        model, max_tokens = config.OPENAI_MODEL, config.OPENAI_FAST_MAX_TOKENS
+    
+    async with openai_throttler:
+        started = time.monotonic()
         response = await client.chat.completions.create(
-            model=config.OPENAI_MODEL,
+            model=model,
             messages=[
                 {
                     "role": "system",
@@ -110,31 +130,86 @@ async def analyze_answer(theory_text: str, question_text: str, user_answer_text:
                 }
             ],
             temperature=config.OPENAI_TEMPERATURE,
-            max_tokens=config.OPENAI_MAX_TOKENS
+            max_tokens=max_tokens
         )
+        latency_ms = int((time.monotonic() - started) * 1000)
+    
+    result_text = response.choices[0].message.content.strip()
+    logger.info(f"✅ Ответ от OpenAI ({model}, {latency_ms} мс): {result_text}")
+    
+    # Парсим JSON ответ
+    verdict = None
+    try:
+        result = json.loads(result_text)
+        verdict = {
+            "is_sufficient": bool(result.get("is_sufficient", False)),
+            "recommendation": result.get("recommendation", "Рекомендация не предоставлена"),
+            "confidence": float(result.get("confidence", 0))
+        }
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError) as e:
+        logger.error(f"❌ Ошибка парсинга JSON от OpenAI ({model}): {e}")
+        logger.error(f"Полученный текст: {result_text}")
+    
+    usage = response.usage
+    try:
+        await save_grading_call(
+            tier=tier,
+            model=model,
+            latency_ms=latency_ms,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            escalated=tier == ModelTier.FAST and (
+                verdict is None or verdict["confidence"] < config.GRADING_ESCALATION_CONFIDENCE
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить статистику вызова модели: {e}")
+    
+    return verdict
+
+async def analyze_answer(theory_text: str, question_text: str, user_answer_text: str,
+                         use_fallback: bool = True, strong_only: bool = False) -> Optional[Tuple[bool, str]]:
+    """Анализировать ответ пользователя через OpenAI
+    
+    Сначала ответ проверяет быстрая модель; если она не уверена (confidence ниже
+    GRADING_ESCALATION_CONFIDENCE) или ответила невалидным JSON, ответ перепроверяет
+    сильная модель. strong_only=True сразу отправляет ответ сильной модели.
+    При use_fallback=False ошибки не подменяются базовым анализом — возвращается None.
+    """
+    try:
+        client = get_openai_client()
+        if client is None:
+            # Fallback анализ без OpenAI
+            logger.warning("⚠️ OpenAI недоступен, используем базовый анализ")
+            return analyze_answer_fallback(user_answer_text) if use_fallback else None
         
-        result_text = response.choices[0].message.content.strip()
-        logger.info(f"✅ Ответ от OpenAI: {result_text}")
+        prompt = await build_check_answer_prompt(theory_text, question_text, user_answer_text)
         
-        # Парсим JSON ответ
-        try:
-            result = json.loads(result_text)
-            is_sufficient = result.get("is_sufficient", False)
-            recommendation = result.get("recommendation", "Рекомендация не предоставлена")
-            
-            return is_sufficient, recommendation
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Ошибка парсинга JSON от OpenAI: {e}")
-            logger.error(f"Полученный текст: {result_text}")
-            
+        verdict = None
+        if not strong_only:
+            verdict = await request_verdict(prompt, ModelTier.FAST)
+        
+        if verdict is None or verdict["confidence"] < config.GRADING_ESCALATION_CONFIDENCE:
+            if verdict is not None:
+                logger.info(f"⤴️ Эскалация на сильную модель (уверенность {verdict['confidence']:.2f})")
+            verdict = await request_verdict(prompt, ModelTier.STRONG)
+        
+        if verdict is None:
+            if not use_fallback:
+                return None
             # Возвращаем базовую рекомендацию если JSON невалидный
             return False, "Рекомендую повторить материал и дать более развернутый ответ."
+        
+        return verdict["is_sufficient"], verdict["recommendation"]
             
     except Exception as e:
         logger.error(f"❌ Ошибка анализа ответа через OpenAI: {e}")
         # Fallback анализ
-        return analyze_answer_fallback(user_answer_text)
+        return analyze_answer_fallback(user_answer_text) if use_fallback else None
+
+def get_prompt_fingerprint(template: str) -> str:
+    """Короткий отпечаток шаблона промпта для сравнения прогонов проверки"""
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
 
 def analyze_answer_fallback(user_answer_text: str) -> Tuple[bool, str]:
     """Простой анализ ответа без OpenAI"""
@@ -152,32 +227,7 @@ def analyze_answer_fallback(user_answer_text: str) -> Tuple[bool, str]:
 async def generate_final_report(answers_analysis: list) -> str:
     """Сгенерировать итоговый отчет по тесту"""
     try:
-        # Подсчитываем статистику
-        total_questions = len(answers_analysis)
-        sufficient_answers = sum(1 for analysis in answers_analysis if analysis["is_sufficient"])
-        
-        # Собираем рекомендации
-        recommendations = []
-        for i, analysis in enumerate(answers_analysis, 1):
-            if not analysis["is_sufficient"]:
-                recommendations.append(f"{i}. {analysis['recommendation']}")
-        
-        # Формируем отчет
-        report_parts = [
-            f"📊 **Результаты анализа вашего теста:**\n",
-            f"✅ Достаточных ответов: {sufficient_answers}/{total_questions}",
-            f"📈 Процент успешности: {(sufficient_answers/total_questions)*100:.1f}%\n"
-        ]
-        
-        if recommendations:
-            report_parts.append("💡 **Рекомендации для улучшения:**\n")
-            report_parts.extend(recommendations)
-        else:
-            report_parts.append("🎉 **Отличная работа!** Все ваши ответы достаточно полные и правильные!")
-        
-        report_parts.append("\n📚 Продолжайте изучение следующих тем!")
-        
-        return "\n".join(report_parts)
+        return format_final_report(answers_analysis)
         
     except Exception as e:
         logger.error(f"❌ Ошибка генерации отчета: {e}")
@@ -1,21 +1,38 @@
 import asyncio
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from aiogram import Bot
+import config
 from ai.ai_processor import analyze_answer, generate_final_report
 from database.db_functions import (
     get_test_answers, 
     get_theory_for_block, 
     save_ai_analysis, 
     update_test_attempt_status,
-    update_user_progress,
-    get_content_block
+    complete_test_attempt,
+    enqueue_grading_job,
+    get_appeal_context,
+    resolve_answer_appeal,
+    fail_answer_appeal
 )
-from database.models import TestStatus
+from database.models import TestStatus, JobType
 from utils.keyboards import get_test_feedback_keyboard
+from utils.message_editor import message_editor
+from utils.rendering import paginate, escape, content
 
 logger = logging.getLogger(__name__)
 
+# Сигнал локальным воркерам о появлении новой задачи в очереди
+_new_job_event = asyncio.Event()
+
+def get_appealable_answers(analysis_results: List[Dict]) -> List[Tuple[int, int]]:
+    """Номера и id ответов с недостаточным вердиктом, которые можно оспорить"""
+    return [
+        (number, result["answer_id"])
+        for number, result in enumerate(analysis_results, 1)
+        if not result["is_sufficient"] and result.get("answer_id")
+    ]
+
 async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
     """Фоновая задача для анализа ответов ИИ и уведомления пользователя"""
     try:
@@ -48,11 +65,10 @@ async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
         
         for i, answer in enumerate(answers):
             try:
-                # Обновляем прогресс
-                await bot.edit_message_text(
-                    f"🔍 Анализирую ваши ответы... [{i+1}/{total_questions}]",
-                    chat_id=user_id,
-                    message_id=progress_message.message_id
+                # Обновляем прогресс (частые правки объединяются)
+                await message_editor.update(
+                    bot, user_id, progress_message.message_id,
+                    f"🔍 Анализирую ваши ответы... [{i+1}/{total_questions}]"
                 )
                 
                 # Анализируем ответ через ИИ
@@ -73,6 +89,7 @@ async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
                     )
                     
                     analysis_results.append({
+                        "answer_id": answer["answer_id"],
                         "question_text": answer["question_text"],
                         "user_answer_text": answer["user_answer_text"],
                         "is_sufficient": is_sufficient,
@@ -89,6 +106,7 @@ async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
                     )
                     
                     analysis_results.append({
+                        "answer_id": answer["answer_id"],
                         "question_text": answer["question_text"],
                         "user_answer_text": answer["user_answer_text"],
                         "is_sufficient": False,
@@ -97,13 +115,11 @@ async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
                     
                     logger.warning(f"⚠️ Анализ ответа {i+1}/{total_questions} не удался")
                 
-                # Небольшая задержка чтобы не перегружать API
-                await asyncio.sleep(1)
-                
             except Exception as e:
                 logger.error(f"❌ Ошибка анализа ответа {i+1}: {e}")
                 # Продолжаем с базовой рекомендацией
                 analysis_results.append({
+                    "answer_id": answer["answer_id"],
                     "question_text": answer["question_text"],
                     "user_answer_text": answer["user_answer_text"],
                     "is_sufficient": False,
@@ -113,28 +129,29 @@ async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
         # Генерируем итоговый отчет
         final_report = await generate_final_report(analysis_results)
         
-        # Обновляем сообщение с итоговым отчетом
-        await bot.edit_message_text(
-            final_report,
-            chat_id=user_id,
-            message_id=progress_message.message_id,
-            reply_markup=get_test_feedback_keyboard(attempt_id),
-            parse_mode="Markdown"
+        # Первая страница отчета заменяет сообщение прогресса, остальные отправляются следом;
+        # клавиатура оценки — под последней страницей
+        pages = paginate(final_report)
+        keyboard = get_test_feedback_keyboard(attempt_id, get_appealable_answers(analysis_results))
+        first_page, first_parse_mode = pages[0]
+        await message_editor.update(
+            bot, user_id, progress_message.message_id,
+            first_page,
+            reply_markup=keyboard if len(pages) == 1 else None,
+            parse_mode=first_parse_mode,
+            final=True
         )
+        for number, (page, parse_mode) in enumerate(pages[1:], 2):
+            await bot.send_message(
+                user_id, page,
+                reply_markup=keyboard if number == len(pages) else None,
+                parse_mode=parse_mode
+            )
         
-        # Обновляем статус попытки на "завершен"
-        await update_test_attempt_status(attempt_id, TestStatus.COMPLETED)
-        
-        # Обновляем прогресс пользователя если тест пройден успешно
-        block = await get_content_block(block_id)
-        if block:
-            sufficient_count = sum(1 for result in analysis_results if result["is_sufficient"])
-            success_rate = sufficient_count / total_questions if total_questions > 0 else 0
-            
-            # Считаем тест пройденным если >= 70% правильных ответов
-            if success_rate >= 0.7:
-                await update_user_progress(user_id, block["block_order"])
-                logger.info(f"✅ Пользователь {user_id} успешно прошел блок {block['block_order']}")
+        # Завершаем попытку и обновляем итоги и прогресс пользователя (одной транзакцией)
+        result = await complete_test_attempt(attempt_id, final_report)
+        if result and result["passed"]:
+            logger.info(f"✅ Пользователь {user_id} успешно прошел блок {result['block_order']}")
         
         logger.info(f"✅ Анализ теста для attempt_id {attempt_id} завершен успешно")
         
@@ -155,20 +172,97 @@ async def run_ai_analysis_and_notify(bot: Bot, user_id: int, attempt_id: int):
         except Exception as notify_error:
             logger.error(f"❌ Ошибка отправки уведомления об ошибке: {notify_error}")
 
-def create_background_task(bot: Bot, user_id: int, attempt_id: int):
-    """Создать фоновую задачу для анализа"""
-    task = asyncio.create_task(
-        run_ai_analysis_and_notify(bot, user_id, attempt_id)
+async def schedule_ai_analysis(user_id: int, attempt_id: int) -> Optional[int]:
+    """Поставить попытку в очередь на анализ ИИ"""
+    # Попытка перестает быть активной сразу, а не когда воркер возьмет ее в работу
+    await update_test_attempt_status(attempt_id, TestStatus.ANALYZING)
+    job_id = await enqueue_grading_job(user_id, attempt_id)
+    if job_id:
+        logger.info(f"📥 Попытка {attempt_id} поставлена в очередь проверки (задача {job_id})")
+        # Будим локальных воркеров, чтобы не ждать следующего опроса очереди
+        _new_job_event.set()
+    else:
+        logger.warning(f"⚠️ Попытка {attempt_id} уже находится в очереди проверки")
+    return job_id
+
+async def schedule_appeal(user_id: int, attempt_id: int, answer_id: int) -> Optional[int]:
+    """Поставить апелляцию в очередь с повышенным приоритетом"""
+    job_id = await enqueue_grading_job(
+        user_id, attempt_id,
+        job_type=JobType.APPEAL,
+        priority=config.APPEAL_JOB_PRIORITY,
+        answer_id=answer_id
     )
+    if job_id:
+        logger.info(f"⚖️ Апелляция на ответ {answer_id} поставлена в очередь (задача {job_id})")
+        _new_job_event.set()
+    return job_id
+
+async def run_appeal_and_notify(bot: Bot, user_id: int, answer_id: int):
+    """Перепроверить оспоренный ответ сильной моделью и сообщить студенту результат"""
+    resolved = False
+    try:
+        context = await get_appeal_context(answer_id)
+        if not context:
+            logger.error(f"Не найден ответ {answer_id} для апелляции")
+            await fail_answer_appeal(answer_id)
+            return
+        
+        analysis_result = await analyze_answer(
+            theory_text=context["theory_text"],
+            question_text=context["question_text"],
+            user_answer_text=context["user_answer_text"],
+            use_fallback=False,
+            strong_only=True
+        )
+        
+        if analysis_result is None:
+            await fail_answer_appeal(answer_id)
+            resolved = True
+            text = "😔 Не удалось перепроверить ответ по апелляции. Попробуйте позже."
+        else:
+            is_sufficient, recommendation = analysis_result
+            outcome = await resolve_answer_appeal(answer_id, is_sufficient, recommendation)
+            resolved = True
+            logger.info(f"⚖️ Апелляция на ответ {answer_id}: {'удовлетворена' if is_sufficient else 'отклонена'}")
+            
+            if is_sufficient:
+                text = (
+                    f"⚖️ **Апелляция удовлетворена**\n\n"
+                    f"Вопрос: {content(context['question_text'])}\n\n"
+                    f"✅ Ответ признан достаточным.\n"
+                    f"📈 Результат теста: {outcome['sufficient']}/{outcome['total']}"
+                )
+                if outcome["newly_passed"]:
+                    text += f"\n\n🎉 Блок «{content(context['block_title'])}» теперь пройден!"
+            else:
+                text = (
+                    f"⚖️ **Апелляция отклонена**\n\n"
+                    f"Вопрос: {content(context['question_text'])}\n\n"
+                    f"💡 {escape(recommendation)}"
+                )
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки апелляции на ответ {answer_id}: {e}")
+        # Решение по апелляции уже сохранено — вердикт и результат теста остаются в силе
+        if not resolved:
+            try:
+                await fail_answer_appeal(answer_id)
+            except Exception as e:
+                logger.error(f"❌ Не удалось отметить апелляцию на ответ {answer_id} неудавшейся: {e}")
+        return
     
-    # Добавляем обработку исключений в задачу
-    def handle_task_exception(task):
-        try:
-            exception = task.exception()
-            if exception:
-                logger.error(f"❌ Необработанная ошибка в фоновой задаче: {exception}")
-        except asyncio.InvalidStateError:
-            pass  # Задача еще выполняется
-    
-    task.add_done_callback(handle_task_exception)
-    return task
\ No newline at end of file
+    # Ошибка уведомления (например, студент заблокировал бота) не меняет решения
+    try:
+        await bot.send_message(user_id, text, parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"❌ Не удалось отправить результат апелляции на ответ {answer_id}: {e}")
+
+async def wait_for_new_job(timeout: float):
+    """Дождаться постановки новой задачи в этом процессе или истечения таймаута"""
+    try:
+        await asyncio.wait_for(_new_job_event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        _new_job_event.clear()
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Dict
+from aiogram import Bot
+import config
+from ai.ai_processor import close_openai_client
+from ai.background_tasks import run_ai_analysis_and_notify, run_appeal_and_notify, wait_for_new_job
+from database.db_functions import (
+    claim_grading_job,
+    finish_grading_job,
+    requeue_grading_job,
+    requeue_stale_grading_jobs
+)
+from database.models import JobType
+from utils.task_registry import task_registry, ShutdownInProgress
+from utils.bot_factory import create_bot
+from middleware.send_scheduler import background_priority
+
+logger = logging.getLogger(__name__)
+
+class GradingWorker:
+    """Воркер, забирающий задачи проверки ответов из очереди в БД"""
+    
+    def __init__(self, bot: Bot, worker_id: str, concurrency: int = 1):
+        self.bot = bot
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.running = False
+        self.task = None
+    
+    def start(self) -> asyncio.Task:
+        """Запустить воркер фоновой задачей в текущем event loop"""
+        self.task = asyncio.create_task(self.run())
+        return self.task
+    
+    async def run(self):
+        """Запустить обработку очереди (до вызова stop)"""
+        self.running = True
+        logger.info(f"⚙️ Воркер {self.worker_id} запущен (параллельных проверок: {self.concurrency})")
+        await asyncio.gather(*(self._consume(slot) for slot in range(self.concurrency)))
+        logger.info(f"⚙️ Воркер {self.worker_id} остановлен")
+    
+    def stop(self):
+        """Перестать брать новые задачи (текущие проверки дожидается task_registry.drain)"""
+        self.running = False
+    
+    async def wait_stopped(self):
+        """Дождаться выхода всех слотов воркера"""
+        if self.task:
+            await asyncio.gather(self.task, return_exceptions=True)
+    
+    async def _consume(self, slot: int):
+        """Цикл одного слота: взять задачу, выполнить, повторить"""
+        consumer_id = f"{self.worker_id}/{slot}"
+        while self.running and task_registry.accepting:
+            try:
+                job = await claim_grading_job(consumer_id)
+            except Exception as e:
+                logger.error(f"❌ Воркер {consumer_id} не смог получить задачу: {e}")
+                job = None
+            
+            if not job:
+                await wait_for_new_job(config.GRADING_POLL_INTERVAL)
+                continue
+            
+            try:
+                task = task_registry.spawn(
+                    self._process(job),
+                    kind="grading",
+                    checkpoint=lambda job_id=job["job_id"]: requeue_grading_job(job_id)
+                )
+            except ShutdownInProgress:
+                # Остановка началась между получением задачи и ее запуском
+                await requeue_grading_job(job["job_id"])
+                break
+            
+            # wait не пробрасывает отмену задачи при остановке — слот просто выходит из цикла
+            await asyncio.wait({task})
+    
+    async def _process(self, job: Dict):
+        """Выполнить одну задачу проверки"""
+        # Прогресс и результаты проверки уступают очередь интерактивным ответам
+        try:
+            with background_priority():
+                if job["job_type"] == JobType.APPEAL:
+                    logger.info(f"🔧 Задача {job['job_id']}: апелляция на ответ {job['answer_id']}")
+                    await run_appeal_and_notify(self.bot, job["user_id"], job["answer_id"])
+                else:
+                    logger.info(f"🔧 Задача {job['job_id']}: проверка попытки {job['attempt_id']}")
+                    await run_ai_analysis_and_notify(self.bot, job["user_id"], job["attempt_id"])
+        except Exception as e:
+            # Задачу все равно закрываем: зависшая в running блокирует повторную постановку
+            logger.error(f"❌ Ошибка задачи проверки {job['job_id']}: {e}")
+        # При отмене (остановка процесса) задача не закрывается: ее вернет в очередь checkpoint
+        await finish_grading_job(job["job_id"])
+
+async def start_local_worker(bot: Bot) -> GradingWorker:
+    """Запустить проверку ответов внутри процесса бота (режим GRADING_WORKERS = 0)"""
+    # Других потребителей очереди нет, значит все задачи в статусе running осиротели
+    requeued = await requeue_stale_grading_jobs()
+    if requeued:
+        logger.info(f"♻️ Возвращено в очередь незавершенных задач: {requeued}")
+    
+    worker = GradingWorker(bot, f"bot-{os.getpid()}", config.GRADING_CONCURRENCY)
+    worker.start()
+    return worker
+
+async def stop_worker_gracefully(worker: GradingWorker):
+    """Остановить воркер: не брать новые задачи, дождаться текущих, недоделанные вернуть в очередь"""
+    task_registry.stop_accepting()
+    worker.stop()
+    await task_registry.drain(config.SHUTDOWN_DRAIN_TIMEOUT)
+    await worker.wait_stopped()
+
+async def _worker_main(worker_index: int):
+    """Основной цикл отдельного процесса-воркера"""
+    bot = create_bot()
+    worker = GradingWorker(bot, f"worker-{worker_index}-{os.getpid()}", config.GRADING_CONCURRENCY)
+    stop_requested = asyncio.Event()
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_requested.set)
+        except NotImplementedError:
+            pass  # Windows
+    
+    try:
+        # Задачи, зависшие у упавших воркеров, возвращаем в очередь
+        requeued = await requeue_stale_grading_jobs(config.GRADING_JOB_TIMEOUT)
+        if requeued:
+            logger.info(f"♻️ Возвращено в очередь зависших задач: {requeued}")
+        
+        worker.start()
+        await stop_requested.wait()
+        logger.info(f"Воркер {worker.worker_id} получил сигнал остановки")
+        await stop_worker_gracefully(worker)
+    finally:
+        await close_openai_client()
+        await bot.session.close()
+
+def run_worker_process(worker_index: int):
+    """Точка входа процесса-воркера (запускается из run.py)"""
+    try:
+        asyncio.run(_worker_main(worker_index))
+    except KeyboardInterrupt:
+        pass
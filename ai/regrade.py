@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+import config
+from ai.ai_processor import analyze_answer, load_prompt_template, get_prompt_fingerprint
+from database.db_functions import (
+    init_database,
+    create_regrade_run,
+    get_regrade_run,
+    get_answers_for_regrade,
+    get_failed_regrade_answers,
+    save_regrade_chunk,
+    save_regrade_retry,
+    recount_regrade_failures,
+    complete_regrade_run,
+    get_regrade_agreement,
+    get_theory_for_block
+)
+from database.models import RegradeStatus
+
+logger = logging.getLogger(__name__)
+
+async def start_or_resume_regrade() -> int:
+    """Вернуть id незавершенного прогона или создать новый"""
+    last_run = await get_regrade_run()
+    if last_run and last_run["status"] == RegradeStatus.RUNNING:
+        logger.info(f"♻️ Продолжаем прогон перепроверки #{last_run['run_id']}")
+        return last_run["run_id"]
+
+    template = await load_prompt_template()
+    model = f"{config.OPENAI_MODEL} → {config.OPENAI_STRONG_MODEL}"
+    run_id = await create_regrade_run(model, get_prompt_fingerprint(template))
+    logger.info(f"♻️ Создан прогон перепроверки #{run_id}")
+    return run_id
+
+async def run_regrade(
+    run_id: int,
+    chunk_size: int = config.REGRADE_CHUNK_SIZE,
+    concurrency: int = config.REGRADE_CONCURRENCY,
+    on_progress: Optional[Callable[[Dict], Awaitable[None]]] = None
+) -> Dict:
+    """Перепроверить ответы прогона порциями, начиная с контрольной точки
+
+    Каждая порция сохраняется вместе с контрольной точкой одной транзакцией,
+    поэтому прерванный прогон продолжается с первой несохраненной порции.
+    Ответы, которые не удалось проверить (например, из-за временной ошибки API),
+    проверяются повторно в конце прохода. Если ошибки остались, прогон не
+    завершается: следующий запуск продолжит его и снова попробует эти ответы.
+    """
+    run = await get_regrade_run(run_id)
+    if not run:
+        raise ValueError(f"Прогон перепроверки #{run_id} не найден")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    theory_cache: Dict[int, str] = {}
+    last_answer_id = run["last_answer_id"]
+
+    async def grade(answer: Dict) -> Optional[Dict]:
+        async with semaphore:
+            theory_text = theory_cache.get(answer["block_id"])
+            if theory_text is None:
+                theory_text = await get_theory_for_block(answer["block_id"]) or ""
+                theory_cache[answer["block_id"]] = theory_text
+
+            result = await analyze_answer(
+                theory_text=theory_text,
+                question_text=answer["question_text"],
+                user_answer_text=answer["user_answer_text"],
+                use_fallback=False
+            )
+            if result is None:
+                return None
+
+            is_sufficient, recommendation = result
+            return {
+                "answer_id": answer["answer_id"],
+                "old_is_sufficient": answer["old_is_sufficient"],
+                "new_is_sufficient": bool(is_sufficient),
+                "recommendation": recommendation
+            }
+
+    while True:
+        answers = await get_answers_for_regrade(last_answer_id, chunk_size)
+        if not answers:
+            break
+
+        chunk_started = time.monotonic()
+        graded = await asyncio.gather(*(grade(answer) for answer in answers))
+        results = [result for result in graded if result is not None]
+        last_answer_id = answers[-1]["answer_id"]
+
+        await save_regrade_chunk(
+            run_id, results, last_answer_id,
+            failed=len(answers) - len(results),
+            elapsed_seconds=time.monotonic() - chunk_started
+        )
+
+        if on_progress:
+            await on_progress(await get_regrade_report(run_id))
+
+    # Повторный проход по ответам, пропущенным из-за ошибок
+    retry_after = 0
+    while True:
+        answers = await get_failed_regrade_answers(run_id, retry_after, last_answer_id, chunk_size)
+        if not answers:
+            break
+
+        chunk_started = time.monotonic()
+        graded = await asyncio.gather(*(grade(answer) for answer in answers))
+        results = [result for result in graded if result is not None]
+        retry_after = answers[-1]["answer_id"]
+        await save_regrade_retry(run_id, results, elapsed_seconds=time.monotonic() - chunk_started)
+
+    failed = await recount_regrade_failures(run_id, last_answer_id)
+    if failed:
+        logger.warning(f"⚠️ Прогон перепроверки #{run_id}: не проверено ответов {failed}, прогон остается незавершенным")
+        return await get_regrade_report(run_id)
+
+    await complete_regrade_run(run_id)
+    report = await get_regrade_report(run_id)
+    logger.info(f"✅ Прогон перепроверки #{run_id} завершен: {report}")
+    return report
+
+async def get_regrade_report(run_id: Optional[int] = None) -> Optional[Dict]:
+    """Состояние прогона вместе со сравнением с прежними вердиктами"""
+    run = await get_regrade_run(run_id)
+    if not run:
+        return None
+
+    report = dict(run)
+    report.update(await get_regrade_agreement(run["run_id"]))
+    report["throughput_per_min"] = (
+        run["processed"] / run["elapsed_seconds"] * 60 if run["elapsed_seconds"] > 0 else 0
+    )
+    return report
+
+def format_regrade_report(report: Dict) -> str:
+    """Текст отчета о перепроверке"""
+    status = "✅ завершен" if report["status"] == RegradeStatus.COMPLETED else "⏳ выполняется"
+    return (
+        f"♻️ **Перепроверка #{report['run_id']}** — {status}\n\n"
+        f"🤖 Модель: {report['model']}, промпт: `{report['prompt_hash']}`\n"
+        f"📊 Обработано: {report['processed']}/{report['total_answers']}"
+        f" (ошибок: {report['failed']})\n"
+        f"🤝 Совпадение с прежними вердиктами: {report['agreement_rate']:.1f}%"
+        f" ({report['agreed']}/{report['compared']})\n"
+        f"⬆️ Стали достаточными: {report['became_sufficient']}\n"
+        f"⬇️ Стали недостаточными: {report['became_insufficient']}\n"
+        f"🚀 Скорость: {report['throughput_per_min']:.0f} ответов/мин"
+        + ("\n\n⚠️ Ответы с ошибками проверяются повторно в конце прогона и при следующем /regrade"
+           if report["failed"] and report["status"] != RegradeStatus.COMPLETED else "")
+    )
+
+async def _cli(args: argparse.Namespace):
+    """Запуск перепроверки из командной строки"""
+    await init_database()
+    run_id = args.resume or await start_or_resume_regrade()
+
+    async def print_progress(report: Dict):
+        print(f"#{report['run_id']}: {report['processed']}/{report['total_answers']}, "
+              f"совпадение {report['agreement_rate']:.1f}%, "
+              f"{report['throughput_per_min']:.0f} ответов/мин")
+
+    report = await run_regrade(run_id, args.chunk_size, args.concurrency, print_progress)
+    print(format_regrade_report(report).replace("**", "").replace("`", ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая перепроверка сохраненных ответов")
+    parser.add_argument("--resume", type=int, help="id прогона для продолжения (по умолчанию — последний незавершенный)")
+    parser.add_argument("--chunk-size", type=int, default=config.REGRADE_CHUNK_SIZE)
+    parser.add_argument("--concurrency", type=int, default=config.REGRADE_CONCURRENCY)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_cli(parser.parse_args()))
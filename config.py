@@ -9,6 +9,39 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных окружения!")
 
+# Режим получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE} (ожидается polling или webhook)")
+
+# Настройки webhook (TLS завершается на внешнем прокси, бот слушает локальный порт)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # Публичный https-адрес без пути
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Адрес Bot API (например, локальная заглушка для нагрузочного теста); пусто — api.telegram.org
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "")
+
+# Лимиты исходящих сообщений Telegram
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # Сообщений в секунду на все процессы
+TELEGRAM_CHAT_RATE = 1.0  # Сообщений в секунду в личный чат
+TELEGRAM_CHAT_BURST = 3  # Сколько сообщений подряд можно отправить в личный чат без ожидания
+TELEGRAM_GROUP_RATE = 20 / 60  # Сообщений в секунду в группу
+TELEGRAM_MAX_RETRIES = 3  # Повторов запроса после TelegramRetryAfter
+TELEGRAM_TRACKED_CHATS = 10000  # После этого числа чатов неактивные лимитеры забываются
+
+# Правки сообщений
+EDIT_DEBOUNCE_SECONDS = 1.0  # Правки прогресса одного сообщения не чаще раза в столько секунд
+EDIT_TRACKED_MESSAGES = 5000  # Сколько сообщений помнить для пропуска повторных правок
+CALLBACK_ACK_GRACE = 0.1  # Через сколько секунд подтверждать нажатие кнопки (обработчики с флагом early_answer), если обработчик еще не ответил
+CALLBACK_ANSWERS_TRACKED = 10000  # Сколько ответов на callback помнить для отсечения повторных
+CALLBACK_DEDUP_WINDOW = 1.0  # Повторное нажатие той же кнопки в течение стольких секунд после обработки игнорируется
+RENDER_CACHE_SIZE = 2000  # Сколько отрисованных экранов (текст + клавиатура) держать в памяти
+CONTENT_VERSION_TTL = 5.0  # Как часто перечитывать версию контента из БД (изменения из других процессов)
+
 # OpenAI Settings
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
@@ -26,12 +59,57 @@ ADMINS = [
 ALL_ADMINS = list(set(SUPER_ADMINS + ADMINS))
 
 # Настройки базы данных
-DATABASE_PATH = "bot.db"
+DATABASE_PATH = os.getenv("DATABASE_PATH", "bot.db")
+
+# Состояния FSM хранятся в отдельном файле, чтобы частые записи не мешали основной БД
+FSM_DATABASE_PATH = os.getenv("FSM_DATABASE_PATH", "fsm.db")
+FSM_FLUSH_INTERVAL = 1.0  # Изменения состояний пишутся в БД пачкой раз в столько секунд
+FSM_HOT_ENTRIES = 10000  # Сколько состояний держать в памяти
+FSM_STATE_TTL = 7 * 24 * 3600  # Состояния, не менявшиеся дольше (секунд), удаляются
+
+USER_CACHE_SIZE = 10000  # Сколько пользователей держать в кэше профилей
+USER_CACHE_TTL = 30.0  # Через сколько секунд перечитывать пользователя (прогресс могут изменить воркеры)
 
 # Настройки OpenAI
-OPENAI_MODEL = "gpt-4o-mini"  # Более новая и дешевая модель
+# Проверка идет в два уровня: быстрая модель оценивает все ответы и сообщает уверенность,
+# неуверенные и пограничные ответы перепроверяет сильная модель
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # Быстрая и дешевая модель
+OPENAI_STRONG_MODEL = os.getenv("OPENAI_STRONG_MODEL", "gpt-4o")
 OPENAI_TEMPERATURE = 0.3
+OPENAI_FAST_MAX_TOKENS = 300
 OPENAI_MAX_TOKENS = 1000
+GRADING_ESCALATION_CONFIDENCE = 0.75  # Вердикты с меньшей уверенностью уходят сильной модели
+# Цены моделей в $ за 1М токенов (вход, выход) — для оценки стоимости в аналитике
+OPENAI_MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+OPENAI_RATE_LIMIT = int(os.getenv("OPENAI_RATE_LIMIT", "5"))  # Запросов в секунду на процесс
+
+# Массовая перепроверка ответов
+REGRADE_CHUNK_SIZE = 200  # Ответов, читаемых из БД и сохраняемых за одну транзакцию
+REGRADE_CONCURRENCY = 16  # Одновременных запросов (фактическую скорость ограничивает OPENAI_RATE_LIMIT)
+
+# Рассылки
+BROADCAST_CHUNK_SIZE = 200  # Получателей, читаемых из БД и сохраняемых за одну транзакцию
+BROADCAST_CONCURRENCY = 10  # Одновременных отправок (фактическую скорость ограничивает TELEGRAM_GLOBAL_RATE)
+
+# Импорт и экспорт контента (content_tool.py, /import_content, /export_content)
+CONTENT_IO_BATCH_SIZE = 100  # Блоков, читаемых из БД или сохраняемых за одну транзакцию
+
+# Настройки проверки ответов
+# 0 — проверка идет внутри процесса бота; N > 0 — run.py запускает N отдельных процессов-воркеров,
+# а процесс бота только ставит задачи в очередь (таблица grading_jobs)
+GRADING_WORKERS = int(os.getenv("GRADING_WORKERS", "0"))
+GRADING_CONCURRENCY = int(os.getenv("GRADING_CONCURRENCY", "4"))  # Одновременных проверок на процесс
+GRADING_POLL_INTERVAL = 1.0  # Секунд между опросами пустой очереди
+GRADING_JOB_TIMEOUT = 900  # Через сколько секунд задача в статусе running считается зависшей
+APPEAL_JOB_PRIORITY = 10  # Апелляции обгоняют обычные проверки в очереди
+TEST_PASS_RATE = 0.7  # Доля достаточных ответов, при которой блок считается пройденным
+
+# Сколько секунд при остановке ждать завершения фоновых задач;
+# не успевшие задачи проверки возвращаются в очередь и продолжаются после перезапуска
+SHUTDOWN_DRAIN_TIMEOUT = int(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
 
 # Настройки пагинации
 USERS_PER_PAGE = 10
@@ -0,0 +1,44 @@
+"""Импорт и экспорт контента курса в JSONL/CSV
+
+    python content_tool.py export course.jsonl
+    python content_tool.py import course.csv
+    python content_tool.py import course.jsonl --dry-run
+
+Работает с базой из DATABASE_PATH (нужны те же переменные окружения, что и боту).
+Формат определяется по расширению файла, описание форматов — в utils/content_io.py.
+Запускать можно при работающем боте: запись идет короткими транзакциями,
+а бот увидит изменения по версии контента.
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import config
+from database.db_functions import init_database
+from utils.content_io import FORMATS, import_content, export_content, format_content_io_report
+
+async def run(args: argparse.Namespace) -> int:
+    await init_database()
+    try:
+        if args.command == "export":
+            report = await export_content(args.path, args.format, args.batch_size)
+        else:
+            report = await import_content(args.path, args.format, args.batch_size, dry_run=args.dry_run)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    print(format_content_io_report(report))
+    return 1 if report.get("skipped") else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт и экспорт блоков теории и вопросов")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("path", help="Файл .jsonl или .csv")
+    parser.add_argument("--format", choices=FORMATS, help="Формат, если расширение файла другое")
+    parser.add_argument("--batch-size", type=int, default=config.CONTENT_IO_BATCH_SIZE, help="Блоков за одну транзакцию")
+    parser.add_argument("--dry-run", action="store_true", help="Только проверить файл импорта, ничего не записывая")
+    sys.exit(asyncio.run(run(parser.parse_args())))
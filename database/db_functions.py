@@ -1,9 +1,18 @@
 import aiosqlite
 import logging
+import re
 from typing import List, Dict, Optional, Tuple, Any
 from datetime import datetime
-from database.models import CREATE_TABLES_SQL, CREATE_INDEXES_SQL, SAMPLE_DATA_SQL, TestStatus
+from database.models import (
+    CREATE_TABLES_SQL, CREATE_INDEXES_SQL, SAMPLE_DATA_SQL, COLUMN_MIGRATIONS, BACKFILL_BLOCK_PROGRESS_SQL,
+    ABANDON_EXTRA_ATTEMPTS_SQL,
+    BACKFILL_ATTEMPT_SCORES_SQL, CREATE_SEARCH_SQL, SNIPPET_START, SNIPPET_END,
+    TestStatus, JobStatus, JobType, RegradeStatus, AppealStatus, BroadcastStatus
+)
 import config
+from database.single_flight import single_flight
+from database.user_cache import user_sessions
+from utils.rendering import build_theory_pages, format_final_report
 
 logger = logging.getLogger(__name__)
 
@@ -11,9 +20,26 @@ async def init_database():
     """Инициализация базы данных"""
     try:
         async with aiosqlite.connect(config.DATABASE_PATH) as db:
+            # WAL позволяет боту и процессам-воркерам читать и писать одновременно
+            await db.execute("PRAGMA journal_mode=WAL")
+            
             # Создаем таблицы
             await db.executescript(CREATE_TABLES_SQL)
+            await apply_column_migrations(db)
+            
+            # Уникальный индекс активных попыток не создастся, пока у кого-то их несколько
+            cursor = await db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_test_attempts_one_active'"
+            )
+            if await cursor.fetchone() is None:
+                cursor = await db.execute(ABANDON_EXTRA_ATTEMPTS_SQL)
+                if cursor.rowcount > 0:
+                    logger.info(f"Миграция: отменены лишние незавершенные попытки ({cursor.rowcount})")
             await db.executescript(CREATE_INDEXES_SQL)
+            try:
+                await db.executescript(CREATE_SEARCH_SQL)
+            except aiosqlite.OperationalError as e:
+                logger.warning(f"FTS5 недоступен, поиск будет работать без индекса: {e}")
             
             # Добавляем тестовые данные (только если таблицы пустые)
             cursor = await db.execute("SELECT COUNT(*) FROM content_blocks")
@@ -21,59 +47,246 @@ async def init_database():
             if count == 0:
                 await db.executescript(SAMPLE_DATA_SQL)
             
+            # Вопросы без порядка (созданные до появления question_order) идут в порядке добавления
+            await db.execute("UPDATE questions SET question_order = id WHERE question_order = 0")
+            
+            # Разбиваем на страницы блоки, для которых страниц еще нет
+            cursor = await db.execute(
+                "SELECT id FROM content_blocks WHERE id NOT IN (SELECT DISTINCT block_id FROM content_pages)"
+            )
+            for (block_id,) in await cursor.fetchall():
+                await rebuild_content_pages(db, block_id)
+            
+            # Поисковые индексы строятся один раз для существующих контента и пользователей
+            if await has_search_index(db):
+                cursor = await db.execute("SELECT COUNT(*) FROM content_search")
+                if (await cursor.fetchone())[0] == 0:
+                    cursor = await db.execute("SELECT id FROM content_blocks")
+                    for (block_id,) in await cursor.fetchall():
+                        await reindex_block_search(db, block_id)
+            if await has_search_index(db, "users_search"):
+                cursor = await db.execute("SELECT COUNT(*) FROM users_search")
+                if (await cursor.fetchone())[0] == 0:
+                    await db.execute("""
+                        INSERT INTO users_search (rowid, full_name, username)
+                        SELECT user_id, full_name, IFNULL(username, '') FROM users
+                    """)
+            
+            # Итоги по блокам для попыток, завершенных до появления user_block_progress
+            cursor = await db.execute("SELECT COUNT(*) FROM user_block_progress")
+            if (await cursor.fetchone())[0] == 0:
+                cursor = await db.execute(BACKFILL_BLOCK_PROGRESS_SQL, (config.TEST_PASS_RATE,))
+                if cursor.rowcount > 0:
+                    logger.info(f"Миграция: заполнены итоги по блокам ({cursor.rowcount})")
+            cursor = await db.execute(BACKFILL_ATTEMPT_SCORES_SQL)
+            if cursor.rowcount > 0:
+                logger.info(f"Миграция: посчитаны результаты попыток ({cursor.rowcount})")
+            
             await db.commit()
             logger.info("База данных успешно инициализирована")
     except Exception as e:
         logger.error(f"Ошибка инициализации БД: {e}")
         raise
 
+async def apply_column_migrations(db: aiosqlite.Connection):
+    """Добавить в существующие таблицы колонки, появившиеся в новых версиях"""
+    for table, column, definition in COLUMN_MIGRATIONS:
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in await cursor.fetchall()}
+        if column not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"Миграция: добавлена колонка {table}.{column}")
+
 # === ФУНКЦИИ ДЛЯ РАБОТЫ С ПОЛЬЗОВАТЕЛЯМИ ===
 
-async def get_or_create_user(user_id: int, username: str = None, full_name: str = "") -> Dict:
-    """Получить или создать пользователя"""
+async def get_or_create_user(user_id: int, username: str = None, full_name: str = "",
+                             fresh: bool = False) -> Dict:
+    """Получить или создать пользователя (запись в БД — только если профиль изменился)
+    
+    fresh — прочитать прогресс из БД мимо кэша: его могли изменить процессы-воркеры проверки.
+    """
+    cached = None if fresh else user_sessions.get(user_id)
+    if cached and cached["username"] == username and cached["full_name"] == full_name:
+        return cached
+    
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
-        # Проверяем, существует ли пользователь
         cursor = await db.execute(
-            "SELECT user_id, username, full_name, last_completed_block_order FROM users WHERE user_id = ?",
+            "SELECT username, full_name, last_completed_block_order, is_blocked FROM users WHERE user_id = ?",
             (user_id,)
         )
-        user = await cursor.fetchone()
+        row = await cursor.fetchone()
         
-        if user:
-            # Обновляем данные пользователя
-            await db.execute(
-                "UPDATE users SET username = ?, full_name = ? WHERE user_id = ?",
-                (username, full_name, user_id)
-            )
+        # Раз пользователь пишет боту, значит не заблокировал его
+        if row is None or (row[0], row[1], row[3]) != (username, full_name, 0):
+            await db.execute("""
+                INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    username = excluded.username, full_name = excluded.full_name, is_blocked = 0
+            """, (user_id, username, full_name))
+            await index_user_search(db, user_id, username, full_name)
             await db.commit()
-            return {
-                "user_id": user[0],
-                "username": user[1],
-                "full_name": user[2],
-                "last_completed_block_order": user[3]
+        
+        user = {
+            "user_id": user_id,
+            "username": username,
+            "full_name": full_name,
+            "last_completed_block_order": row[2] if row else 0
+        }
+        user_sessions.put(user)
+        return user
+
+async def record_block_result(db: aiosqlite.Connection, user_id: int, block_id: int, attempt_id: int,
+                              score: float, passed: bool, new_attempt: bool = True):
+    """Учесть результат попытки в итогах пользователя по блоку (в транзакции проверки)
+    
+    Для апелляции (new_attempt=False) число попыток и время последней не меняются.
+    """
+    await db.execute("""
+        INSERT INTO user_block_progress
+            (user_id, block_id, best_score, attempts, last_attempt_id, last_attempt_at, passed)
+        VALUES (?, ?, ?, 1, ?, CURRENT_TIMESTAMP, ?)
+        ON CONFLICT(user_id, block_id) DO UPDATE SET
+            best_score = MAX(best_score, excluded.best_score),
+            attempts = attempts + ?,
+            last_attempt_id = CASE WHEN ? THEN excluded.last_attempt_id ELSE last_attempt_id END,
+            last_attempt_at = CASE WHEN ? THEN excluded.last_attempt_at ELSE last_attempt_at END,
+            passed = MAX(passed, excluded.passed)
+    """, (user_id, block_id, score, attempt_id, passed, int(new_attempt), new_attempt, new_attempt))
+
+async def get_user_block_progress(user_id: int) -> Dict[int, Dict]:
+    """Итоги пользователя по блокам: block_id -> лучший результат, число попыток, пройден ли"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT block_id, best_score, attempts, last_attempt_id, last_attempt_at, passed
+            FROM user_block_progress WHERE user_id = ?
+        """, (user_id,))
+        return {
+            row[0]: {
+                "best_score": row[1],
+                "attempts": row[2],
+                "last_attempt_id": row[3],
+                "last_attempt_at": row[4],
+                "passed": bool(row[5])
             }
+            for row in await cursor.fetchall()
+        }
+
+async def index_user_search(db: aiosqlite.Connection, user_id: int, username: Optional[str], full_name: str):
+    """Обновить пользователя в поисковом индексе (в транзакции изменения профиля)"""
+    if not await has_search_index(db, "users_search"):
+        return
+    await db.execute("DELETE FROM users_search WHERE rowid = ?", (user_id,))
+    await db.execute(
+        "INSERT INTO users_search (rowid, full_name, username) VALUES (?, ?, ?)",
+        (user_id, full_name, username or "")
+    )
+
+async def search_users(query: str, limit: int = 10) -> List[Dict]:
+    """Найти пользователей: по user_id точно, по username и имени — по началу или любой части
+    
+    Запросы короче трех символов ищутся по началу (индексы NOCASE), длиннее —
+    по триграммам в любом месте имени или username.
+    """
+    query = query.strip().lstrip("@")
+    if not query:
+        return []
+    
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        columns = "u.user_id, u.username, u.full_name, u.last_completed_block_order"
+        if query.isdigit():
+            cursor = await db.execute(f"SELECT {columns} FROM users u WHERE u.user_id = ?", (int(query),))
+        elif len(query) >= 3 and await has_search_index(db, "users_search"):
+            cursor = await db.execute(f"""
+                SELECT {columns}
+                FROM users_search JOIN users u ON u.user_id = users_search.rowid
+                WHERE users_search MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            """, ('"' + query.replace('"', '""') + '"', limit))
+        elif len(query) >= 3:
+            # Без FTS5 — перебор с ограничением числа результатов
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            cursor = await db.execute(f"""
+                SELECT {columns} FROM users u
+                WHERE u.full_name LIKE ? ESCAPE '\\' OR u.username LIKE ? ESCAPE '\\'
+                LIMIT ?
+            """, (pattern, pattern, limit))
         else:
-            # Создаем нового пользователя
-            await db.execute(
-                "INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)",
-                (user_id, username, full_name)
-            )
-            await db.commit()
-            return {
-                "user_id": user_id,
-                "username": username,
-                "full_name": full_name,
-                "last_completed_block_order": 0
+            # Диапазоны по индексам: строки, начинающиеся с query. NOCASE не различает
+            # регистр только латиницы, поэтому отдельно ищем и с заглавной буквы
+            parts, params = [], []
+            for prefix in dict.fromkeys([query, query.capitalize()]):
+                for column in ("username", "full_name"):
+                    parts.append(f"SELECT {columns} FROM users u WHERE u.{column} >= ? COLLATE NOCASE AND u.{column} < ? COLLATE NOCASE")
+                    params += [prefix, prefix + "\uffff"]
+            cursor = await db.execute(" UNION ".join(parts) + " LIMIT ?", (*params, limit))
+        
+        return [
+            {
+                "user_id": row[0],
+                "username": row[1],
+                "full_name": row[2],
+                "last_completed_block_order": row[3]
             }
+            for row in await cursor.fetchall()
+        ]
 
-async def update_user_progress(user_id: int, completed_block_order: int):
-    """Обновить прогресс пользователя"""
+async def get_user_details(user_id: int, recent: int = 5) -> Optional[Dict]:
+    """Карточка пользователя для админа: итоги по блокам, последние попытки и ответы"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
-        await db.execute(
-            "UPDATE users SET last_completed_block_order = ? WHERE user_id = ? AND last_completed_block_order < ?",
-            (completed_block_order, user_id, completed_block_order)
+        cursor = await db.execute(
+            "SELECT user_id, username, full_name, last_completed_block_order, is_blocked, created_at FROM users WHERE user_id = ?",
+            (user_id,)
         )
-        await db.commit()
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        user = {
+            "user_id": row[0],
+            "username": row[1],
+            "full_name": row[2],
+            "last_completed_block_order": row[3],
+            "is_blocked": bool(row[4]),
+            "created_at": row[5]
+        }
+        
+        cursor = await db.execute("""
+            SELECT cb.title, p.best_score, p.attempts, p.passed
+            FROM user_block_progress p JOIN content_blocks cb ON cb.id = p.block_id
+            WHERE p.user_id = ?
+            ORDER BY cb.block_order
+        """, (user_id,))
+        user["blocks"] = [
+            {"title": row[0], "best_score": row[1], "attempts": row[2], "passed": bool(row[3])}
+            for row in await cursor.fetchall()
+        ]
+        
+        cursor = await db.execute("""
+            SELECT ta.id, cb.title, ta.status, ta.attempt_timestamp, ta.score
+            FROM test_attempts ta JOIN content_blocks cb ON cb.id = ta.block_id
+            WHERE ta.user_id = ?
+            ORDER BY ta.attempt_timestamp DESC, ta.id DESC
+            LIMIT ?
+        """, (user_id, recent))
+        user["recent_attempts"] = [
+            {"attempt_id": row[0], "block_title": row[1], "status": row[2], "attempt_timestamp": row[3], "score": row[4]}
+            for row in await cursor.fetchall()
+        ]
+        
+        cursor = await db.execute("""
+            SELECT q.question_text, ua.user_answer_text, ua.ai_verdict_is_sufficient
+            FROM test_attempts ta
+            JOIN user_answers ua ON ua.attempt_id = ta.id
+            JOIN questions q ON q.id = ua.question_id
+            WHERE ta.user_id = ?
+            ORDER BY ua.id DESC
+            LIMIT ?
+        """, (user_id, recent))
+        user["recent_answers"] = [
+            {"question_text": row[0], "answer_text": row[1], "is_sufficient": row[2]}
+            for row in await cursor.fetchall()
+        ]
+        return user
 
 async def get_users_statistics(offset: int = 0, limit: int = 10) -> Tuple[List[Dict], int]:
     """Получить статистику пользователей с пагинацией"""
@@ -86,14 +299,16 @@ async def get_users_statistics(offset: int = 0, limit: int = 10) -> Tuple[List[D
         cursor = await db.execute("SELECT MAX(block_order) FROM content_blocks")
         max_blocks = (await cursor.fetchone())[0] or 0
         
-        # Получаем пользователей с их прогрессом
+        # Получаем пользователей с их прогрессом (итоги по блокам уже посчитаны при проверке)
         cursor = await db.execute("""
             SELECT u.user_id, u.username, u.full_name, u.last_completed_block_order,
-                   COUNT(DISTINCT ta.block_id) as completed_tests
+                   IFNULL(p.passed_tests, 0) as passed_tests, IFNULL(p.attempts, 0) as attempts
             FROM users u
-            LEFT JOIN test_attempts ta ON u.user_id = ta.user_id AND ta.status = 'completed'
-            GROUP BY u.user_id
-            ORDER BY u.last_completed_block_order DESC, completed_tests DESC
+            LEFT JOIN (
+                SELECT user_id, SUM(passed) as passed_tests, SUM(attempts) as attempts
+                FROM user_block_progress GROUP BY user_id
+            ) p ON p.user_id = u.user_id
+            ORDER BY u.last_completed_block_order DESC, passed_tests DESC
             LIMIT ? OFFSET ?
         """, (limit, offset))
         
@@ -105,13 +320,15 @@ async def get_users_statistics(offset: int = 0, limit: int = 10) -> Tuple[List[D
                 "full_name": row[2],
                 "last_completed_block_order": row[3],
                 "completed_tests": row[4],
-                "progress_text": f"Пройдено: {row[4]}/{max_blocks} тестов"
+                "attempts": row[5],
+                "progress_text": f"Пройдено: {row[4]}/{max_blocks} тестов, попыток: {row[5]}"
             })
         
         return users, total_users
 
 # === ФУНКЦИИ ДЛЯ РАБОТЫ С КОНТЕНТОМ ===
 
+@single_flight
 async def get_content_blocks() -> List[Dict]:
     """Получить все блоки контента"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
@@ -130,6 +347,28 @@ async def get_content_blocks() -> List[Dict]:
             })
         return blocks
 
+@single_flight
+async def get_content_block_summaries() -> List[Dict]:
+    """Блоки контента без текста теории (только длина текста и наличие медиа)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT id, title, block_order, LENGTH(IFNULL(theory_text, '')),
+                   video_file_id IS NOT NULL, pdf_file_id IS NOT NULL
+            FROM content_blocks ORDER BY block_order
+        """)
+        return [
+            {
+                "id": row[0],
+                "title": row[1],
+                "block_order": row[2],
+                "text_length": row[3],
+                "has_video": bool(row[4]),
+                "has_pdf": bool(row[5])
+            }
+            for row in await cursor.fetchall()
+        ]
+
+@single_flight
 async def get_content_block(block_id: int) -> Optional[Dict]:
     """Получить конкретный блок контента"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
@@ -158,8 +397,162 @@ async def update_block_content(block_id: int, **kwargs):
                     f"UPDATE content_blocks SET {field} = ? WHERE id = ?",
                     (value, block_id)
                 )
+        # Размер страниц зависит и от текста, и от наличия медиа
+        await rebuild_content_pages(db, block_id)
+        await reindex_block_search(db, block_id)
+        await bump_content_version(db)
         await db.commit()
 
+async def rebuild_content_pages(db: aiosqlite.Connection, block_id: int):
+    """Заново разбить текст блока на страницы (в транзакции изменения блока)"""
+    await db.execute("DELETE FROM content_pages WHERE block_id = ?", (block_id,))
+    cursor = await db.execute(
+        "SELECT title, theory_text, video_file_id, pdf_file_id FROM content_blocks WHERE id = ?",
+        (block_id,)
+    )
+    row = await cursor.fetchone()
+    if not row:
+        return
+    
+    pages = build_theory_pages(row[0], row[1], has_media=bool(row[2] or row[3]))
+    await db.executemany(
+        "INSERT INTO content_pages (block_id, page_number, text) VALUES (?, ?, ?)",
+        [(block_id, number, text) for number, text in enumerate(pages, 1)]
+    )
+
+@single_flight
+async def get_content_page(block_id: int, page: int) -> Optional[Dict]:
+    """Страница текста блока вместе с медиа блока и числом страниц"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT cp.text, cb.video_file_id, cb.pdf_file_id,
+                   (SELECT COUNT(*) FROM content_pages WHERE block_id = cp.block_id)
+            FROM content_pages cp
+            JOIN content_blocks cb ON cb.id = cp.block_id
+            WHERE cp.block_id = ? AND cp.page_number = ?
+        """, (block_id, page))
+        row = await cursor.fetchone()
+        if row:
+            return {
+                "text": row[0],
+                "video_file_id": row[1],
+                "pdf_file_id": row[2],
+                "total_pages": row[3]
+            }
+        return None
+
+# === ПОИСК ПО КОНТЕНТУ ===
+
+async def has_search_index(db: aiosqlite.Connection, table: str = "content_search") -> bool:
+    """Есть ли поисковая таблица FTS5 (не создается, если SQLite собран без FTS5)"""
+    cursor = await db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return await cursor.fetchone() is not None
+
+async def reindex_block_search(db: aiosqlite.Connection, block_id: int):
+    """Заново проиндексировать блок и его вопросы (в транзакции изменения контента)"""
+    if not await has_search_index(db):
+        return
+    
+    await db.execute("DELETE FROM content_search WHERE block_id = ?", (block_id,))
+    await db.execute("""
+        INSERT INTO content_search (kind, ref_id, block_id, title, body)
+        SELECT 'block', id, id, title, IFNULL(theory_text, '') FROM content_blocks WHERE id = ?
+    """, (block_id,))
+    await db.execute("""
+        INSERT INTO content_search (kind, ref_id, block_id, title, body)
+        SELECT 'question', id, block_id, '', question_text FROM questions WHERE block_id = ?
+    """, (block_id,))
+
+def _search_terms(query: str) -> List[str]:
+    """Слова поискового запроса (без операторов FTS5)"""
+    return re.findall(r"\w+", query.casefold())[:8]
+
+def _make_snippet(text: str, terms: List[str], width: int = 60) -> str:
+    """Фрагмент текста вокруг первого найденного слова с отмеченными совпадениями"""
+    folded = text.casefold()
+    positions = [position for position in (folded.find(term) for term in terms) if position >= 0]
+    start = max(min(positions, default=0) - width // 2, 0)
+    fragment = text[start:start + width * 2]
+    for term in terms:
+        fragment = re.sub(
+            re.escape(term), lambda match: f"{SNIPPET_START}{match.group(0)}{SNIPPET_END}",
+            fragment, flags=re.IGNORECASE
+        )
+    return ("…" if start > 0 else "") + fragment + ("…" if start + width * 2 < len(text) else "")
+
+async def search_content(query: str, limit: int = 8) -> List[Dict]:
+    """Найти блоки и вопросы по словам запроса (по началу слов), лучшие совпадения первыми
+    
+    Фрагмент найденного текста в snippet, совпадения обрамлены SNIPPET_START/SNIPPET_END.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        if not await has_search_index(db):
+            return await _search_content_scan(db, terms, limit)
+        
+        match = " ".join(f'"{term}"*' for term in terms)
+        cursor = await db.execute(f"""
+            SELECT content_search.kind, content_search.ref_id, content_search.block_id, cb.title,
+                   snippet(content_search, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12)
+            FROM content_search
+            JOIN content_blocks cb ON cb.id = content_search.block_id
+            WHERE content_search MATCH ?
+            ORDER BY bm25(content_search, 0, 0, 0, 4.0, 1.0)
+            LIMIT ?
+        """, (match, limit))
+        return [
+            {
+                "kind": row[0],
+                "ref_id": row[1],
+                "block_id": row[2],
+                "block_title": row[3],
+                "snippet": row[4]
+            }
+            for row in await cursor.fetchall()
+        ]
+
+async def _search_content_scan(db: aiosqlite.Connection, terms: List[str], limit: int) -> List[Dict]:
+    """Поиск перебором, если FTS5 недоступен (LIKE в SQLite не различает регистр кириллицы)"""
+    cursor = await db.execute("""
+        SELECT 'block', id, id, title, title || ' ' || IFNULL(theory_text, '') FROM content_blocks
+        UNION ALL
+        SELECT 'question', q.id, q.block_id, cb.title, q.question_text
+        FROM questions q JOIN content_blocks cb ON cb.id = q.block_id
+    """)
+    found = []
+    for kind, ref_id, block_id, title, body in await cursor.fetchall():
+        folded = body.casefold()
+        if all(term in folded for term in terms):
+            found.append((sum(folded.count(term) for term in terms), kind, ref_id, block_id, title, body))
+    
+    # Чем больше совпадений, тем выше результат
+    found.sort(key=lambda item: item[0], reverse=True)
+    return [
+        {
+            "kind": kind,
+            "ref_id": ref_id,
+            "block_id": block_id,
+            "block_title": title,
+            "snippet": _make_snippet(body, terms)
+        }
+        for _, kind, ref_id, block_id, title, body in found[:limit]
+    ]
+
+async def bump_content_version(db: aiosqlite.Connection):
+    """Увеличить версию контента (в транзакции изменения контента)"""
+    await db.execute("""
+        INSERT INTO system_settings (key, value, updated_at) VALUES ('content_version', '1', CURRENT_TIMESTAMP)
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, updated_at = CURRENT_TIMESTAMP
+    """)
+
+async def get_content_version() -> int:
+    """Текущая версия контента (меняется при каждом изменении блоков и вопросов)"""
+    value = await get_setting("content_version")
+    return int(value) if value else 0
+
 async def get_theory_for_block(block_id: int) -> Optional[str]:
     """Получить текст теории для блока"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
@@ -172,11 +565,12 @@ async def get_theory_for_block(block_id: int) -> Optional[str]:
 
 # === ФУНКЦИИ ДЛЯ РАБОТЫ С ВОПРОСАМИ ===
 
+@single_flight
 async def get_questions_for_block(block_id: int) -> List[Dict]:
     """Получить все вопросы для блока"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
         cursor = await db.execute(
-            "SELECT id, question_text FROM questions WHERE block_id = ? ORDER BY id",
+            "SELECT id, question_text FROM questions WHERE block_id = ? ORDER BY question_order, id",
             (block_id,)
         )
         questions = []
@@ -187,15 +581,321 @@ async def get_questions_for_block(block_id: int) -> List[Dict]:
             })
         return questions
 
-# === ФУНКЦИИ ДЛЯ РАБОТЫ С ТЕСТАМИ ===
+async def get_question(question_id: int) -> Optional[Dict]:
+    """Вопрос с его блоком и местом в блоке"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT q.id, q.block_id, q.question_text,
+                   (SELECT COUNT(*) FROM questions q2 WHERE q2.block_id = q.block_id
+                        AND (q2.question_order, q2.id) <= (q.question_order, q.id)),
+                   (SELECT COUNT(*) FROM questions q2 WHERE q2.block_id = q.block_id)
+            FROM questions q WHERE q.id = ?
+        """, (question_id,))
+        row = await cursor.fetchone()
+        if row:
+            return {
+                "id": row[0],
+                "block_id": row[1],
+                "question_text": row[2],
+                "position": row[3],
+                "total": row[4]
+            }
+        return None
+
+# === УПРАВЛЕНИЕ ВОПРОСАМИ И БЛОКАМИ ===
+# Каждое изменение — одна транзакция вместе с поисковым индексом и версией контента
+
+async def add_questions(block_id: int, texts: List[str]) -> int:
+    """Добавить вопросы в конец блока; возвращает число добавленных"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute(
+            "SELECT IFNULL(MAX(question_order), 0) FROM questions WHERE block_id = ?",
+            (block_id,)
+        )
+        last_order = (await cursor.fetchone())[0]
+        await db.executemany(
+            "INSERT INTO questions (block_id, question_text, question_order) VALUES (?, ?, ?)",
+            [(block_id, text, last_order + number) for number, text in enumerate(texts, 1)]
+        )
+        await reindex_block_search(db, block_id)
+        await bump_content_version(db)
+        await db.commit()
+        return len(texts)
+
+async def update_question(question_id: int, question_text: str) -> Optional[int]:
+    """Изменить текст вопроса; возвращает id блока (None, если вопроса нет)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT block_id FROM questions WHERE id = ?", (question_id,))
+        row = await cursor.fetchone()
+        if not row:
+            await db.rollback()
+            return None
+        await db.execute("UPDATE questions SET question_text = ? WHERE id = ?", (question_text, question_id))
+        await reindex_block_search(db, row[0])
+        await bump_content_version(db)
+        await db.commit()
+        return row[0]
+
+async def move_question(question_id: int, step: int) -> bool:
+    """Поменять вопрос местами с соседним (step = -1 — выше, 1 — ниже); False, если двигать некуда"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT block_id, question_order FROM questions WHERE id = ?", (question_id,))
+        row = await cursor.fetchone()
+        if not row:
+            await db.rollback()
+            return False
+        block_id, order = row
+        
+        if step < 0:
+            cursor = await db.execute("""
+                SELECT id, question_order FROM questions
+                WHERE block_id = ? AND (question_order, id) < (?, ?)
+                ORDER BY question_order DESC, id DESC LIMIT 1
+            """, (block_id, order, question_id))
+        else:
+            cursor = await db.execute("""
+                SELECT id, question_order FROM questions
+                WHERE block_id = ? AND (question_order, id) > (?, ?)
+                ORDER BY question_order, id LIMIT 1
+            """, (block_id, order, question_id))
+        neighbour = await cursor.fetchone()
+        if not neighbour:
+            await db.rollback()
+            return False
+        
+        neighbour_id, neighbour_order = neighbour
+        if neighbour_order == order:
+            # Одинаковый порядок (старые данные) — сначала нумеруем вопросы блока подряд
+            cursor = await db.execute(
+                "SELECT id FROM questions WHERE block_id = ? ORDER BY question_order, id", (block_id,)
+            )
+            orders = {row[0]: number for number, row in enumerate(await cursor.fetchall(), 1)}
+            await db.executemany(
+                "UPDATE questions SET question_order = ? WHERE id = ?",
+                [(number, qid) for qid, number in orders.items()]
+            )
+            order, neighbour_order = orders[question_id], orders[neighbour_id]
+        await db.executemany(
+            "UPDATE questions SET question_order = ? WHERE id = ?",
+            [(neighbour_order, question_id), (order, neighbour_id)]
+        )
+        await bump_content_version(db)
+        await db.commit()
+        return True
+
+async def delete_question(question_id: int) -> Optional[int]:
+    """Удалить вопрос; возвращает id блока (None, если вопроса нет)
+    
+    Ответы на вопрос остаются в БД, но больше не проверяются, не показываются
+    в истории и не учитываются в результате попытки.
+    """
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT block_id FROM questions WHERE id = ?", (question_id,))
+        row = await cursor.fetchone()
+        if not row:
+            await db.rollback()
+            return None
+        await db.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+        await reindex_block_search(db, row[0])
+        await bump_content_version(db)
+        await db.commit()
+        return row[0]
+
+async def create_content_block(title: str) -> Optional[int]:
+    """Создать пустой блок в конце списка; None, если блок с таким названием уже есть"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = await db.execute("""
+                INSERT INTO content_blocks (title, block_order)
+                SELECT ?, IFNULL(MAX(block_order), 0) + 1 FROM content_blocks
+            """, (title,))
+        except aiosqlite.IntegrityError:
+            await db.rollback()
+            return None
+        block_id = cursor.lastrowid
+        await rebuild_content_pages(db, block_id)
+        await reindex_block_search(db, block_id)
+        await bump_content_version(db)
+        await db.commit()
+        return block_id
 
-async def create_test_attempt(user_id: int, block_id: int) -> int:
-    """Создать новую попытку прохождения теста"""
+async def delete_content_block(block_id: int) -> Optional[List[int]]:
+    """Удалить блок с вопросами и страницами; следующие блоки сдвигаются на его место
+    
+    Прогресс пользователей сдвигается вместе с порядком блоков, чтобы открытые
+    тесты остались открытыми. Незавершенные попытки по блоку прерываются, а их
+    задачи проверки снимаются из очереди. Возвращает id пользователей, чьи
+    попытки прерваны (None, если блока нет).
+    """
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("SELECT block_order FROM content_blocks WHERE id = ?", (block_id,))
+        row = await cursor.fetchone()
+        if not row:
+            await db.rollback()
+            return None
+        block_order = row[0]
+        
+        # Иначе попытка без блока не видна пользователю, но занимает место активной
         cursor = await db.execute(
-            "INSERT INTO test_attempts (user_id, block_id, status) VALUES (?, ?, ?)",
-            (user_id, block_id, TestStatus.IN_PROGRESS)
+            "SELECT id, user_id FROM test_attempts WHERE block_id = ? AND status IN (?, ?)",
+            (block_id, TestStatus.IN_PROGRESS, TestStatus.ANALYZING)
         )
+        attempts = await cursor.fetchall()
+        await db.executemany(
+            "UPDATE test_attempts SET status = ? WHERE id = ?",
+            [(TestStatus.ABANDONED, attempt_id) for attempt_id, _ in attempts]
+        )
+        await db.executemany(
+            "DELETE FROM grading_jobs WHERE attempt_id = ? AND status = ?",
+            [(attempt_id, JobStatus.PENDING) for attempt_id, _ in attempts]
+        )
+        
+        await db.execute("DELETE FROM questions WHERE block_id = ?", (block_id,))
+        await db.execute("DELETE FROM content_pages WHERE block_id = ?", (block_id,))
+        await db.execute("DELETE FROM user_block_progress WHERE block_id = ?", (block_id,))
+        await db.execute("DELETE FROM content_blocks WHERE id = ?", (block_id,))
+        await reindex_block_search(db, block_id)
+        
+        # block_order уникален, поэтому сдвиг в два шага: через отрицательные значения
+        await db.execute(
+            "UPDATE content_blocks SET block_order = -(block_order - 1) WHERE block_order > ?",
+            (block_order,)
+        )
+        await db.execute("UPDATE content_blocks SET block_order = -block_order WHERE block_order < 0")
+        await db.execute(
+            "UPDATE users SET last_completed_block_order = last_completed_block_order - 1 WHERE last_completed_block_order >= ?",
+            (block_order,)
+        )
+        
+        await bump_content_version(db)
+        await db.commit()
+    user_sessions.clear()
+    return sorted({user_id for _, user_id in attempts})
+
+# === ИМПОРТ И ЭКСПОРТ КОНТЕНТА ===
+
+async def get_content_export_batch(after_order: int, limit: int) -> List[Dict]:
+    """Порция блоков с вопросами по порядку, начиная после блока с порядком after_order"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT id, title, theory_text, video_file_id, pdf_file_id, block_order
+            FROM content_blocks
+            WHERE block_order > ?
+            ORDER BY block_order
+            LIMIT ?
+        """, (after_order, limit))
+        blocks = [
+            {
+                "id": row[0],
+                "title": row[1],
+                "theory_text": row[2],
+                "video_file_id": row[3],
+                "pdf_file_id": row[4],
+                "block_order": row[5],
+                "questions": []
+            }
+            for row in await cursor.fetchall()
+        ]
+        if not blocks:
+            return []
+        
+        by_id = {block["id"]: block for block in blocks}
+        cursor = await db.execute(f"""
+            SELECT block_id, question_text FROM questions
+            WHERE block_id IN ({",".join("?" * len(by_id))})
+            ORDER BY block_id, question_order, id
+        """, list(by_id))
+        for block_id, question_text in await cursor.fetchall():
+            by_id[block_id]["questions"].append(question_text)
+        return blocks
+
+async def import_content_batch(blocks: List[Dict]) -> Dict:
+    """Сохранить порцию блоков одной транзакцией; блоки сопоставляются по названию
+    
+    Новые блоки добавляются в конец списка. Пустые поля (None) не меняют блок.
+    Вопросы сопоставляются по тексту: совпавшие сохраняют id (ответы на них
+    и задачи проверки остаются при своем вопросе) и получают новый порядок,
+    новые добавляются, отсутствующие в файле удаляются.
+    """
+    result = {"created": 0, "updated": 0, "questions": 0}
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        for block in blocks:
+            fields = (block["theory_text"], block["video_file_id"], block["pdf_file_id"])
+            cursor = await db.execute("SELECT id FROM content_blocks WHERE title = ?", (block["title"],))
+            row = await cursor.fetchone()
+            if row:
+                block_id = row[0]
+                await db.execute("""
+                    UPDATE content_blocks
+                    SET theory_text = IFNULL(?, theory_text),
+                        video_file_id = IFNULL(?, video_file_id),
+                        pdf_file_id = IFNULL(?, pdf_file_id)
+                    WHERE id = ?
+                """, (*fields, block_id))
+                result["updated"] += 1
+            else:
+                cursor = await db.execute("""
+                    INSERT INTO content_blocks (title, theory_text, video_file_id, pdf_file_id, block_order)
+                    SELECT ?, ?, ?, ?, IFNULL(MAX(block_order), 0) + 1 FROM content_blocks
+                """, (block["title"], *fields))
+                block_id = cursor.lastrowid
+                result["created"] += 1
+            
+            questions = block["questions"]
+            if questions is not None:
+                cursor = await db.execute(
+                    "SELECT id, question_text FROM questions WHERE block_id = ? ORDER BY question_order, id",
+                    (block_id,)
+                )
+                existing: Dict[str, List[int]] = {}
+                for question_id, text in await cursor.fetchall():
+                    existing.setdefault(text, []).append(question_id)
+                
+                kept, added = [], []
+                for order, text in enumerate(questions, 1):
+                    ids = existing.get(text)
+                    if ids:
+                        kept.append((order, ids.pop(0)))
+                    else:
+                        added.append((block_id, text, order))
+                await db.executemany("UPDATE questions SET question_order = ? WHERE id = ?", kept)
+                await db.executemany(
+                    "INSERT INTO questions (block_id, question_text, question_order) VALUES (?, ?, ?)",
+                    added
+                )
+                await db.executemany(
+                    "DELETE FROM questions WHERE id = ?",
+                    [(question_id,) for ids in existing.values() for question_id in ids]
+                )
+                result["questions"] += len(questions)
+            
+            await rebuild_content_pages(db, block_id)
+            await reindex_block_search(db, block_id)
+        
+        await bump_content_version(db)
+        await db.commit()
+    return result
+
+# === ФУНКЦИИ ДЛЯ РАБОТЫ С ТЕСТАМИ ===
+
+async def create_test_attempt(user_id: int, block_id: int) -> Optional[int]:
+    """Создать новую попытку прохождения теста (None, если у пользователя уже есть активная)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        try:
+            cursor = await db.execute(
+                "INSERT INTO test_attempts (user_id, block_id, status) VALUES (?, ?, ?)",
+                (user_id, block_id, TestStatus.IN_PROGRESS)
+            )
+        except aiosqlite.IntegrityError:
+            logger.warning(f"У пользователя {user_id} уже есть активная попытка теста")
+            return None
         await db.commit()
         return cursor.lastrowid
 
@@ -235,6 +935,125 @@ async def update_test_attempt_status(attempt_id: int, status: str):
             )
         await db.commit()
 
+async def complete_test_attempt(attempt_id: int, final_report: Optional[str] = None) -> Optional[Dict]:
+    """Завершить проверенную попытку: статус, результат с отчетом, итоги по блоку и прогресс — одной транзакцией
+    
+    Возвращает результат попытки (None, если попытка уже была завершена или прервана).
+    """
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        
+        cursor = await db.execute(
+            "UPDATE test_attempts SET status = ?, completed_timestamp = CURRENT_TIMESTAMP WHERE id = ? AND status NOT IN (?, ?)",
+            (TestStatus.COMPLETED, attempt_id, TestStatus.COMPLETED, TestStatus.ABANDONED)
+        )
+        if cursor.rowcount == 0:
+            await db.rollback()
+            return None
+        
+        cursor = await db.execute("""
+            SELECT ta.user_id, ta.block_id, cb.block_order,
+                   SUM(CASE WHEN ua.ai_verdict_is_sufficient = 1 THEN 1 ELSE 0 END), COUNT(ua.id)
+            FROM test_attempts ta
+            JOIN content_blocks cb ON ta.block_id = cb.id
+            -- Как и в get_test_answers, ответы на удаленные вопросы не проверяются и не учитываются
+            LEFT JOIN (user_answers ua JOIN questions q ON q.id = ua.question_id) ON ua.attempt_id = ta.id
+            WHERE ta.id = ?
+            GROUP BY ta.id
+        """, (attempt_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            # Блок удален, пока шла проверка — учитывать нечего
+            await db.commit()
+            return None
+        user_id, block_id, block_order, sufficient, total = row
+        sufficient = sufficient or 0
+        
+        score = sufficient / total if total else 0.0
+        passed = total > 0 and score >= config.TEST_PASS_RATE
+        await db.execute(
+            "UPDATE test_attempts SET score = ?, final_report = ? WHERE id = ?",
+            (score, final_report, attempt_id)
+        )
+        await record_block_result(db, user_id, block_id, attempt_id, score, passed)
+        
+        newly_passed = False
+        if passed:
+            cursor = await db.execute(
+                "UPDATE users SET last_completed_block_order = ? WHERE user_id = ? AND last_completed_block_order < ?",
+                (block_order, user_id, block_order)
+            )
+            newly_passed = cursor.rowcount > 0
+        
+        await db.commit()
+        user_sessions.invalidate(user_id)
+        return {
+            "block_order": block_order,
+            "sufficient": sufficient,
+            "total": total,
+            "passed": passed,
+            "newly_passed": newly_passed
+        }
+
+async def get_results_history(user_id: int, before_attempt_id: Optional[int] = None,
+                              limit: int = 5) -> Tuple[List[Dict], bool]:
+    """Завершенные попытки пользователя от новых к старым
+    
+    Страница начинается после попытки before_attempt_id (курсор по времени и id).
+    Возвращает попытки и признак того, что есть более старые.
+    """
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor_condition = ""
+        params: Tuple = (user_id, TestStatus.COMPLETED)
+        if before_attempt_id:
+            cursor_condition = """
+                AND (ta.attempt_timestamp, ta.id) < (
+                    SELECT attempt_timestamp, id FROM test_attempts WHERE id = ?
+                )"""
+            params += (before_attempt_id,)
+        
+        cursor = await db.execute(f"""
+            SELECT ta.id, ta.block_id, cb.title, ta.attempt_timestamp, ta.score
+            FROM test_attempts ta
+            JOIN content_blocks cb ON ta.block_id = cb.id
+            WHERE ta.user_id = ? AND ta.status = ?{cursor_condition}
+            ORDER BY ta.attempt_timestamp DESC, ta.id DESC
+            LIMIT ?
+        """, params + (limit + 1,))
+        rows = await cursor.fetchall()
+        
+        attempts = [
+            {
+                "attempt_id": row[0],
+                "block_id": row[1],
+                "block_title": row[2],
+                "attempt_timestamp": row[3],
+                "score": row[4]
+            }
+            for row in rows[:limit]
+        ]
+        return attempts, len(rows) > limit
+
+async def get_attempt_report(user_id: int, attempt_id: int) -> Optional[Dict]:
+    """Сохраненный итоговый отчет по попытке (только своей)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT ta.id, cb.title, ta.attempt_timestamp, ta.score, ta.final_report
+            FROM test_attempts ta
+            JOIN content_blocks cb ON ta.block_id = cb.id
+            WHERE ta.id = ? AND ta.user_id = ? AND ta.status = ?
+        """, (attempt_id, user_id, TestStatus.COMPLETED))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "attempt_id": row[0],
+            "block_title": row[1],
+            "attempt_timestamp": row[2],
+            "score": row[3],
+            "final_report": row[4]
+        }
+
 async def cancel_test_attempt(user_id: int) -> bool:
     """Отменить активную попытку теста пользователя"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
@@ -317,8 +1136,519 @@ async def save_feedback_rating(attempt_id: int, rating: int):
         )
         await db.commit()
 
+# === ОЧЕРЕДЬ ПРОВЕРКИ ОТВЕТОВ ===
+
+async def enqueue_grading_job(user_id: int, attempt_id: int, job_type: str = JobType.ATTEMPT,
+                              priority: int = 0, answer_id: Optional[int] = None) -> Optional[int]:
+    """Поставить задачу в очередь на проверку (повторная постановка игнорируется)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO grading_jobs (job_type, attempt_id, answer_id, user_id, priority, status) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_type, attempt_id, answer_id, user_id, priority, JobStatus.PENDING)
+        )
+        await db.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+async def claim_grading_job(worker_id: str) -> Optional[Dict]:
+    """Атомарно забрать следующую задачу из очереди"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        # IMMEDIATE блокирует запись сразу, чтобы два воркера не забрали одну задачу
+        await db.execute("BEGIN IMMEDIATE")
+        cursor = await db.execute("""
+            SELECT id, job_type, attempt_id, user_id, answer_id
+            FROM grading_jobs
+            WHERE status = ?
+            ORDER BY priority DESC, id
+            LIMIT 1
+        """, (JobStatus.PENDING,))
+        row = await cursor.fetchone()
+        
+        if not row:
+            await db.commit()
+            return None
+        
+        await db.execute(
+            "UPDATE grading_jobs SET status = ?, worker_id = ?, started_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (JobStatus.RUNNING, worker_id, row[0])
+        )
+        await db.commit()
+        return {
+            "job_id": row[0],
+            "job_type": row[1],
+            "attempt_id": row[2],
+            "user_id": row[3],
+            "answer_id": row[4]
+        }
+
+async def finish_grading_job(job_id: int):
+    """Отметить задачу проверки как выполненную"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute(
+            "UPDATE grading_jobs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (JobStatus.DONE, job_id)
+        )
+        await db.commit()
+
+async def requeue_grading_job(job_id: int):
+    """Вернуть прерванную задачу в очередь для продолжения после перезапуска"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute(
+            "UPDATE grading_jobs SET status = ?, worker_id = NULL, started_at = NULL WHERE id = ? AND status = ?",
+            (JobStatus.PENDING, job_id, JobStatus.RUNNING)
+        )
+        await db.commit()
+
+async def requeue_stale_grading_jobs(older_than_seconds: int = 0) -> int:
+    """Вернуть в очередь задачи, зависшие в статусе running (например, после падения воркера)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            UPDATE grading_jobs SET status = ?, worker_id = NULL, started_at = NULL
+            WHERE status = ? AND started_at <= datetime('now', ?)
+        """, (JobStatus.PENDING, JobStatus.RUNNING, f"-{older_than_seconds} seconds"))
+        await db.commit()
+        return cursor.rowcount
+
+# === АПЕЛЛЯЦИИ ===
+
+async def create_answer_appeal(answer_id: int, user_id: int) -> Optional[Dict]:
+    """Создать апелляцию на недостаточный вердикт ответа из завершенной попытки пользователя
+    
+    Неудавшаяся апелляция подается заново; None, если ответ уже оспорен или его нельзя оспорить.
+    """
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            INSERT INTO answer_appeals (answer_id, attempt_id, user_id, old_is_sufficient)
+            SELECT ua.id, ua.attempt_id, ta.user_id, ua.ai_verdict_is_sufficient
+            FROM user_answers ua
+            JOIN test_attempts ta ON ua.attempt_id = ta.id
+            WHERE ua.id = ? AND ta.user_id = ? AND ta.status = ? AND ua.ai_verdict_is_sufficient = 0
+            ON CONFLICT(answer_id) DO UPDATE SET status = ?, created_at = CURRENT_TIMESTAMP, resolved_at = NULL
+                WHERE answer_appeals.status = ?
+        """, (answer_id, user_id, TestStatus.COMPLETED, AppealStatus.PENDING, AppealStatus.FAILED))
+        await db.commit()
+        
+        if not cursor.rowcount:
+            return None
+        
+        cursor = await db.execute(
+            "SELECT id, attempt_id FROM answer_appeals WHERE answer_id = ?",
+            (answer_id,)
+        )
+        row = await cursor.fetchone()
+        return {"appeal_id": row[0], "attempt_id": row[1]}
+
+async def get_appeal_context(answer_id: int) -> Optional[Dict]:
+    """Получить все данные для перепроверки ответа по апелляции"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT ua.id, ua.attempt_id, ua.user_answer_text, q.question_text, cb.theory_text, cb.title
+            FROM user_answers ua
+            JOIN questions q ON ua.question_id = q.id
+            JOIN content_blocks cb ON q.block_id = cb.id
+            WHERE ua.id = ?
+        """, (answer_id,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "answer_id": row[0],
+            "attempt_id": row[1],
+            "user_answer_text": row[2],
+            "question_text": row[3],
+            "theory_text": row[4] or "",
+            "block_title": row[5]
+        }
+
+async def resolve_answer_appeal(answer_id: int, is_sufficient: bool, recommendation: str) -> Dict:
+    """Применить результат апелляции: вердикт ответа, статус апелляции и прогресс — одной транзакцией
+    
+    Итоговый отчет попытки пересобирается по текущим вердиктам, чтобы история
+    не расходилась с результатом. Возвращает итог попытки после пересчета
+    и признак того, что блок стал пройденным.
+    """
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        
+        await db.execute(
+            "UPDATE user_answers SET ai_verdict_is_sufficient = ?, ai_verdict_recommendation = ? WHERE id = ?",
+            (is_sufficient, recommendation, answer_id)
+        )
+        await db.execute("""
+            UPDATE answer_appeals
+            SET status = ?, new_is_sufficient = ?, resolved_at = CURRENT_TIMESTAMP
+            WHERE answer_id = ?
+        """, (AppealStatus.OVERTURNED if is_sufficient else AppealStatus.UPHELD, is_sufficient, answer_id))
+        
+        # Пересчитываем результат попытки с учетом нового вердикта
+        cursor = await db.execute("""
+            SELECT ta.id, ta.user_id, ta.block_id, cb.block_order,
+                   SUM(CASE WHEN ua2.ai_verdict_is_sufficient = 1 THEN 1 ELSE 0 END), COUNT(ua2.id)
+            FROM user_answers ua
+            JOIN test_attempts ta ON ua.attempt_id = ta.id
+            JOIN content_blocks cb ON ta.block_id = cb.id
+            JOIN user_answers ua2 ON ua2.attempt_id = ta.id
+            JOIN questions q ON q.id = ua2.question_id
+            WHERE ua.id = ?
+            GROUP BY ta.id
+        """, (answer_id,))
+        attempt_id, user_id, block_id, block_order, sufficient, total = await cursor.fetchone()
+        
+        score = sufficient / total if total else 0.0
+        passed = total > 0 and score >= config.TEST_PASS_RATE
+        
+        # Ответы в том же порядке, что и при первой проверке (get_test_answers)
+        cursor = await db.execute("""
+            SELECT ua.ai_verdict_is_sufficient, ua.ai_verdict_recommendation
+            FROM user_answers ua
+            JOIN questions q ON ua.question_id = q.id
+            WHERE ua.attempt_id = ?
+            ORDER BY ua.id
+        """, (attempt_id,))
+        final_report = format_final_report([
+            {
+                "is_sufficient": bool(row[0]),
+                "recommendation": row[1] or "Произошла ошибка анализа. Рекомендую повторить материал."
+            }
+            for row in await cursor.fetchall()
+        ])
+        await db.execute(
+            "UPDATE test_attempts SET score = ?, final_report = ? WHERE id = ?",
+            (score, final_report, attempt_id)
+        )
+        await record_block_result(db, user_id, block_id, attempt_id, score, passed, new_attempt=False)
+        newly_passed = False
+        if passed:
+            cursor = await db.execute(
+                "UPDATE users SET last_completed_block_order = ? WHERE user_id = ? AND last_completed_block_order < ?",
+                (block_order, user_id, block_order)
+            )
+            newly_passed = cursor.rowcount > 0
+        
+        await db.commit()
+        user_sessions.invalidate(user_id)
+        return {
+            "sufficient": sufficient,
+            "total": total,
+            "passed": passed,
+            "newly_passed": newly_passed
+        }
+
+async def fail_answer_appeal(answer_id: int):
+    """Отметить ожидающую апелляцию неудавшейся (вердикт не меняется; решенную не трогает)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute(
+            "UPDATE answer_appeals SET status = ?, resolved_at = CURRENT_TIMESTAMP WHERE answer_id = ? AND status = ?",
+            (AppealStatus.FAILED, answer_id, AppealStatus.PENDING)
+        )
+        await db.commit()
+
+async def get_appeal_stats() -> Dict:
+    """Статистика апелляций для аналитики"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT
+                COUNT(*),
+                SUM(CASE WHEN status = ? THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = ? THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = ? THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = ? THEN 1 ELSE 0 END)
+            FROM answer_appeals
+        """, (AppealStatus.PENDING, AppealStatus.UPHELD, AppealStatus.OVERTURNED, AppealStatus.FAILED))
+        row = await cursor.fetchone()
+        resolved = (row[2] or 0) + (row[3] or 0)
+        return {
+            "total": row[0] or 0,
+            "pending": row[1] or 0,
+            "upheld": row[2] or 0,
+            "overturned": row[3] or 0,
+            "failed": row[4] or 0,
+            "overturn_rate": (row[3] or 0) / resolved * 100 if resolved > 0 else 0
+        }
+
+# === ПЕРЕПРОВЕРКА ОТВЕТОВ ===
+
+async def create_regrade_run(model: str, prompt_hash: str) -> int:
+    """Создать прогон перепроверки всех ранее проверенных ответов"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM user_answers WHERE ai_verdict_is_sufficient IS NOT NULL"
+        )
+        total = (await cursor.fetchone())[0]
+        cursor = await db.execute(
+            "INSERT INTO regrade_runs (model, prompt_hash, total_answers) VALUES (?, ?, ?)",
+            (model, prompt_hash, total)
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+async def get_regrade_run(run_id: Optional[int] = None) -> Optional[Dict]:
+    """Получить прогон перепроверки (по умолчанию — последний)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        query = """
+            SELECT id, model, prompt_hash, status, total_answers, last_answer_id,
+                   processed, failed, elapsed_seconds, started_at, finished_at
+            FROM regrade_runs
+        """
+        if run_id is None:
+            cursor = await db.execute(query + " ORDER BY id DESC LIMIT 1")
+        else:
+            cursor = await db.execute(query + " WHERE id = ?", (run_id,))
+        row = await cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "run_id": row[0],
+            "model": row[1],
+            "prompt_hash": row[2],
+            "status": row[3],
+            "total_answers": row[4],
+            "last_answer_id": row[5],
+            "processed": row[6],
+            "failed": row[7],
+            "elapsed_seconds": row[8],
+            "started_at": row[9],
+            "finished_at": row[10]
+        }
+
+async def get_answers_for_regrade(after_answer_id: int, limit: int) -> List[Dict]:
+    """Получить следующую порцию проверенных ответов (курсор по id ответа)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT ua.id, ua.user_answer_text, ua.ai_verdict_is_sufficient, q.question_text, q.block_id
+            FROM user_answers ua
+            JOIN questions q ON ua.question_id = q.id
+            WHERE ua.id > ? AND ua.ai_verdict_is_sufficient IS NOT NULL
+            ORDER BY ua.id
+            LIMIT ?
+        """, (after_answer_id, limit))
+        return [_regrade_answer_from_row(row) for row in await cursor.fetchall()]
+
+# Ответы, уже пройденные прогоном, но оставшиеся без результата (проверка не удалась)
+_FAILED_REGRADE_ANSWERS = """
+    FROM user_answers ua
+    JOIN questions q ON ua.question_id = q.id
+    LEFT JOIN regrade_results rr ON rr.run_id = ? AND rr.answer_id = ua.id
+    WHERE ua.id > ? AND ua.id <= ? AND ua.ai_verdict_is_sufficient IS NOT NULL
+        AND rr.answer_id IS NULL
+"""
+
+async def get_failed_regrade_answers(run_id: int, after_answer_id: int, up_to_answer_id: int,
+                                     limit: int) -> List[Dict]:
+    """Порция ответов прогона, которые не удалось проверить (курсор по id ответа)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT ua.id, ua.user_answer_text, ua.ai_verdict_is_sufficient, q.question_text, q.block_id"
+            + _FAILED_REGRADE_ANSWERS + "ORDER BY ua.id LIMIT ?",
+            (run_id, after_answer_id, up_to_answer_id, limit)
+        )
+        return [_regrade_answer_from_row(row) for row in await cursor.fetchall()]
+
+async def recount_regrade_failures(run_id: int, up_to_answer_id: int) -> int:
+    """Пересчитать число непроверенных ответов прогона (после повторного прохода)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT COUNT(*)" + _FAILED_REGRADE_ANSWERS,
+            (run_id, 0, up_to_answer_id)
+        )
+        failed = (await cursor.fetchone())[0]
+        await db.execute("UPDATE regrade_runs SET failed = ? WHERE id = ?", (failed, run_id))
+        await db.commit()
+        return failed
+
+def _regrade_answer_from_row(row) -> Dict:
+    """Ответ для перепроверки из строки запроса"""
+    return {
+        "answer_id": row[0],
+        "user_answer_text": row[1],
+        "old_is_sufficient": None if row[2] is None else bool(row[2]),
+        "question_text": row[3],
+        "block_id": row[4]
+    }
+
+async def _insert_regrade_results(db: aiosqlite.Connection, run_id: int, results: List[Dict]):
+    """Записать новые вердикты прогона (в транзакции сохранения порции)"""
+    await db.executemany("""
+        INSERT OR REPLACE INTO regrade_results
+            (run_id, answer_id, old_is_sufficient, new_is_sufficient, recommendation)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (run_id, r["answer_id"], r["old_is_sufficient"], r["new_is_sufficient"], r["recommendation"])
+        for r in results
+    ])
+
+async def save_regrade_chunk(run_id: int, results: List[Dict], last_answer_id: int,
+                             failed: int, elapsed_seconds: float):
+    """Сохранить результаты порции и сдвинуть контрольную точку прогона (одной транзакцией)
+    
+    Ответы, которые не удалось проверить, остаются без результата и считаются
+    в failed — их перепроверяет повторный проход (save_regrade_retry).
+    """
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await _insert_regrade_results(db, run_id, results)
+        await db.execute("""
+            UPDATE regrade_runs
+            SET last_answer_id = ?, processed = processed + ?, failed = failed + ?,
+                elapsed_seconds = elapsed_seconds + ?
+            WHERE id = ?
+        """, (last_answer_id, len(results) + failed, failed, elapsed_seconds, run_id))
+        await db.commit()
+
+async def save_regrade_retry(run_id: int, results: List[Dict], elapsed_seconds: float):
+    """Сохранить результаты повторной проверки ответов, не проверенных с первого раза"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await _insert_regrade_results(db, run_id, results)
+        await db.execute(
+            "UPDATE regrade_runs SET elapsed_seconds = elapsed_seconds + ? WHERE id = ?",
+            (elapsed_seconds, run_id)
+        )
+        await db.commit()
+
+async def complete_regrade_run(run_id: int):
+    """Отметить прогон перепроверки завершенным"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute(
+            "UPDATE regrade_runs SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (RegradeStatus.COMPLETED, run_id)
+        )
+        await db.commit()
+
+async def get_regrade_agreement(run_id: int) -> Dict:
+    """Сравнить новые вердикты прогона с прежними"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT
+                COUNT(*),
+                SUM(CASE WHEN old_is_sufficient = new_is_sufficient THEN 1 ELSE 0 END),
+                SUM(CASE WHEN old_is_sufficient = 0 AND new_is_sufficient = 1 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN old_is_sufficient = 1 AND new_is_sufficient = 0 THEN 1 ELSE 0 END)
+            FROM regrade_results
+            WHERE run_id = ?
+        """, (run_id,))
+        row = await cursor.fetchone()
+        compared = row[0] or 0
+        agreed = row[1] or 0
+        return {
+            "compared": compared,
+            "agreed": agreed,
+            "became_sufficient": row[2] or 0,
+            "became_insufficient": row[3] or 0,
+            "agreement_rate": (agreed / compared * 100) if compared > 0 else 0
+        }
+
+# === РАССЫЛКИ ===
+
+BROADCAST_FIELDS = """
+    id, admin_id, text, status, total_users, last_user_id, sent, blocked, failed,
+    elapsed_seconds, progress_chat_id, progress_message_id, created_at, finished_at
+"""
+
+def _broadcast_from_row(row) -> Dict:
+    """Словарь рассылки из строки BROADCAST_FIELDS"""
+    return {
+        "broadcast_id": row[0],
+        "admin_id": row[1],
+        "text": row[2],
+        "status": row[3],
+        "total_users": row[4],
+        "last_user_id": row[5],
+        "sent": row[6],
+        "blocked": row[7],
+        "failed": row[8],
+        "elapsed_seconds": row[9],
+        "progress_chat_id": row[10],
+        "progress_message_id": row[11],
+        "created_at": row[12],
+        "finished_at": row[13]
+    }
+
+async def count_broadcast_recipients() -> int:
+    """Количество пользователей, которым можно отправить рассылку"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 0")
+        return (await cursor.fetchone())[0]
+
+async def create_broadcast(admin_id: int, text: str) -> int:
+    """Создать рассылку всем незаблокировавшим бота пользователям"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 0")
+        total = (await cursor.fetchone())[0]
+        cursor = await db.execute(
+            "INSERT INTO broadcasts (admin_id, text, total_users) VALUES (?, ?, ?)",
+            (admin_id, text, total)
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+async def set_broadcast_progress_message(broadcast_id: int, chat_id: int, message_id: int):
+    """Запомнить сообщение с прогрессом рассылки (чтобы обновлять его и после перезапуска)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute(
+            "UPDATE broadcasts SET progress_chat_id = ?, progress_message_id = ? WHERE id = ?",
+            (chat_id, message_id, broadcast_id)
+        )
+        await db.commit()
+
+async def get_broadcast(broadcast_id: Optional[int] = None) -> Optional[Dict]:
+    """Получить рассылку (по умолчанию — последнюю)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        query = f"SELECT {BROADCAST_FIELDS} FROM broadcasts"
+        if broadcast_id is None:
+            cursor = await db.execute(query + " ORDER BY id DESC LIMIT 1")
+        else:
+            cursor = await db.execute(query + " WHERE id = ?", (broadcast_id,))
+        row = await cursor.fetchone()
+        return _broadcast_from_row(row) if row else None
+
+async def get_running_broadcasts() -> List[Dict]:
+    """Незавершенные рассылки (для продолжения после перезапуска)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            f"SELECT {BROADCAST_FIELDS} FROM broadcasts WHERE status = ? ORDER BY id",
+            (BroadcastStatus.RUNNING,)
+        )
+        return [_broadcast_from_row(row) async for row in cursor]
+
+async def get_broadcast_recipients(after_user_id: int, limit: int) -> List[int]:
+    """Следующая порция получателей рассылки (курсор по user_id)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "SELECT user_id FROM users WHERE user_id > ? AND is_blocked = 0 ORDER BY user_id LIMIT ?",
+            (after_user_id, limit)
+        )
+        return [row[0] async for row in cursor]
+
+async def save_broadcast_chunk(broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                               blocked_user_ids: List[int], elapsed_seconds: float):
+    """Сохранить итоги порции рассылки и сдвинуть курсор (одной транзакцией)"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.executemany(
+            "UPDATE users SET is_blocked = 1 WHERE user_id = ?",
+            [(user_id,) for user_id in blocked_user_ids]
+        )
+        for user_id in blocked_user_ids:
+            user_sessions.invalidate(user_id)
+        await db.execute("""
+            UPDATE broadcasts
+            SET last_user_id = ?, sent = sent + ?, blocked = blocked + ?, failed = failed + ?,
+                elapsed_seconds = elapsed_seconds + ?
+            WHERE id = ?
+        """, (last_user_id, sent, len(blocked_user_ids), failed, elapsed_seconds, broadcast_id))
+        await db.commit()
+
+async def finish_broadcast(broadcast_id: int, status: str) -> bool:
+    """Завершить или отменить рассылку; False, если она уже не выполнялась"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute(
+            "UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+            (status, broadcast_id, BroadcastStatus.RUNNING)
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
 # === ФУНКЦИИ ДЛЯ НАСТРОЕК СИСТЕМЫ ===
 
+@single_flight
 async def get_setting(key: str) -> Optional[str]:
     """Получить настройку системы"""
     async with aiosqlite.connect(config.DATABASE_PATH) as db:
@@ -352,6 +1682,47 @@ async def toggle_maintenance_mode() -> bool:
 
 # === АНАЛИТИКА ИИ ===
 
+async def save_grading_call(tier: str, model: str, latency_ms: int, prompt_tokens: int,
+                            completion_tokens: int, escalated: bool):
+    """Сохранить статистику одного вызова модели при проверке"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        await db.execute("""
+            INSERT INTO ai_grading_calls (tier, model, latency_ms, prompt_tokens, completion_tokens, escalated)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (tier, model, latency_ms, prompt_tokens, completion_tokens, escalated))
+        await db.commit()
+
+async def get_grading_tier_stats() -> List[Dict]:
+    """Статистика вызовов моделей по уровням: задержка, токены, стоимость, эскалации"""
+    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        cursor = await db.execute("""
+            SELECT tier, model, COUNT(*), AVG(latency_ms), MAX(latency_ms),
+                   SUM(prompt_tokens), SUM(completion_tokens), SUM(escalated)
+            FROM ai_grading_calls
+            GROUP BY tier, model
+            ORDER BY tier, model
+        """)
+        
+        stats = []
+        async for row in cursor:
+            input_price, output_price = config.OPENAI_MODEL_PRICES.get(row[1], (0, 0))
+            prompt_tokens = row[5] or 0
+            completion_tokens = row[6] or 0
+            stats.append({
+                "tier": row[0],
+                "model": row[1],
+                "calls": row[2],
+                "avg_latency_ms": row[3] or 0,
+                "max_latency_ms": row[4] or 0,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "escalated": row[7] or 0,
+                "escalation_rate": (row[7] or 0) / row[2] * 100 if row[2] else 0,
+                "cost_usd": (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+            })
+        return stats
+
+@single_flight
 async def get_ai_analytics_data() -> dict:
     """Получить детальную аналитику по работе ИИ с разбивкой по блокам"""
     try:
@@ -6,6 +6,39 @@ class TestStatus:
     FAILED = "failed"
     ABANDONED = "abandoned"
 
+# Константы для очереди проверки ответов
+class JobStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+
+class JobType:
+    ATTEMPT = "attempt"
+    APPEAL = "appeal"
+
+# Статусы апелляций на вердикт ИИ
+class AppealStatus:
+    PENDING = "pending"
+    UPHELD = "upheld"  # Вердикт подтвержден
+    OVERTURNED = "overturned"  # Вердикт изменен в пользу студента
+    FAILED = "failed"  # Перепроверка не удалась
+
+# Уровни моделей проверки ответов
+class ModelTier:
+    FAST = "fast"
+    STRONG = "strong"
+
+# Статусы прогонов перепроверки
+class RegradeStatus:
+    RUNNING = "running"
+    COMPLETED = "completed"
+
+# Статусы рассылок
+class BroadcastStatus:
+    RUNNING = "running"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+
 # SQL запросы для создания таблиц
 CREATE_TABLES_SQL = """
 -- Таблица блоков контента
@@ -18,6 +51,15 @@ CREATE TABLE IF NOT EXISTS content_blocks (
     block_order INTEGER UNIQUE NOT NULL
 );
 
+-- Текст блоков теории, заранее разбитый на страницы (пересчитывается при изменении блока)
+CREATE TABLE IF NOT EXISTS content_pages (
+    block_id INTEGER NOT NULL,
+    page_number INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (block_id, page_number),
+    FOREIGN KEY (block_id) REFERENCES content_blocks (id) ON DELETE CASCADE
+);
+
 -- Таблица вопросов
 CREATE TABLE IF NOT EXISTS questions (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -48,6 +90,20 @@ CREATE TABLE IF NOT EXISTS test_attempts (
     FOREIGN KEY (block_id) REFERENCES content_blocks (id) ON DELETE CASCADE
 );
 
+-- Итоги пользователя по блокам (обновляются при завершении проверки попытки и по апелляциям)
+CREATE TABLE IF NOT EXISTS user_block_progress (
+    user_id INTEGER NOT NULL,
+    block_id INTEGER NOT NULL,
+    best_score REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_attempt_id INTEGER NULL,
+    last_attempt_at DATETIME NULL,
+    passed BOOLEAN NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, block_id),
+    FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE,
+    FOREIGN KEY (block_id) REFERENCES content_blocks (id) ON DELETE CASCADE
+);
+
 -- Таблица ответов пользователей
 CREATE TABLE IF NOT EXISTS user_answers (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -68,16 +124,209 @@ CREATE TABLE IF NOT EXISTS system_settings (
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Очередь задач проверки ответов (общая для бота и процессов-воркеров)
+CREATE TABLE IF NOT EXISTS grading_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_type TEXT NOT NULL DEFAULT 'attempt',
+    attempt_id INTEGER NOT NULL,
+    answer_id INTEGER NULL,
+    user_id INTEGER NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker_id TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    FOREIGN KEY (attempt_id) REFERENCES test_attempts (id) ON DELETE CASCADE
+);
+
+-- Апелляции студентов на вердикты по отдельным ответам
+CREATE TABLE IF NOT EXISTS answer_appeals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    answer_id INTEGER NOT NULL UNIQUE,
+    attempt_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    old_is_sufficient BOOLEAN NULL,
+    new_is_sufficient BOOLEAN NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    resolved_at DATETIME NULL,
+    FOREIGN KEY (answer_id) REFERENCES user_answers (id) ON DELETE CASCADE,
+    FOREIGN KEY (attempt_id) REFERENCES test_attempts (id) ON DELETE CASCADE
+);
+
+-- Прогоны массовой перепроверки ответов (после смены промпта или модели)
+CREATE TABLE IF NOT EXISTS regrade_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    total_answers INTEGER NOT NULL DEFAULT 0,
+    last_answer_id INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    elapsed_seconds REAL NOT NULL DEFAULT 0,
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME NULL
+);
+
+-- Новые вердикты перепроверки (user_answers при этом не изменяются)
+CREATE TABLE IF NOT EXISTS regrade_results (
+    run_id INTEGER NOT NULL,
+    answer_id INTEGER NOT NULL,
+    old_is_sufficient BOOLEAN NULL,
+    new_is_sufficient BOOLEAN NOT NULL,
+    recommendation TEXT NULL,
+    PRIMARY KEY (run_id, answer_id),
+    FOREIGN KEY (run_id) REFERENCES regrade_runs (id) ON DELETE CASCADE,
+    FOREIGN KEY (answer_id) REFERENCES user_answers (id) ON DELETE CASCADE
+);
+
+-- Вызовы моделей при проверке ответов (задержка и токены по уровням)
+CREATE TABLE IF NOT EXISTS ai_grading_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tier TEXT NOT NULL,
+    model TEXT NOT NULL,
+    latency_ms INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    escalated BOOLEAN NOT NULL DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Рассылки админов (курсор last_user_id позволяет продолжить после перезапуска)
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    admin_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    total_users INTEGER NOT NULL DEFAULT 0,
+    last_user_id INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    blocked INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    elapsed_seconds REAL NOT NULL DEFAULT 0,
+    progress_chat_id INTEGER NULL,
+    progress_message_id INTEGER NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME NULL
+);
+
 -- Вставляем начальные настройки
 INSERT OR IGNORE INTO system_settings (key, value) VALUES ('maintenance_mode', 'false');
 """
 
+# Колонки, добавленные после создания таблиц: (таблица, колонка, определение)
+COLUMN_MIGRATIONS = [
+    ("grading_jobs", "answer_id", "INTEGER NULL"),
+    ("users", "is_blocked", "BOOLEAN NOT NULL DEFAULT 0"),
+    ("test_attempts", "score", "REAL NULL"),
+    ("test_attempts", "final_report", "TEXT NULL"),
+    ("questions", "question_order", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# Незавершенные попытки сверх одной на пользователя (остались от двойных нажатий) отменяются
+# один раз — перед созданием уникального индекса idx_test_attempts_one_active
+ABANDON_EXTRA_ATTEMPTS_SQL = """
+UPDATE test_attempts SET status = 'abandoned', completed_timestamp = CURRENT_TIMESTAMP
+    WHERE status = 'in_progress' AND id NOT IN (
+        SELECT MAX(id) FROM test_attempts WHERE status = 'in_progress' GROUP BY user_id
+    )
+"""
+
 # Индексы для производительности
 CREATE_INDEXES_SQL = """
 CREATE INDEX IF NOT EXISTS idx_test_attempts_user_status ON test_attempts(user_id, status);
+-- Не более одной незавершенной попытки на пользователя (лишние отменяет ABANDON_EXTRA_ATTEMPTS_SQL)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_test_attempts_one_active
+    ON test_attempts(user_id) WHERE status = 'in_progress';
+-- История результатов пользователя (постраничный вывод по курсору)
+CREATE INDEX IF NOT EXISTS idx_test_attempts_history ON test_attempts(user_id, attempt_timestamp, id);
 CREATE INDEX IF NOT EXISTS idx_user_answers_attempt ON user_answers(attempt_id);
-CREATE INDEX IF NOT EXISTS idx_questions_block ON questions(block_id);
+-- Поиск пользователей по началу username и имени (короткие запросы)
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_users_full_name ON users(full_name COLLATE NOCASE);
+DROP INDEX IF EXISTS idx_questions_block;
+CREATE INDEX IF NOT EXISTS idx_questions_block_order ON questions(block_id, question_order);
 CREATE INDEX IF NOT EXISTS idx_content_blocks_order ON content_blocks(block_order);
+CREATE INDEX IF NOT EXISTS idx_ai_grading_calls_tier ON ai_grading_calls(tier, model);
+CREATE INDEX IF NOT EXISTS idx_grading_jobs_queue ON grading_jobs(status, priority DESC, id);
+-- Не более одной незавершенной задачи каждого типа на попытку (для апелляций — на ответ)
+DROP INDEX IF EXISTS idx_grading_jobs_active;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_grading_jobs_unique_active
+    ON grading_jobs(attempt_id, job_type, IFNULL(answer_id, 0))
+    WHERE status IN ('pending', 'running');
+CREATE INDEX IF NOT EXISTS idx_answer_appeals_status ON answer_appeals(status);
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status);
+"""
+
+# Полнотекстовый поиск по теории, названиям блоков и вопросам (FTS5; если модуля нет — поиск без индекса)
+# kind: 'block' — название и теория блока, 'question' — текст вопроса (title пустой)
+CREATE_SEARCH_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS content_search USING fts5(
+    kind UNINDEXED,
+    ref_id UNINDEXED,
+    block_id UNINDEXED,
+    title,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
+-- Поиск пользователей по любой части имени и username (rowid — user_id)
+CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(
+    full_name,
+    username,
+    tokenize = 'trigram'
+);
+"""
+
+# Границы найденных слов во фрагментах результатов поиска
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+# Заполнение user_block_progress по завершенным попыткам (для баз, созданных до появления таблицы);
+# параметр — доля достаточных ответов для прохождения блока
+BACKFILL_BLOCK_PROGRESS_SQL = """
+WITH scores AS (
+    SELECT ta.id, ta.user_id, ta.block_id, ta.completed_timestamp,
+           CAST(SUM(CASE WHEN ua.ai_verdict_is_sufficient = 1 THEN 1 ELSE 0 END) AS REAL) / COUNT(ua.id) AS score
+    FROM test_attempts ta
+    JOIN user_answers ua ON ua.attempt_id = ta.id
+    JOIN questions q ON q.id = ua.question_id
+    WHERE ta.status = 'completed'
+    GROUP BY ta.id
+)
+INSERT OR IGNORE INTO user_block_progress
+    (user_id, block_id, best_score, attempts, last_attempt_id, last_attempt_at, passed)
+SELECT user_id, block_id, MAX(score), COUNT(*), MAX(id), MAX(completed_timestamp), MAX(score) >= ?
+FROM scores
+GROUP BY user_id, block_id
+"""
+
+# Доля достаточных ответов для попыток, завершенных до появления test_attempts.score
+BACKFILL_ATTEMPT_SCORES_SQL = """
+UPDATE test_attempts SET score = (
+    SELECT CAST(SUM(CASE WHEN ua.ai_verdict_is_sufficient = 1 THEN 1 ELSE 0 END) AS REAL) / COUNT(ua.id)
+    FROM user_answers ua JOIN questions q ON q.id = ua.question_id
+    WHERE ua.attempt_id = test_attempts.id
+)
+WHERE status = 'completed' AND score IS NULL
+    AND EXISTS (
+        SELECT 1 FROM user_answers ua JOIN questions q ON q.id = ua.question_id
+        WHERE ua.attempt_id = test_attempts.id
+    )
+"""
+
+# Состояния FSM (отдельный файл FSM_DATABASE_PATH)
+CREATE_FSM_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS fsm_states (
+    key TEXT PRIMARY KEY,
+    state TEXT NULL,
+    data TEXT NOT NULL DEFAULT '{}',
+    updated_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at);
 """
 
 # Начальные данные для тестирования
@@ -0,0 +1,57 @@
+import asyncio
+import copy
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Объединение одинаковых одновременных чтений из БД
+
+    Пока запрос с ключом выполняется, повторные вызовы с тем же ключом не идут
+    в БД, а ждут его результат. Если результат достался нескольким вызовам,
+    каждый из них, включая первый, получает свою копию. Запрос выполняется
+    отдельной задачей: отмена первого вызвавшего не прерывает остальных.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Dict[str, Any]] = {}
+        self._stats = {"calls": 0, "executed": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        """Результат fetch() для ключа (одиночный вызов получает сам объект, без копии)"""
+        self._stats["calls"] += 1
+        flight = self._in_flight.get(key)
+        if flight is None:
+            self._stats["executed"] += 1
+            flight = {"task": asyncio.ensure_future(fetch()), "shared": False}
+            self._in_flight[key] = flight
+            # Колбэк добавлен раньше ожидающих: после завершения новые вызовы к запросу не присоединятся
+            flight["task"].add_done_callback(functools.partial(self._done, key, flight))
+        else:
+            self._stats["coalesced"] += 1
+            flight["shared"] = True
+
+        result = await asyncio.shield(flight["task"])
+        return copy.deepcopy(result) if flight["shared"] else result
+
+    def _done(self, key: Hashable, flight: Dict[str, Any], task: asyncio.Task):
+        """Убрать завершенный запрос (ошибка не кэшируется: следующий вызов повторит запрос)"""
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()  # Ошибку уже получили ожидающие; помечаем ее полученной
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики объединенных запросов"""
+        return dict(self._stats, in_flight=len(self._in_flight))
+
+db_reads = SingleFlight()
+
+def single_flight(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Объединять одновременные вызовы функции чтения с одинаковыми аргументами"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs) -> T:
+        key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+        return await db_reads.do(key, lambda: func(*args, **kwargs))
+    return wrapper
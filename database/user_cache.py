@@ -0,0 +1,49 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import config
+
+class UserSessionCache:
+    """Кэш пользователей (профиль и прогресс) с вытеснением давно не заходивших
+
+    Функции БД, меняющие пользователя, сбрасывают его запись. Изменения из
+    процессов-воркеров сюда не доходят, поэтому записи живут не дольше ttl,
+    а экраны, где важен актуальный прогресс, читают его мимо кэша.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._users: "OrderedDict[int, Dict]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        """Копия закэшированного пользователя (None, если записи нет или она устарела)"""
+        entry = self._users.get(user_id)
+        if entry is None or time.monotonic() - entry["cached_at"] > self.ttl:
+            self._stats["misses"] += 1
+            return None
+        self._users.move_to_end(user_id)
+        self._stats["hits"] += 1
+        return dict(entry["user"])
+
+    def put(self, user: Dict):
+        """Запомнить пользователя"""
+        self._users[user["user_id"]] = {"user": dict(user), "cached_at": time.monotonic()}
+        self._users.move_to_end(user["user_id"])
+        while len(self._users) > self.max_entries:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """Сбросить запись после изменения пользователя в БД"""
+        self._users.pop(user_id, None)
+
+    def clear(self):
+        """Сбросить все записи (после изменения прогресса многих пользователей)"""
+        self._users.clear()
+
+    def get_stats(self) -> Dict:
+        """Счетчики попаданий в кэш"""
+        return dict(self._stats, users=len(self._users))
+
+user_sessions = UserSessionCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
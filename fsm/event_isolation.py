@@ -0,0 +1,35 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Tuple
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+class ChatEventIsolation(BaseEventIsolation):
+    """Обработка апдейтов одного чата строго по очереди
+
+    Апдейты разных чатов обрабатываются параллельно, апдейты одного чата ждут
+    завершения предыдущих в порядке поступления. Блокировки чатов, которые
+    никто не ждет, сразу удаляются.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Tuple[int, int], asyncio.Lock] = {}
+        self._waiters: Dict[Tuple[int, int], int] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        chat_key = (key.bot_id, key.chat_id)
+        lock = self._locks.setdefault(chat_key, asyncio.Lock())
+        self._waiters[chat_key] = self._waiters.get(chat_key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[chat_key] -= 1
+            if not self._waiters[chat_key]:
+                del self._waiters[chat_key]
+                del self._locks[chat_key]
+
+    async def close(self) -> None:
+        self._locks.clear()
+        self._waiters.clear()
+
@@ -0,0 +1,190 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+import config
+from database.models import CREATE_FSM_TABLES_SQL
+
+logger = logging.getLogger(__name__)
+
+# Устаревшие состояния удаляются из БД не чаще раза в столько секунд
+CLEANUP_INTERVAL = 3600
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в SQLite
+
+    Состояния читаются из памяти, в БД попадают только при первом обращении
+    после запуска. Изменения копятся в памяти и пишутся одной транзакцией раз
+    в flush_interval секунд, поэтому частые update_data не добавляют запросов.
+    При остановке несохраненные изменения сбрасываются в БД.
+    """
+
+    def __init__(
+        self,
+        path: str = config.FSM_DATABASE_PATH,
+        flush_interval: float = config.FSM_FLUSH_INTERVAL,
+        max_hot: int = config.FSM_HOT_ENTRIES,
+        ttl: float = config.FSM_STATE_TTL
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_hot = max_hot
+        self.ttl = ttl
+        self._hot: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._flushing: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._last_cleanup = 0.0
+        self._closed = False
+
+    async def init(self):
+        """Создать таблицу и удалить устаревшие состояния"""
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.executescript(CREATE_FSM_TABLES_SQL)
+            await db.commit()
+        await self._cleanup()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        """Строковый ключ записи"""
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    async def _entry(self, key: StorageKey) -> Dict[str, Any]:
+        """Запись состояния из памяти (при промахе — из БД)"""
+        storage_key = self._key(key)
+        entry = self._hot.get(storage_key)
+        if entry is None:
+            entry = await self._load(storage_key)
+            # Пока читали из БД, запись могла появиться в памяти
+            entry = self._hot.setdefault(storage_key, entry)
+        elif time.time() - entry["updated_at"] > self.ttl:
+            entry.update(state=None, data={}, updated_at=time.time())
+        self._hot.move_to_end(storage_key)
+        self._evict(keep=storage_key)
+        return entry
+
+    async def _load(self, storage_key: str) -> Dict[str, Any]:
+        """Прочитать состояние из БД"""
+        async with aiosqlite.connect(self.path) as db:
+            cursor = await db.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ?",
+                (storage_key,)
+            )
+            row = await cursor.fetchone()
+        if row and time.time() - row[2] <= self.ttl:
+            return {"state": row[0], "data": json.loads(row[1]), "updated_at": row[2]}
+        return {"state": None, "data": {}, "updated_at": time.time()}
+
+    def _evict(self, keep: str):
+        """Вытеснить из памяти самые старые сохраненные в БД записи (кроме запрошенной)"""
+        if len(self._hot) <= self.max_hot:
+            return
+        for storage_key in list(self._hot):
+            if len(self._hot) <= self.max_hot:
+                break
+            if storage_key != keep and storage_key not in self._dirty and storage_key not in self._flushing:
+                del self._hot[storage_key]
+
+    async def _changed(self, storage_key: str, entry: Dict[str, Any]):
+        """Отметить запись измененной и запланировать запись в БД"""
+        entry["updated_at"] = time.time()
+        self._hot[storage_key] = entry
+        self._dirty.add(storage_key)
+        if self._closed:
+            await self.flush()  # Хранилище уже остановлено — пишем сразу
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry["state"] = state.state if isinstance(state, State) else state
+        await self._changed(self._key(key), entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key))["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry["data"] = copy.deepcopy(data)
+        await self._changed(self._key(key), entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._entry(key))["data"])
+
+    async def _flush_later(self):
+        """Записывать накопившиеся изменения раз в flush_interval, пока они есть
+        
+        Повторяет запись, если она не удалась или состояния менялись во время записи.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_cleanup >= CLEANUP_INTERVAL:
+                    await self._cleanup()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой записи состояний FSM: {e}")
+            if self._closed or not self._dirty:
+                return
+
+    async def flush(self):
+        """Записать измененные состояния в БД одной транзакцией"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys, self._dirty = self._dirty, set()
+            self._flushing = keys
+
+            upserts, deletes = [], []
+            for storage_key in keys:
+                entry = self._hot[storage_key]
+                if entry["state"] is None and not entry["data"]:
+                    deletes.append((storage_key,))
+                else:
+                    upserts.append((storage_key, entry["state"], json.dumps(entry["data"], ensure_ascii=False), entry["updated_at"]))
+
+            try:
+                async with aiosqlite.connect(self.path) as db:
+                    await db.executemany("""
+                        INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                    """, upserts)
+                    await db.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+                    await db.commit()
+            except asyncio.CancelledError:
+                self._dirty |= keys  # Запись прервана остановкой — допишет close()
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сохранения состояний FSM: {e}")
+                self._dirty |= keys  # _flush_later повторит запись
+            finally:
+                self._flushing = set()
+
+    async def _cleanup(self):
+        """Удалить из БД состояния, которые не менялись дольше ttl"""
+        self._last_cleanup = time.monotonic()
+        async with aiosqlite.connect(self.path) as db:
+            cursor = await db.execute(
+                "DELETE FROM fsm_states WHERE updated_at < ?",
+                (time.time() - self.ttl,)
+            )
+            await db.commit()
+        if cursor.rowcount:
+            logger.info(f"Удалено устаревших состояний FSM: {cursor.rowcount}")
+
+    async def close(self) -> None:
+        """Сбросить несохраненные изменения (вызывается при остановке диспетчера)"""
+        self._closed = True
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
@@ -12,4 +12,15 @@ class AdminContent(StatesGroup):
     waiting_for_video = State()
     waiting_for_pdf = State()
     waiting_for_question_text = State()
-    editing_question = State()
\ No newline at end of file
+    editing_question = State()
+    waiting_for_search = State()
+    waiting_for_import = State()
+
+class AdminUsers(StatesGroup):
+    """Состояния для поиска пользователей админом"""
+    waiting_for_query = State()
+
+class AdminBroadcast(StatesGroup):
+    """Состояния для подготовки рассылки"""
+    waiting_for_text = State()
+    confirming = State()
@@ -1,29 +1,54 @@
 import logging
 import math
+import os
+import tempfile
 from datetime import datetime
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram import Router, F, Bot
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.exceptions import TelegramBadRequest
 
 from database.db_functions import (
-    get_content_blocks, get_content_block, update_block_content,
+    get_content_block, update_block_content,
     get_users_statistics, is_maintenance_mode, toggle_maintenance_mode,
-    get_ai_analytics_data
+    get_ai_analytics_data, get_grading_tier_stats, get_appeal_stats,
+    get_broadcast, create_broadcast, finish_broadcast, count_broadcast_recipients,
+    set_broadcast_progress_message, search_content, search_users, get_user_details,
+    get_questions_for_block, get_question, add_questions, update_question, move_question,
+    delete_question, create_content_block, delete_content_block
 )
 import config
-from fsm.states import AdminContent
+from database.models import ModelTier, BroadcastStatus
+from database.single_flight import db_reads
+from fsm.states import Test, AdminContent, AdminBroadcast, AdminUsers
 from utils.keyboards import (
     get_admin_menu_keyboard, get_admin_content_keyboard, get_admin_stats_keyboard,
-    get_ai_analytics_keyboard, get_ai_blocks_keyboard, get_back_keyboard
+    get_ai_analytics_keyboard, get_ai_blocks_keyboard, get_back_keyboard,
+    get_send_queue_keyboard, get_broadcast_draft_keyboard, get_broadcast_confirm_keyboard,
+    get_broadcast_progress_keyboard, get_search_results_keyboard,
+    get_user_search_results_keyboard, get_admin_user_keyboard, get_confirm_keyboard,
+    get_admin_questions_keyboard, get_admin_question_keyboard, get_questions_back_keyboard,
+    get_block_created_keyboard
 )
 from utils.constants import MESSAGES, LIMITS
+from utils.task_registry import task_registry, ShutdownInProgress
+from middleware.send_scheduler import send_scheduler, background_priority
+from utils.message_editor import message_editor
+from utils.render_cache import render_cache, get_block_summaries
+from utils.rendering import escape, render, format_search_results, split_message, Markdown
+from utils.helpers import truncate_text, parse_questions
+from ai.regrade import start_or_resume_regrade, run_regrade, get_regrade_report, format_regrade_report
+from utils.broadcast import format_broadcast_report, start_broadcast_task
+from utils.content_io import detect_format, import_content, export_content, format_content_io_report
 
 logger = logging.getLogger(__name__)
 router = Router()
 
 # === ГЛАВНОЕ МЕНЮ АДМИН-ПАНЕЛИ ===
 
-@router.callback_query(F.data == "menu_admin")
+@router.callback_query(F.data == "menu_admin", flags={"early_answer": True})
 async def show_admin_menu(callback: CallbackQuery, is_admin: bool = False, is_super_admin: bool = False):
     """Показать главное меню админ-панели"""
     if not is_admin:
@@ -46,11 +71,11 @@ async def show_admin_menu(callback: CallbackQuery, is_admin: bool = False, is_su
 
 # === УПРАВЛЕНИЕ КОНТЕНТОМ ===
 
-@router.callback_query(F.data == "admin_content")
+@router.callback_query(F.data == "admin_content", flags={"early_answer": True})
 async def show_content_management(callback: CallbackQuery, state: FSMContext):
     """Показать управление контентом"""
     try:
-        blocks = await get_content_blocks()
+        blocks = await get_block_summaries()
         if not blocks:
             await callback.message.edit_text(
                 "⚙️ **Управление контентом**\n\nБлоки контента не найдены.",
@@ -60,15 +85,9 @@ async def show_content_management(callback: CallbackQuery, state: FSMContext):
             await callback.answer()
             return
         
-        # Показываем первый блок
-        first_block = blocks[0]
+        # Показываем первый блок (список блоков берется из общего кэша, в FSM не хранится)
         await state.set_state(AdminContent.viewing_block)
-        await state.update_data(
-            blocks=blocks,
-            current_block_index=0
-        )
-        
-        await show_content_block(callback, first_block, 1, len(blocks))
+        await show_content_block(callback, blocks, 0)
         
     except Exception as e:
         logger.error(f"Ошибка в show_content_management: {e}")
@@ -76,16 +95,14 @@ async def show_content_management(callback: CallbackQuery, state: FSMContext):
 
 @router.callback_query(F.data.startswith("content_nav_"))
 async def navigate_content_blocks(callback: CallbackQuery, state: FSMContext):
-    """Навигация между блоками контента"""
+    """Навигация между блоками контента (в callback_data — id блока)"""
     try:
-        target_index = int(callback.data.split("_")[-1]) - 1  # Приводим к 0-based индексу
-        data = await state.get_data()
-        blocks = data.get("blocks", [])
+        block_id = int(callback.data.split("_")[-1])
+        blocks = await get_block_summaries()
         
-        if 0 <= target_index < len(blocks):
-            await state.update_data(current_block_index=target_index)
-            target_block = blocks[target_index]
-            await show_content_block(callback, target_block, target_index + 1, len(blocks))
+        index = next((i for i, block in enumerate(blocks) if block["id"] == block_id), None)
+        if index is not None:
+            await show_content_block(callback, blocks, index)
         else:
             await callback.answer("Блок не найден")
         
@@ -93,23 +110,25 @@ async def navigate_content_blocks(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Ошибка в navigate_content_blocks: {e}")
         await callback.answer("Ошибка навигации")
 
-async def show_content_block(callback: CallbackQuery, block: dict, current: int, total: int):
+async def show_content_block(callback: CallbackQuery, blocks: list, index: int):
     """Показать конкретный блок для редактирования"""
     try:
+        block = blocks[index]
+        
         # Формируем превью блока
         preview_parts = []
         
-        if block["theory_text"]:
-            preview_parts.append(f"📝 Текст: {len(block['theory_text'])} символов")
+        if block["text_length"]:
+            preview_parts.append(f"📝 Текст: {block['text_length']} символов")
         else:
             preview_parts.append("📝 Текст: не задан")
         
-        if block["video_file_id"]:
+        if block["has_video"]:
             preview_parts.append("🎥 Видео: загружено")
         else:
             preview_parts.append("🎥 Видео: нет")
         
-        if block["pdf_file_id"]:
+        if block["has_pdf"]:
             preview_parts.append("📄 PDF: загружен")
         else:
             preview_parts.append("📄 PDF: нет")
@@ -118,12 +137,18 @@ async def show_content_block(callback: CallbackQuery, block: dict, current: int,
         
         await callback.message.edit_text(
             MESSAGES["admin_content"].format(
-                current=current,
-                total=total,
+                current=index + 1,
+                total=len(blocks),
                 title=block["title"],
                 preview=preview_text
             ),
-            reply_markup=get_admin_content_keyboard(block["id"], current, total),
+            reply_markup=get_admin_content_keyboard(
+                block["id"],
+                index + 1,
+                len(blocks),
+                prev_block_id=blocks[index - 1]["id"] if index > 0 else None,
+                next_block_id=blocks[index + 1]["id"] if index + 1 < len(blocks) else None
+            ),
             parse_mode="Markdown"
         )
         await callback.answer()
@@ -134,7 +159,7 @@ async def show_content_block(callback: CallbackQuery, block: dict, current: int,
 
 # === РЕДАКТИРОВАНИЕ КОНТЕНТА ===
 
-@router.callback_query(F.data.startswith("content_edit_text_"))
+@router.callback_query(F.data.startswith("content_edit_text_"), flags={"early_answer": True})
 async def edit_content_text(callback: CallbackQuery, state: FSMContext):
     """Редактировать текст блока"""
     try:
@@ -154,7 +179,7 @@ async def edit_content_text(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Ошибка в edit_content_text: {e}")
         await callback.answer("Ошибка редактирования")
 
-@router.callback_query(F.data.startswith("content_edit_video_"))
+@router.callback_query(F.data.startswith("content_edit_video_"), flags={"early_answer": True})
 async def edit_content_video(callback: CallbackQuery, state: FSMContext):
     """Редактировать видео блока"""
     try:
@@ -174,7 +199,7 @@ async def edit_content_video(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Ошибка в edit_content_video: {e}")
         await callback.answer("Ошибка редактирования")
 
-@router.callback_query(F.data.startswith("content_edit_pdf_"))
+@router.callback_query(F.data.startswith("content_edit_pdf_"), flags={"early_answer": True})
 async def edit_content_pdf(callback: CallbackQuery, state: FSMContext):
     """Редактировать PDF блока"""
     try:
@@ -210,6 +235,7 @@ async def save_content_text(message: Message, state: FSMContext):
             return
         
         await update_block_content(block_id, theory_text=message.text)
+        render_cache.invalidate()
         
         await message.answer(
             MESSAGES["admin_content_updated"],
@@ -237,6 +263,7 @@ async def save_content_video(message: Message, state: FSMContext):
             await update_block_content(block_id, video_file_id=None)
             await message.answer("✅ Видео удалено!")
         
+        render_cache.invalidate()
         await state.set_state(AdminContent.viewing_block)
         
     except Exception as e:
@@ -258,15 +285,390 @@ async def save_content_pdf(message: Message, state: FSMContext):
             await update_block_content(block_id, pdf_file_id=None)
             await message.answer("✅ PDF удален!")
         
+        render_cache.invalidate()
         await state.set_state(AdminContent.viewing_block)
         
     except Exception as e:
         logger.error(f"Ошибка в save_content_pdf: {e}")
         await message.answer(MESSAGES["error_generic"])
 
+# === ВОПРОСЫ ===
+
+async def show_block_questions(callback: CallbackQuery, block_id: int):
+    """Показать список вопросов блока"""
+    block = await get_content_block(block_id)
+    if not block:
+        await callback.answer("Блок не найден", show_alert=True)
+        return
+    
+    questions = await get_questions_for_block(block_id)
+    lines = [
+        f"{number}. {escape(truncate_text(question['question_text'], 80))}"
+        for number, question in enumerate(questions, 1)
+    ]
+    text = render(
+        "admin_questions",
+        title=block["title"],
+        questions=Markdown("\n".join(lines) or MESSAGES["admin_questions_empty"])
+    )
+    # Длинный список обрезается по целым строкам, кнопки ведут ко всем вопросам
+    text = split_message(text, LIMITS["max_message_length"])[0]
+    
+    await message_editor.show(callback.message, text, reply_markup=get_admin_questions_keyboard(block_id, questions))
+    await callback.answer()
+
+async def show_question(callback: CallbackQuery, question_id: int):
+    """Показать вопрос с действиями над ним"""
+    question = await get_question(question_id)
+    if not question:
+        await callback.answer("Вопрос не найден", show_alert=True)
+        return
+    
+    await message_editor.show(
+        callback.message,
+        render("admin_question", position=question["position"], total=question["total"], text=question["question_text"]),
+        reply_markup=get_admin_question_keyboard(question)
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("content_questions_"))
+async def show_questions(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Вопросы блока"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        await state.set_state(AdminContent.viewing_block)
+        await show_block_questions(callback, int(callback.data.split("_")[-1]))
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_questions: {e}")
+        await callback.answer("Ошибка загрузки вопросов")
+
+@router.callback_query(F.data.startswith("question_view_"))
+async def view_question(callback: CallbackQuery, is_admin: bool = False):
+    """Вопрос с действиями"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        await show_question(callback, int(callback.data.split("_")[-1]))
+        
+    except Exception as e:
+        logger.error(f"Ошибка в view_question: {e}")
+        await callback.answer("Ошибка загрузки вопроса")
+
+@router.callback_query(F.data.startswith("question_move_"))
+async def reorder_question(callback: CallbackQuery, is_admin: bool = False):
+    """Переместить вопрос выше или ниже"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        _, _, question_id, direction = callback.data.split("_")
+        question_id = int(question_id)
+        
+        if not await move_question(question_id, -1 if direction == "up" else 1):
+            await callback.answer("Двигать некуда")
+            return
+        
+        render_cache.invalidate()
+        await show_question(callback, question_id)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в reorder_question: {e}")
+        await callback.answer("Ошибка перемещения")
+
+@router.callback_query(F.data.startswith("question_edit_"))
+async def edit_question(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Запросить новый текст вопроса"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        question = await get_question(int(callback.data.split("_")[-1]))
+        if not question:
+            await callback.answer("Вопрос не найден", show_alert=True)
+            return
+        
+        await state.set_state(AdminContent.editing_question)
+        await state.update_data(editing_question_id=question["id"])
+        
+        await message_editor.show(
+            callback.message,
+            MESSAGES["send_question_text"],
+            reply_markup=get_questions_back_keyboard(question["block_id"])
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в edit_question: {e}")
+        await callback.answer("Ошибка редактирования")
+
+@router.message(AdminContent.editing_question)
+async def save_question(message: Message, state: FSMContext):
+    """Сохранить новый текст вопроса"""
+    try:
+        data = await state.get_data()
+        question_text = (message.text or "").strip()
+        
+        if not question_text or len(question_text) > LIMITS["max_question_length"]:
+            await message.answer(
+                f"❌ Пришлите текст вопроса до {LIMITS['max_question_length']} символов."
+            )
+            return
+        
+        block_id = await update_question(data["editing_question_id"], question_text)
+        if block_id is None:
+            await message.answer("❌ Вопрос уже удален.", reply_markup=get_back_keyboard("admin"))
+        else:
+            render_cache.invalidate()
+            await message.answer(MESSAGES["question_updated"], reply_markup=get_questions_back_keyboard(block_id))
+        
+        await state.set_state(AdminContent.viewing_block)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в save_question: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+@router.callback_query(F.data.startswith("questions_add_"), flags={"early_answer": True})
+async def add_questions_prompt(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Запросить новые вопросы (можно несколько сразу)"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        block_id = int(callback.data.split("_")[-1])
+        
+        await state.set_state(AdminContent.waiting_for_question_text)
+        await state.update_data(editing_block_id=block_id)
+        
+        await message_editor.show(
+            callback.message,
+            MESSAGES["send_new_questions"],
+            reply_markup=get_questions_back_keyboard(block_id)
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в add_questions_prompt: {e}")
+        await callback.answer("Ошибка")
+
+@router.message(AdminContent.waiting_for_question_text)
+async def save_new_questions(message: Message, state: FSMContext):
+    """Добавить присланные вопросы одной транзакцией"""
+    try:
+        data = await state.get_data()
+        block_id = data["editing_block_id"]
+        questions = parse_questions(message.text or "")
+        
+        if not questions:
+            await message.answer("❌ Не нашел вопросов в сообщении. Пришлите текст вопросов.")
+            return
+        
+        too_long = [number for number, text in enumerate(questions, 1) if len(text) > LIMITS["max_question_length"]]
+        if too_long:
+            await message.answer(
+                f"❌ Вопросы №{', '.join(map(str, too_long))} длиннее {LIMITS['max_question_length']} символов. "
+                f"Ничего не добавлено — пришлите список заново."
+            )
+            return
+        
+        count = await add_questions(block_id, questions)
+        render_cache.invalidate()
+        
+        await message.answer(
+            render("questions_added", count=count),
+            reply_markup=get_questions_back_keyboard(block_id)
+        )
+        await state.set_state(AdminContent.viewing_block)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в save_new_questions: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+@router.callback_query(F.data.startswith("question_delete_"))
+async def confirm_question_deletion(callback: CallbackQuery, is_admin: bool = False):
+    """Подтверждение удаления вопроса"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        question = await get_question(int(callback.data.split("_")[-1]))
+        if not question:
+            await callback.answer("Вопрос не найден", show_alert=True)
+            return
+        
+        await message_editor.show(
+            callback.message,
+            render("confirm_delete_question", text=truncate_text(question["question_text"], 300)),
+            reply_markup=get_confirm_keyboard("delete_question", question["id"])
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в confirm_question_deletion: {e}")
+        await callback.answer("Ошибка")
+
+@router.callback_query(F.data.startswith("confirm_delete_question_"))
+async def remove_question(callback: CallbackQuery, is_admin: bool = False):
+    """Удалить вопрос"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        block_id = await delete_question(int(callback.data.split("_")[-1]))
+        if block_id is None:
+            await callback.answer("Вопрос уже удален", show_alert=True)
+            return
+        
+        render_cache.invalidate()
+        await show_block_questions(callback, block_id)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в remove_question: {e}")
+        await callback.answer("Ошибка удаления")
+
+# === БЛОКИ ===
+
+@router.callback_query(F.data == "content_new_block", flags={"early_answer": True})
+async def new_block_prompt(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Запросить название нового блока"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        await state.set_state(AdminContent.waiting_for_title)
+        await message_editor.show(callback.message, MESSAGES["send_block_title"], reply_markup=get_back_keyboard("admin"))
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в new_block_prompt: {e}")
+        await callback.answer("Ошибка")
+
+@router.message(AdminContent.waiting_for_title)
+async def save_new_block(message: Message, state: FSMContext):
+    """Создать блок в конце списка"""
+    try:
+        title = (message.text or "").strip()
+        if not title or len(title) > LIMITS["max_title_length"]:
+            await message.answer(f"❌ Пришлите название до {LIMITS['max_title_length']} символов.")
+            return
+        
+        block_id = await create_content_block(title)
+        if block_id is None:
+            await message.answer("❌ Блок с таким названием уже есть. Пришлите другое название.")
+            return
+        
+        render_cache.invalidate()
+        await message.answer(
+            render("block_created", title=title),
+            reply_markup=get_block_created_keyboard(block_id),
+            parse_mode="Markdown"
+        )
+        await state.set_state(AdminContent.viewing_block)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в save_new_block: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+@router.callback_query(F.data.startswith("content_delete_"))
+async def confirm_block_deletion(callback: CallbackQuery, is_admin: bool = False):
+    """Подтверждение удаления блока"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        block = await get_content_block(int(callback.data.split("_")[-1]))
+        if not block:
+            await callback.answer("Блок не найден", show_alert=True)
+            return
+        
+        await message_editor.show(
+            callback.message,
+            render("confirm_delete_block", title=block["title"]),
+            reply_markup=get_confirm_keyboard("delete_block", block["id"])
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в confirm_block_deletion: {e}")
+        await callback.answer("Ошибка")
+
+@router.callback_query(F.data.startswith("confirm_delete_block_"))
+async def remove_block(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Удалить блок и вернуться к списку блоков"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        user_ids = await delete_content_block(int(callback.data.split("_")[-1]))
+        if user_ids is None:
+            await callback.answer("Блок уже удален", show_alert=True)
+            return
+        
+        # Тест по удаленному блоку продолжить нельзя — сбрасываем его состояние
+        for user_id in user_ids:
+            key = StorageKey(bot_id=callback.bot.id, chat_id=user_id, user_id=user_id)
+            if await state.storage.get_state(key) == Test.in_progress.state:
+                await state.storage.set_state(key, None)
+                await state.storage.set_data(key, {})
+        
+        render_cache.invalidate()
+        await show_content_management(callback, state)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в remove_block: {e}")
+        await callback.answer("Ошибка удаления")
+
+# === ПОИСК ПО КОНТЕНТУ ===
+
+@router.callback_query(F.data == "content_search", flags={"early_answer": True})
+async def start_content_search(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Запросить слова для поиска по контенту"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        await state.set_state(AdminContent.waiting_for_search)
+        await message_editor.show(callback.message, MESSAGES["admin_search_prompt"], reply_markup=get_back_keyboard("admin"))
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в start_content_search: {e}")
+        await callback.answer("Ошибка")
+
+@router.message(AdminContent.waiting_for_search)
+async def search_content_for_admin(message: Message, state: FSMContext):
+    """Найти блоки и вопросы; кнопки результатов открывают блок в редакторе"""
+    try:
+        query = (message.text or "").strip()
+        results = await search_content(query, limit=LIMITS["search_results"])
+        await message.answer(
+            format_search_results(query, results),
+            reply_markup=get_search_results_keyboard(results, for_admin=True),
+            parse_mode="Markdown"
+        )
+        await state.set_state(AdminContent.viewing_block)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в search_content_for_admin: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
 # === СТАТИСТИКА ===
 
-@router.callback_query(F.data == "admin_stats")
+@router.callback_query(F.data == "admin_stats", flags={"early_answer": True})
 async def show_statistics(callback: CallbackQuery):
     """Показать статистику пользователей"""
     try:
@@ -276,7 +678,7 @@ async def show_statistics(callback: CallbackQuery):
         logger.error(f"Ошибка в show_statistics: {e}")
         await callback.answer("Ошибка загрузки статистики")
 
-@router.callback_query(F.data.startswith("stats_page_"))
+@router.callback_query(F.data.startswith("stats_page_"), flags={"early_answer": True})
 async def navigate_stats_pages(callback: CallbackQuery):
     """Навигация по страницам статистики"""
     try:
@@ -306,8 +708,8 @@ async def show_stats_page(callback: CallbackQuery, page: int):
         stats_text = []
         
         for i, user in enumerate(users, offset + 1):
-            username = f"@{user['username']}" if user['username'] else "без username"
-            stats_text.append(f"{i}. {user['full_name']} ({username})")
+            username = f"@{escape(user['username'])}" if user['username'] else "без username"
+            stats_text.append(f"{i}. {escape(user['full_name'])} ({username})")
             stats_text.append(f"   {user['progress_text']}")
         
         total_pages = math.ceil(total / LIMITS["users_per_page"])
@@ -327,13 +729,106 @@ async def show_stats_page(callback: CallbackQuery, page: int):
         logger.error(f"Ошибка в show_stats_page: {e}")
         await callback.answer("Ошибка загрузки страницы")
 
+# === ПОИСК ПОЛЬЗОВАТЕЛЕЙ ===
+
+@router.callback_query(F.data == "stats_user_search", flags={"early_answer": True})
+async def start_user_search(callback: CallbackQuery, state: FSMContext, is_admin: bool = False):
+    """Запросить ID, username или имя пользователя"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        await state.set_state(AdminUsers.waiting_for_query)
+        await message_editor.show(callback.message, MESSAGES["admin_user_search_prompt"], reply_markup=get_back_keyboard("stats"))
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в start_user_search: {e}")
+        await callback.answer("Ошибка")
+
+@router.message(AdminUsers.waiting_for_query)
+async def find_users(message: Message, state: FSMContext):
+    """Показать найденных пользователей"""
+    try:
+        query = (message.text or "").strip()
+        users = await search_users(query, limit=LIMITS["user_search_results"])
+        
+        if users:
+            text = render("admin_user_search_results", query=query, count=len(users))
+        else:
+            text = render("admin_user_search_empty", query=query)
+        await message.answer(text, reply_markup=get_user_search_results_keyboard(users), parse_mode="Markdown")
+        await state.clear()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в find_users: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+@router.callback_query(F.data.startswith("admin_user_"))
+async def show_user_details(callback: CallbackQuery, is_admin: bool = False):
+    """Карточка пользователя: итоги по блокам, последние попытки и ответы"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        user_id = int(callback.data.split("_")[-1])
+        user = await get_user_details(user_id, recent=LIMITS["user_recent_items"])
+        if not user:
+            await callback.answer("Пользователь не найден", show_alert=True)
+            return
+        
+        username = f"@{escape(user['username'])}" if user["username"] else "без username"
+        lines = [
+            f"👤 **{escape(user['full_name'])}** ({username})",
+            f"🆔 `{user['user_id']}` • с {user['created_at'][:10]}" + (" • 🚫 заблокировал бота" if user["is_blocked"] else ""),
+            f"📈 Пройдено блоков по порядку: {user['last_completed_block_order']}",
+            "",
+            "📚 **Блоки:**"
+        ]
+        lines.extend(
+            f"{'✅' if block['passed'] else '▫️'} {escape(block['title'])}: "
+            f"лучший {block['best_score']:.0%}, попыток {block['attempts']}"
+            for block in user["blocks"]
+        )
+        if not user["blocks"]:
+            lines.append("Тесты еще не завершались")
+        
+        lines.extend(["", "🕒 **Последние попытки:**"])
+        lines.extend(
+            f"• {attempt['attempt_timestamp'][:16]} {escape(attempt['block_title'])} — "
+            + (f"{attempt['score']:.0%}" if attempt["score"] is not None else escape(attempt["status"]))
+            for attempt in user["recent_attempts"]
+        )
+        if not user["recent_attempts"]:
+            lines.append("Нет попыток")
+        
+        lines.extend(["", "💬 **Последние ответы:**"])
+        for answer in user["recent_answers"]:
+            verdict = {1: "✅", 0: "❌"}.get(answer["is_sufficient"], "⏳")
+            lines.append(
+                f"{verdict} {escape(truncate_text(answer['question_text'], 60))}\n"
+                f"   {escape(truncate_text(answer['answer_text'], 120))}"
+            )
+        if not user["recent_answers"]:
+            lines.append("Нет ответов")
+        
+        await message_editor.show(callback.message, "\n".join(lines), reply_markup=get_admin_user_keyboard())
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_user_details: {e}")
+        await callback.answer("Ошибка загрузки пользователя")
+
 # === АНАЛИТИКА ИИ ===
 
-@router.callback_query(F.data == "admin_ai_analytics")
+@router.callback_query(F.data == "admin_ai_analytics", flags={"early_answer": True})
 async def show_ai_analytics(callback: CallbackQuery):
     """Показать основную аналитику ИИ"""
     try:
         analytics = await get_ai_analytics_data()
+        appeals = await get_appeal_stats()
         
         total_feedback = analytics['positive_ratings'] + analytics['negative_ratings']
         feedback_rate = (analytics['positive_ratings'] / total_feedback * 100) if total_feedback > 0 else 0
@@ -349,14 +844,16 @@ async def show_ai_analytics(callback: CallbackQuery):
             f"• 👎 Отрицательные: {analytics['negative_ratings']}\n"
             f"• 🤷 Без оценки: {analytics['no_ratings']}\n"
             f"• 📈 Удовлетворенность: {feedback_rate:.1f}%\n\n"
+            "⚖️ **Апелляции:**\n"
+            f"• Всего: {appeals['total']} (в очереди: {appeals['pending']})\n"
+            f"• ✅ Удовлетворено: {appeals['overturned']}\n"
+            f"• ❌ Отклонено: {appeals['upheld']}\n"
+            f"• 🔄 Доля измененных вердиктов: {appeals['overturn_rate']:.1f}%\n\n"
             f"📅 **Обновлено:** {analytics['last_updated']}"
         )
         
-        await callback.message.edit_text(
-            analytics_text,
-            reply_markup=get_ai_analytics_keyboard(),
-            parse_mode="Markdown"
-        )
+        # Кнопка «Обновить» без новых данных не должна давать ошибку «message is not modified»
+        await message_editor.show(callback.message, analytics_text, reply_markup=get_ai_analytics_keyboard())
         await callback.answer()
         
     except Exception as e:
@@ -421,7 +918,7 @@ async def show_blocks_analytics(callback: CallbackQuery):
         logger.error(f"Ошибка в show_blocks_analytics: {e}")
         await callback.answer("Ошибка загрузки данных")
 
-@router.callback_query(F.data == "ai_analytics_best")
+@router.callback_query(F.data == "ai_analytics_best", flags={"early_answer": True})
 async def show_best_feedback(callback: CallbackQuery):
     """Показать блоки с лучшими оценками"""
     try:
@@ -450,7 +947,7 @@ async def show_best_feedback(callback: CallbackQuery):
         logger.error(f"Ошибка в show_best_feedback: {e}")
         await callback.answer("Ошибка загрузки данных")
 
-@router.callback_query(F.data == "ai_analytics_worst")
+@router.callback_query(F.data == "ai_analytics_worst", flags={"early_answer": True})
 async def show_worst_feedback(callback: CallbackQuery):
     """Показать блоки с худшими оценками"""
     try:
@@ -484,6 +981,362 @@ async def show_worst_feedback(callback: CallbackQuery):
         logger.error(f"Ошибка в show_worst_feedback: {e}")
         await callback.answer("Ошибка загрузки данных")
 
+@router.callback_query(F.data == "ai_analytics_tiers", flags={"early_answer": True})
+async def show_tiers_analytics(callback: CallbackQuery):
+    """Показать статистику уровней моделей проверки"""
+    try:
+        tiers = await get_grading_tier_stats()
+        
+        tiers_text = ["⚡ **Модели проверки ответов:**\n"]
+        tier_names = {ModelTier.FAST: "🐇 Быстрая", ModelTier.STRONG: "🦉 Сильная"}
+        
+        for tier in tiers:
+            tiers_text.append(f"{tier_names.get(tier['tier'], tier['tier'])}: **{tier['model']}**")
+            tiers_text.append(f"• Вызовов: {tier['calls']}")
+            tiers_text.append(f"• Задержка: ср. {tier['avg_latency_ms']:.0f} мс, макс. {tier['max_latency_ms']} мс")
+            tiers_text.append(f"• Токены: {tier['prompt_tokens']} вход / {tier['completion_tokens']} выход")
+            tiers_text.append(f"• Стоимость: ${tier['cost_usd']:.4f}")
+            if tier["tier"] == ModelTier.FAST:
+                tiers_text.append(f"• Эскалаций: {tier['escalated']} ({tier['escalation_rate']:.1f}%)")
+            tiers_text.append("")
+        
+        if not tiers:
+            tiers_text.append("Пока нет данных о проверках.")
+        
+        await callback.message.edit_text(
+            "\n".join(tiers_text),
+            reply_markup=get_ai_blocks_keyboard(),
+            parse_mode="Markdown"
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_tiers_analytics: {e}")
+        await callback.answer("Ошибка загрузки данных")
+
+# === ИМПОРТ И ЭКСПОРТ КОНТЕНТА ===
+
+@router.message(Command("export_content"))
+async def cmd_export_content(message: Message, command: CommandObject, is_admin: bool = False):
+    """Выгрузить блоки и вопросы файлом (/export_content [jsonl|csv])"""
+    if not is_admin:
+        await message.answer(MESSAGES["no_access"])
+        return
+    
+    fmt = (command.args or "jsonl").strip().lower()
+    if fmt not in ("jsonl", "csv"):
+        await message.answer("❌ Формат: /export_content jsonl или /export_content csv")
+        return
+    
+    path = None
+    try:
+        # Файл пишется на диск порциями и отправляется оттуда, курс целиком в памяти не держим
+        with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as file:
+            path = file.name
+        report = await task_registry.run(export_content(path, fmt), kind="content_io")
+        
+        await message.answer_document(
+            FSInputFile(path, filename=f"content_{datetime.now():%Y%m%d_%H%M}.{fmt}"),
+            caption=format_content_io_report(report)
+        )
+        
+    except ShutdownInProgress:
+        await message.answer("🔄 Бот перезапускается. Повторите команду позже.")
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_export_content: {e}")
+        await message.answer(MESSAGES["error_generic"])
+    finally:
+        if path:
+            os.remove(path)
+
+@router.message(Command("import_content"))
+async def cmd_import_content(message: Message, state: FSMContext, is_admin: bool = False):
+    """Запросить файл для импорта контента (/import_content)"""
+    if not is_admin:
+        await message.answer(MESSAGES["no_access"])
+        return
+    
+    await state.set_state(AdminContent.waiting_for_import)
+    await message.answer(MESSAGES["send_import_file"], reply_markup=get_back_keyboard("admin"), parse_mode="Markdown")
+
+@router.message(AdminContent.waiting_for_import, F.document)
+async def save_import_file(message: Message, state: FSMContext, bot: Bot):
+    """Импортировать присланный файл порциями и показать отчет"""
+    path = None
+    try:
+        try:
+            fmt = detect_format(message.document.file_name or "")
+        except ValueError as e:
+            await message.answer(f"❌ {e}")
+            return
+        
+        with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as file:
+            path = file.name
+        await bot.download(message.document, destination=path)
+        
+        status_message = await message.answer("⏳ Импортирую...")
+        report = await task_registry.run(import_content(path, fmt), kind="content_io")
+        render_cache.invalidate()
+        
+        await message_editor.show(status_message, format_content_io_report(report), parse_mode=None)
+        await state.clear()
+        
+    except ShutdownInProgress:
+        await message.answer("🔄 Бот перезапускается. Пришлите файл еще раз позже.")
+    except Exception as e:
+        logger.error(f"Ошибка в save_import_file: {e}")
+        await message.answer(MESSAGES["error_generic"])
+    finally:
+        if path:
+            os.remove(path)
+
+@router.message(AdminContent.waiting_for_import)
+async def import_file_expected(message: Message):
+    """В ожидании импорта пришел не файл"""
+    await message.answer("📎 Пришлите файл .jsonl или .csv документом.", reply_markup=get_back_keyboard("admin"))
+
+# === ПЕРЕПРОВЕРКА ОТВЕТОВ ===
+
+@router.message(Command("regrade"))
+async def cmd_regrade(message: Message, bot: Bot, is_super_admin: bool = False):
+    """Запустить или продолжить массовую перепроверку ответов (/regrade)"""
+    if not is_super_admin:
+        await message.answer(MESSAGES["no_access"])
+        return
+    
+    try:
+        if task_registry.in_flight("regrade"):
+            await message.answer("⏳ Перепроверка уже выполняется. Статус: /regrade_status")
+            return
+        
+        run_id = await start_or_resume_regrade()
+        status_message = await message.answer(f"♻️ Перепроверка #{run_id} запущена...")
+        
+        async def show_progress(report: dict):
+            try:
+                await bot.edit_message_text(
+                    format_regrade_report(report),
+                    chat_id=status_message.chat.id,
+                    message_id=status_message.message_id,
+                    parse_mode="Markdown"
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось обновить прогресс перепроверки: {e}")
+        
+        async def regrade_and_report():
+            with background_priority():
+                try:
+                    report = await run_regrade(run_id, on_progress=show_progress)
+                    await message.answer(format_regrade_report(report), parse_mode="Markdown")
+                except Exception as e:
+                    logger.error(f"Ошибка перепроверки #{run_id}: {e}")
+                    await message.answer(f"❌ Перепроверка #{run_id} прервана. Повторите /regrade для продолжения.")
+        
+        # Прогрессом прогона служит контрольная точка в БД, отдельный checkpoint не нужен
+        task_registry.spawn(regrade_and_report(), kind="regrade")
+        
+    except ShutdownInProgress:
+        await message.answer("🔄 Бот перезапускается. Повторите команду позже.")
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_regrade: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+@router.message(Command("regrade_status"))
+async def cmd_regrade_status(message: Message, is_super_admin: bool = False):
+    """Показать состояние последней перепроверки (/regrade_status)"""
+    if not is_super_admin:
+        await message.answer(MESSAGES["no_access"])
+        return
+    
+    try:
+        report = await get_regrade_report()
+        if not report:
+            await message.answer("♻️ Перепроверок еще не было. Запустить: /regrade")
+            return
+        
+        await message.answer(format_regrade_report(report), parse_mode="Markdown")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_regrade_status: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+# === ОЧЕРЕДЬ ОТПРАВКИ ===
+
+@router.callback_query(F.data == "admin_send_queue", flags={"early_answer": True})
+async def show_send_queue(callback: CallbackQuery, is_admin: bool = False):
+    """Показать метрики очереди исходящих сообщений"""
+    if not is_admin:
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    try:
+        stats = send_scheduler.get_stats()
+        edits = message_editor.get_stats()
+        reads = db_reads.get_stats()
+        
+        queue_text = (
+            f"📤 **Очередь отправки** (процесс бота)\n\n"
+            f"⏳ В очереди: {stats['queued_interactive']} интерактивных, "
+            f"{stats['queued_background']} фоновых\n"
+            f"✅ Отправлено: {stats['sent']}\n"
+            f"🔁 Повторов после flood control: {stats['retried']}\n"
+            f"❌ Не отправлено после повторов: {stats['failed']}\n\n"
+            f"⏱️ **Ожидание в очереди:**\n"
+            f"• Интерактивные: ср. {stats['avg_wait_interactive_ms']:.0f} мс\n"
+            f"• Фоновые: ср. {stats['avg_wait_background_ms']:.0f} мс\n"
+            f"• Максимум: {stats['max_wait_ms']:.0f} мс\n\n"
+            f"🚦 Лимит процесса: {stats['global_rate']:.1f} сообщ./с, чатов под контролем: {stats['tracked_chats']}\n\n"
+            f"✏️ **Правки сообщений:**\n"
+            f"• Отправлено: {edits['edited']}, заменено новыми: {edits['replaced']}\n"
+            f"• Пропущено без изменений: {edits['skipped']}, объединено: {edits['coalesced']}\n\n"
+            f"🗄️ **Чтения из БД:**\n"
+            f"• Вызовов: {reads['calls']}, запросов выполнено: {reads['executed']}\n"
+            f"• Объединено с одновременными: {reads['coalesced']}"
+        )
+        
+        await message_editor.show(callback.message, queue_text, reply_markup=get_send_queue_keyboard())
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_send_queue: {e}")
+        await callback.answer("Ошибка загрузки данных")
+
+# === РАССЫЛКИ ===
+
+@router.callback_query(F.data == "admin_broadcast")
+async def start_broadcast_draft(callback: CallbackQuery, state: FSMContext, is_super_admin: bool = False):
+    """Начать подготовку рассылки (или показать выполняющуюся)"""
+    if not is_super_admin:
+        await callback.answer("❌ Недостаточно прав", show_alert=True)
+        return
+    
+    try:
+        last_broadcast = await get_broadcast()
+        if last_broadcast and last_broadcast["status"] == BroadcastStatus.RUNNING:
+            await message_editor.show(
+                callback.message,
+                format_broadcast_report(last_broadcast) + "\n\nНовую рассылку можно начать после завершения текущей.",
+                reply_markup=get_broadcast_progress_keyboard(last_broadcast["broadcast_id"])
+            )
+            await callback.answer()
+            return
+        
+        await state.set_state(AdminBroadcast.waiting_for_text)
+        await message_editor.show(
+            callback.message,
+            MESSAGES["broadcast_prompt"],
+            reply_markup=get_broadcast_draft_keyboard()
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в start_broadcast_draft: {e}")
+        await callback.answer("Ошибка подготовки рассылки")
+
+@router.message(AdminBroadcast.waiting_for_text)
+async def preview_broadcast(message: Message, state: FSMContext):
+    """Показать предпросмотр рассылки и запросить подтверждение"""
+    try:
+        if not message.text:
+            await message.answer("📝 Рассылка поддерживает только текст. Пришлите текст сообщения.")
+            return
+        
+        if len(message.text) > LIMITS["max_message_length"]:
+            await message.answer(
+                f"❌ Текст слишком длинный. Максимум {LIMITS['max_message_length']} символов."
+            )
+            return
+        
+        # Предпросмотр заодно проверяет, что Telegram принимает разметку
+        try:
+            await message.answer(message.text, parse_mode="Markdown")
+        except TelegramBadRequest as e:
+            await message.answer(f"❌ Ошибка разметки Markdown: {e.message}\n\nИсправьте текст и пришлите снова.")
+            return
+        
+        recipients = await count_broadcast_recipients()
+        await state.update_data(broadcast_text=message.text)
+        await state.set_state(AdminBroadcast.confirming)
+        
+        await message.answer(
+            MESSAGES["broadcast_confirm"].format(recipients=recipients),
+            reply_markup=get_broadcast_confirm_keyboard(recipients),
+            parse_mode="Markdown"
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в preview_broadcast: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+@router.callback_query(AdminBroadcast.confirming, F.data == "broadcast_confirm")
+async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot, is_super_admin: bool = False):
+    """Запустить подтвержденную рассылку"""
+    if not is_super_admin:
+        await callback.answer("❌ Недостаточно прав", show_alert=True)
+        return
+    
+    try:
+        data = await state.get_data()
+        await state.clear()
+        
+        last_broadcast = await get_broadcast()
+        if last_broadcast and last_broadcast["status"] == BroadcastStatus.RUNNING:
+            await callback.answer("⏳ Уже выполняется другая рассылка", show_alert=True)
+            return
+        
+        broadcast_id = await create_broadcast(callback.from_user.id, data["broadcast_text"])
+        progress_message = await message_editor.show(
+            callback.message,
+            MESSAGES["broadcast_started"].format(broadcast_id=broadcast_id),
+            reply_markup=get_broadcast_progress_keyboard(broadcast_id)
+        )
+        await set_broadcast_progress_message(broadcast_id, progress_message.chat.id, progress_message.message_id)
+        
+        try:
+            start_broadcast_task(bot, broadcast_id)
+            await callback.answer("📣 Рассылка запущена")
+        except ShutdownInProgress:
+            # Рассылка уже сохранена и продолжится после перезапуска
+            await callback.answer("🔄 Бот перезапускается — рассылка начнется после запуска", show_alert=True)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в confirm_broadcast: {e}")
+        await callback.answer("Ошибка запуска рассылки")
+
+@router.callback_query(F.data == "broadcast_discard", flags={"early_answer": True})
+async def discard_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Отменить подготовку рассылки"""
+    try:
+        await state.clear()
+        await message_editor.show(
+            callback.message,
+            "📣 Рассылка отменена.",
+            reply_markup=get_back_keyboard("admin")
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в discard_broadcast: {e}")
+        await callback.answer("Ошибка")
+
+@router.callback_query(F.data.startswith("broadcast_stop_"))
+async def stop_broadcast(callback: CallbackQuery, is_super_admin: bool = False):
+    """Остановить выполняющуюся рассылку"""
+    if not is_super_admin:
+        await callback.answer("❌ Недостаточно прав", show_alert=True)
+        return
+    
+    try:
+        broadcast_id = int(callback.data.split("_")[-1])
+        if await finish_broadcast(broadcast_id, BroadcastStatus.CANCELLED):
+            await callback.answer("⛔ Рассылка будет остановлена после текущей порции", show_alert=True)
+        else:
+            await callback.answer("Рассылка уже завершена", show_alert=True)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в stop_broadcast: {e}")
+        await callback.answer("Ошибка остановки рассылки")
+
 # === НАСТРОЙКИ ===
 
 @router.callback_query(F.data == "admin_maintenance")
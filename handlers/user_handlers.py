@@ -1,26 +1,34 @@
 import logging
+from datetime import datetime
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InputFile
-from aiogram.exceptions import TelegramBadRequest 
 
 from database.db_functions import (
-    get_or_create_user, get_content_blocks, get_content_block,
-    get_questions_for_block, create_test_attempt, get_active_test_attempt,
+    get_or_create_user, get_content_blocks,
+    create_test_attempt, get_active_test_attempt,
     save_user_answer, get_answered_questions_count, save_feedback_rating,
-    cancel_test_attempt
+    cancel_test_attempt, create_answer_appeal, fail_answer_appeal, get_user_block_progress,
+    get_results_history, get_attempt_report, search_content
 )
 from fsm.states import Test
 from utils.keyboards import (
-    get_main_menu_keyboard, get_theory_menu_keyboard, get_theory_view_keyboard,
     get_tests_menu_keyboard, get_test_feedback_keyboard, get_back_keyboard,
-    get_active_test_keyboard, get_test_in_progress_keyboard
+    get_active_test_keyboard, get_test_in_progress_keyboard,
+    get_results_keyboard, get_result_report_keyboard, get_search_results_keyboard
 )
-from utils.constants import MESSAGES, EMOJI
+from utils.constants import MESSAGES, EMOJI, LIMITS
 from ai.ai_processor import transcribe_voice
-from ai.background_tasks import create_background_task
+from ai.background_tasks import schedule_ai_analysis, schedule_appeal
+from utils.task_registry import task_registry, ShutdownInProgress
+from utils.message_editor import message_editor
+from utils.render_cache import (
+    render_main_menu, render_theory_menu, render_tests_menu, render_theory_view,
+    get_block_questions, get_question_text
+)
+from utils.rendering import render, content, paginate, Markdown, format_search_results
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -39,9 +47,10 @@ async def cmd_start(message: Message, is_admin: bool = False):
         )
         
         # Отправляем главное меню
+        screen = await render_main_menu(is_admin)
         await message.answer(
-            MESSAGES["main_menu"].format(name=message.from_user.full_name),
-            reply_markup=get_main_menu_keyboard(is_admin=is_admin),
+            render("main_menu", name=message.from_user.full_name),
+            reply_markup=screen["reply_markup"],
             parse_mode="Markdown"
         )
         
@@ -49,119 +58,64 @@ async def cmd_start(message: Message, is_admin: bool = False):
         logger.error(f"Ошибка в cmd_start: {e}")
         await message.answer(MESSAGES["error_generic"])
 
-@router.callback_query(F.data == "menu_main")
+@router.callback_query(F.data == "menu_main", flags={"early_answer": True})
 async def show_main_menu(callback: CallbackQuery, is_admin: bool = False):
     """Показать главное меню"""
     try:
-        # Всегда отправляем новое сообщение для главного меню
-        await callback.message.delete()
-        await callback.message.answer(
-            MESSAGES["main_menu"].format(name=callback.from_user.full_name),
-            reply_markup=get_main_menu_keyboard(is_admin=is_admin),
-            parse_mode="Markdown"
+        screen = await render_main_menu(is_admin)
+        await message_editor.show(
+            callback.message,
+            render("main_menu", name=callback.from_user.full_name),
+            reply_markup=screen["reply_markup"]
         )
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Ошибка в show_main_menu: {e}")
-        # Если не удалось удалить, пробуем редактировать
-        try:
-            await callback.message.edit_text(
-                MESSAGES["main_menu"].format(name=callback.from_user.full_name),
-                reply_markup=get_main_menu_keyboard(is_admin=is_admin),
-                parse_mode="Markdown"
-            )
-            await callback.answer()
-        except Exception:
-            await callback.answer("Ошибка загрузки меню")
-
-# === ТЕОРИЯ ===
+        await callback.answer("Ошибка загрузки меню")
 
-@router.callback_query(F.data == "menu_theory")
+@router.callback_query(F.data == "menu_theory", flags={"early_answer": True})
 async def show_theory_menu(callback: CallbackQuery):
     """Показать меню теории"""
     try:
-        blocks = await get_content_blocks()
-        
-        if not blocks:
-            message_text = "📚 **Теория**\n\nБлоки теории пока не добавлены."
-            keyboard = get_back_keyboard("main")
-        else:
-            message_text = MESSAGES["theory_menu"]
-            keyboard = get_theory_menu_keyboard(blocks)
-        
-        # Всегда отправляем новое сообщение для меню теории
-        await callback.message.delete()
-        await callback.message.answer(
-            message_text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
+        screen = await render_theory_menu()
+        await message_editor.show(callback.message, screen["text"], reply_markup=screen["reply_markup"])
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Ошибка в show_theory_menu: {e}")
-        # Если не удалось удалить, пробуем редактировать
-        try:
-            blocks = await get_content_blocks()
-            if not blocks:
-                await callback.message.edit_text(
-                    "📚 **Теория**\n\nБлоки теории пока не добавлены.",
-                    reply_markup=get_back_keyboard("main"),
-                    parse_mode="Markdown"
-                )
-            else:
-                await callback.message.edit_text(
-                    MESSAGES["theory_menu"],
-                    reply_markup=get_theory_menu_keyboard(blocks),
-                    parse_mode="Markdown"
-                )
-            await callback.answer()
-        except Exception:
-            await callback.answer("Ошибка загрузки теории")
+        await callback.answer("Ошибка загрузки теории")
 
 @router.callback_query(F.data.startswith("theory_view_"))
 async def view_theory(callback: CallbackQuery, state: FSMContext):
     """Просмотр конкретного блока теории (текст + медиа в одном сообщении)"""
     try:
         block_id = int(callback.data.split("_")[-1])
-        block = await get_content_block(block_id)
+        screen = await render_theory_view(block_id)
 
-        if not block:
+        if not screen:
             await callback.answer("Блок не найден", show_alert=True)
             return
 
-        # Подготавливаем содержимое блока
-        text_part = block["theory_text"] or "Материалы для этого блока пока не загружены."
-        
-        # Ограничиваем длину caption (лимит Telegram - 1024 символа)
-        max_caption_length = 950  # Оставляем место для заголовка
-        if len(text_part) > max_caption_length:
-            text_part = text_part[:max_caption_length] + "..."
-        
-        caption = MESSAGES["theory_block"].format(
-            title=block["title"],
-            content=text_part
-        )
+        caption = screen["text"]
+        keyboard = screen["reply_markup"]
 
         # Удаляем предыдущее сообщение
         await callback.message.delete()
         
         # Определяем тип контента и отправляем соответствующее сообщение
-        keyboard = get_theory_view_keyboard(block_id)
-        
-        if block["video_file_id"]:
+        if screen["video_file_id"]:
             # Отправляем видео с текстом в caption
             new_message = await callback.message.answer_video(
-                video=block["video_file_id"],
+                video=screen["video_file_id"],
                 caption=caption,
                 reply_markup=keyboard,
                 parse_mode="Markdown"
             )
-        elif block["pdf_file_id"]:
+        elif screen["pdf_file_id"]:
             # Отправляем PDF с текстом в caption
             new_message = await callback.message.answer_document(
-                document=block["pdf_file_id"],
+                document=screen["pdf_file_id"],
                 caption=caption,
                 reply_markup=keyboard,
                 parse_mode="Markdown"
@@ -177,7 +131,7 @@ async def view_theory(callback: CallbackQuery, state: FSMContext):
         # Сохраняем информацию о сообщении в состоянии для корректной навигации
         await state.update_data(
             last_theory_message_id=new_message.message_id,
-            last_theory_message_type="media" if (block["video_file_id"] or block["pdf_file_id"]) else "text"
+            last_theory_message_type="media" if (screen["video_file_id"] or screen["pdf_file_id"]) else "text"
         )
         
         await callback.answer()
@@ -186,29 +140,42 @@ async def view_theory(callback: CallbackQuery, state: FSMContext):
         logger.error(f"Ошибка в view_theory: {e}")
         await callback.answer("Ошибка загрузки блока")
 
-@router.callback_query(F.data == "menu_theory_back")
+@router.callback_query(F.data == "theory_page_current", flags={"early_answer": True})
+async def theory_page_current(callback: CallbackQuery):
+    """Нажатие на номер страницы теории"""
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("theory_page_"))
+async def turn_theory_page(callback: CallbackQuery):
+    """Перелистнуть страницу теории правкой того же сообщения"""
+    try:
+        _, _, block_id, page = callback.data.split("_")
+        screen = await render_theory_view(int(block_id), int(page))
+
+        if not screen:
+            await callback.answer("Страница не найдена", show_alert=True)
+            return
+
+        # У сообщения с видео или PDF правится подпись, медиа остается
+        await message_editor.show(
+            callback.message,
+            screen["text"],
+            reply_markup=screen["reply_markup"],
+            keep_media=True
+        )
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Ошибка в turn_theory_page: {e}")
+        await callback.answer("Ошибка загрузки страницы")
+
+@router.callback_query(F.data == "menu_theory_back", flags={"early_answer": True})
 async def back_to_theory_menu(callback: CallbackQuery, state: FSMContext):
     """Вернуться в меню теории"""
     try:
-        # Получаем блоки теории
-        blocks = await get_content_blocks()
-        
-        # Удаляем текущее сообщение (неважно какого типа)
-        await callback.message.delete()
-        
-        # Отправляем новое сообщение с меню теории
-        if not blocks:
-            await callback.message.answer(
-                "📚 **Теория**\n\nБлоки теории пока не добавлены.",
-                reply_markup=get_back_keyboard("main"),
-                parse_mode="Markdown"
-            )
-        else:
-            await callback.message.answer(
-                MESSAGES["theory_menu"],
-                reply_markup=get_tests_menu_keyboard(blocks),
-                parse_mode="Markdown"
-            )
+        # Текущее сообщение может быть медиа — тогда оно будет заменено
+        screen = await render_theory_menu()
+        await message_editor.show(callback.message, screen["text"], reply_markup=screen["reply_markup"])
         
         # Очищаем данные состояния
         await state.update_data(
@@ -224,33 +191,21 @@ async def back_to_theory_menu(callback: CallbackQuery, state: FSMContext):
 
 # === ТЕСТЫ ===
 
-@router.callback_query(F.data == "menu_tests")
+@router.callback_query(F.data == "menu_tests", flags={"early_answer": True})
 async def show_tests_menu(callback: CallbackQuery):
     """Показать меню тестов"""
     try:
-        # Получаем пользователя и его прогресс
+        # Получаем пользователя и его прогресс (из БД: тест мог завершить воркер проверки)
         user = await get_or_create_user(
             user_id=callback.from_user.id,
             username=callback.from_user.username,
-            full_name=callback.from_user.full_name
+            full_name=callback.from_user.full_name,
+            fresh=True
         )
         
-        blocks = await get_content_blocks()
-        
-        if not blocks:
-            await callback.message.edit_text(
-                "📝 **Тесты**\n\nТесты пока не добавлены.",
-                reply_markup=get_back_keyboard("main"),
-                parse_mode="Markdown"
-            )
-            await callback.answer()
-            return
-        
-        await callback.message.edit_text(
-            MESSAGES["tests_menu"],
-            reply_markup=get_tests_menu_keyboard(blocks, user["last_completed_block_order"]),
-            parse_mode="Markdown"
-        )
+        block_results = await get_user_block_progress(callback.from_user.id)
+        screen = await render_tests_menu(user["last_completed_block_order"], block_results)
+        await message_editor.show(callback.message, screen["text"], reply_markup=screen["reply_markup"])
         await callback.answer()
         
     except Exception as e:
@@ -282,25 +237,8 @@ async def start_test(callback: CallbackQuery, state: FSMContext, bot: Bot):
             )
             keyboard = get_active_test_keyboard(active_test)
 
-            # Безопасное обновление сообщения: пытаемся отредактировать,
-            # при неудаче (медиа-сообщение) — удаляем и отправляем заново.
-            try:
-                await callback.message.edit_text(
-                    message_text,
-                    reply_markup=keyboard,
-                    parse_mode="Markdown"
-                )
-            except TelegramBadRequest:
-                # Нельзя редактировать сообщение (скорее всего содержит медиа)
-                try:
-                    await callback.message.delete()
-                except Exception:
-                    pass
-                await callback.message.answer(
-                    message_text,
-                    reply_markup=keyboard,
-                    parse_mode="Markdown"
-                )
+            # Медиа-сообщение (теория с видео/PDF) будет заменено текстовым
+            await message_editor.show(callback.message, message_text, reply_markup=keyboard)
 
             await callback.answer()
             return
@@ -318,37 +256,40 @@ async def start_new_test(callback: CallbackQuery, state: FSMContext, bot: Bot, b
         user_id = callback.from_user.id
         
         # Получаем вопросы
-        questions = await get_questions_for_block(block_id)
+        questions = await get_block_questions(block_id)
         if not questions:
             await callback.answer("Вопросы не найдены", show_alert=True)
             return
         
-        # Создаем попытку
+        # Создаем попытку (активная попытка может уже появиться от повторного нажатия)
         attempt_id = await create_test_attempt(user_id, block_id)
+        if attempt_id is None:
+            await callback.answer(MESSAGES["test_already_active"])
+            return
+        
+        # Показываем первый вопрос (медиа-сообщение будет заменено)
+        first_question = questions[0]
+        test_message = await message_editor.show(
+            callback.message,
+            render("test_started",
+                current=1,
+                total=len(questions),
+                question=content(first_question["question_text"])
+            ),
+            reply_markup=get_test_in_progress_keyboard()
+        )
         
         # Устанавливаем FSM
         await state.set_state(Test.in_progress)
         await state.update_data(
             attempt_id=attempt_id,
             block_id=block_id,
-            questions=questions,
+            question_ids=[question["id"] for question in questions],
             current_question_index=0,
-            test_message_id=callback.message.message_id,
+            test_message_id=test_message.message_id,
             pending_test_block_id=None  # Очищаем pending test
         )
         
-        # Показываем первый вопрос
-        first_question = questions[0]
-        await callback.message.edit_text(
-            MESSAGES["test_started"].format(
-                current=1,
-                total=len(questions),
-                question=first_question["question_text"]
-            ),
-            reply_markup=get_test_in_progress_keyboard(),
-            parse_mode="Markdown"
-        )
-        
         await callback.answer("Тест начался! Отвечайте текстом или голосом.")
         
     except Exception as e:
@@ -369,16 +310,14 @@ async def continue_test_callback(callback: CallbackQuery, state: FSMContext, bot
         attempt_id = active_test["attempt_id"]
         block_id = active_test["block_id"]
         
-        questions = await get_questions_for_block(block_id)
+        questions = await get_block_questions(block_id)
         answered_count = await get_answered_questions_count(attempt_id)
         
         if answered_count >= len(questions):
-            # Удаляем текущее сообщение и отправляем новое
-            await callback.message.delete()
-            await callback.message.answer(
+            await message_editor.show(
+                callback.message,
                 "❓ Вы уже ответили на все вопросы. Ожидайте результаты.",
-                reply_markup=get_back_keyboard("tests"),
-                parse_mode="Markdown"
+                reply_markup=get_back_keyboard("tests")
             )
             await callback.answer()
             return
@@ -388,26 +327,23 @@ async def continue_test_callback(callback: CallbackQuery, state: FSMContext, bot
         await state.update_data(
             attempt_id=attempt_id,
             block_id=block_id,
-            questions=questions,
+            question_ids=[question["id"] for question in questions],
             current_question_index=answered_count
         )
         
         # Показываем следующий вопрос
         next_question = questions[answered_count]
         
-        # Удаляем текущее сообщение (которое может содержать медиа)
-        await callback.message.delete()
-        
-        # Отправляем новое сообщение с тестом
-        new_message = await callback.message.answer(
-            MESSAGES["test_continued"].format(title=active_test["block_title"]) +
-            MESSAGES["test_next_question"].format(
+        # Текущее сообщение может содержать медиа — тогда оно будет заменено
+        new_message = await message_editor.show(
+            callback.message,
+            render("test_continued", title=content(active_test["block_title"])) +
+            render("test_next_question",
                 current=answered_count + 1,
                 total=len(questions),
-                question=next_question["question_text"]
+                question=content(next_question["question_text"])
             ),
-            reply_markup=get_test_in_progress_keyboard(),
-            parse_mode="Markdown"
+            reply_markup=get_test_in_progress_keyboard()
         )
         
         # Сохраняем ID нового сообщения для обновления
@@ -437,48 +373,45 @@ async def cancel_and_start_new(callback: CallbackQuery, state: FSMContext, bot:
         
         if not block_id:
             # Если по какой-то причине нет pending test, возвращаемся к списку тестов
-            # Удаляем текущее сообщение, которое может содержать медиа
-            await callback.message.delete()
-            # Отправляем новое сообщение с меню тестов
-            await callback.message.answer(
+            await message_editor.show(
+                callback.message,
                 MESSAGES["tests_menu"],
-                reply_markup=get_tests_menu_keyboard(await get_content_blocks(), 0),
-                parse_mode="Markdown"
+                reply_markup=get_tests_menu_keyboard(await get_content_blocks(), 0)
             )
             return
         
         # Получаем вопросы
-        questions = await get_questions_for_block(block_id)
+        questions = await get_block_questions(block_id)
         if not questions:
             await callback.answer("Вопросы не найдены", show_alert=True)
             return
         
-        # Создаем попытку
+        # Создаем попытку (активная попытка может уже появиться от повторного нажатия)
         attempt_id = await create_test_attempt(user_id, block_id)
+        if attempt_id is None:
+            await callback.answer(MESSAGES["test_already_active"])
+            return
         
         # Устанавливаем FSM
         await state.set_state(Test.in_progress)
         await state.update_data(
             attempt_id=attempt_id,
             block_id=block_id,
-            questions=questions,
+            question_ids=[question["id"] for question in questions],
             current_question_index=0,
             pending_test_block_id=None  # Очищаем pending test
         )
         
-        # Удаляем текущее сообщение (которое может содержать медиа)
-        await callback.message.delete()
-        
-        # Показываем первый вопрос в новом сообщении
+        # Показываем первый вопрос (медиа-сообщение будет заменено)
         first_question = questions[0]
-        new_message = await callback.message.answer(
-            MESSAGES["test_started"].format(
+        new_message = await message_editor.show(
+            callback.message,
+            render("test_started",
                 current=1,
                 total=len(questions),
-                question=first_question["question_text"]
+                question=content(first_question["question_text"])
             ),
-            reply_markup=get_test_in_progress_keyboard(),
-            parse_mode="Markdown"
+            reply_markup=get_test_in_progress_keyboard()
         )
         
         # Сохраняем ID нового сообщения
@@ -503,11 +436,11 @@ async def cancel_current_test(callback: CallbackQuery, state: FSMContext):
         await state.clear()
         
         if cancelled:
-            await callback.message.edit_text(
+            await message_editor.show(
+                callback.message,
                 "❌ **Тест отменен**\n\n"
                 "Вы можете начать новый тест или вернуться к изучению теории.",
-                reply_markup=get_back_keyboard("tests"),
-                parse_mode="Markdown"
+                reply_markup=get_back_keyboard("tests")
             )
             await callback.answer("Тест отменен")
         else:
@@ -559,7 +492,9 @@ async def process_test_answer(message: Message, state: FSMContext, bot: Bot):
     try:
         data = await state.get_data()
         attempt_id = data["attempt_id"]
-        questions = data["questions"]
+        block_id = data["block_id"]
+        # В FSM только id вопросов; состояния, сохраненные до этого, хранят вопросы целиком
+        question_ids = data.get("question_ids") or [question["id"] for question in data["questions"]]
         current_index = data["current_question_index"]
         test_message_id = data["test_message_id"]
         
@@ -572,7 +507,14 @@ async def process_test_answer(message: Message, state: FSMContext, bot: Bot):
             voice_file = await bot.get_file(message.voice.file_id)
             voice_data = await bot.download_file(voice_file.file_path)
             
-            transcribed = await transcribe_voice(voice_data.read())
+            try:
+                transcribed = await task_registry.run(
+                    transcribe_voice(voice_data.read()), kind="transcription"
+                )
+            except ShutdownInProgress:
+                await message.answer("🔄 Бот перезапускается. Отправьте ответ еще раз через минуту.")
+                return
+            
             if transcribed:
                 answer_text = transcribed[:1000]
             else:
@@ -583,8 +525,7 @@ async def process_test_answer(message: Message, state: FSMContext, bot: Bot):
             return
         
         # Сохраняем ответ
-        current_question = questions[current_index]
-        await save_user_answer(attempt_id, current_question["id"], answer_text)
+        await save_user_answer(attempt_id, question_ids[current_index], answer_text)
         
         # Удаляем сообщение с ответом пользователя
         try:
@@ -595,36 +536,36 @@ async def process_test_answer(message: Message, state: FSMContext, bot: Bot):
         # Следующий вопрос
         next_index = current_index + 1
         
-        if next_index < len(questions):
+        if next_index < len(question_ids):
             # Есть еще вопросы
             await state.update_data(current_question_index=next_index)
-            next_question = questions[next_index]
+            question_text = await get_question_text(block_id, question_ids[next_index])
             
             # Обновляем сообщение с тестом
-            await bot.edit_message_text(
-                MESSAGES["test_next_question"].format(
+            await message_editor.update(
+                bot, message.chat.id, test_message_id,
+                render("test_next_question",
                     current=next_index + 1,
-                    total=len(questions),
-                    question=next_question["question_text"]
+                    total=len(question_ids),
+                    question=content(question_text)
                 ),
-                chat_id=message.chat.id,
-                message_id=test_message_id,
                 reply_markup=get_test_in_progress_keyboard(),
-                parse_mode="Markdown"
+                parse_mode="Markdown",
+                final=True
             )
         else:
             # Тест завершен
-            await bot.edit_message_text(
+            await message_editor.update(
+                bot, message.chat.id, test_message_id,
                 MESSAGES["test_completed"],
-                chat_id=message.chat.id,
-                message_id=test_message_id,
-                parse_mode="Markdown"
+                parse_mode="Markdown",
+                final=True
             )
             
             await state.clear()
             
-            # Запускаем анализ
-            create_background_task(bot, message.from_user.id, attempt_id)
+            # Ставим попытку в очередь на анализ
+            await schedule_ai_analysis(message.from_user.id, attempt_id)
         
     except Exception as e:
         logger.error(f"Ошибка в process_test_answer: {e}")
@@ -644,7 +585,7 @@ async def continue_test(message: Message, state: FSMContext, bot: Bot):
         attempt_id = active_test["attempt_id"]
         block_id = active_test["block_id"]
         
-        questions = await get_questions_for_block(block_id)
+        questions = await get_block_questions(block_id)
         answered_count = await get_answered_questions_count(attempt_id)
         
         if answered_count >= len(questions):
@@ -656,18 +597,18 @@ async def continue_test(message: Message, state: FSMContext, bot: Bot):
         await state.update_data(
             attempt_id=attempt_id,
             block_id=block_id,
-            questions=questions,
+            question_ids=[question["id"] for question in questions],
             current_question_index=answered_count
         )
         
         # Показываем следующий вопрос
         next_question = questions[answered_count]
         test_message = await message.answer(
-            MESSAGES["test_continued"].format(title=active_test["block_title"]) +
-            MESSAGES["test_next_question"].format(
+            render("test_continued", title=content(active_test["block_title"])) +
+            render("test_next_question",
                 current=answered_count + 1,
                 total=len(questions),
-                question=next_question["question_text"]
+                question=content(next_question["question_text"])
             ),
             reply_markup=get_test_in_progress_keyboard(),
             parse_mode="Markdown"
@@ -682,7 +623,7 @@ async def continue_test(message: Message, state: FSMContext, bot: Bot):
 
 # === ОБРАТНАЯ СВЯЗЬ ===
 
-@router.callback_query(F.data.startswith("feedback_"))
+@router.callback_query(F.data.startswith("feedback_"), flags={"early_answer": True})
 async def handle_feedback(callback: CallbackQuery):
     """Обработка оценки результатов теста"""
     try:
@@ -694,10 +635,10 @@ async def handle_feedback(callback: CallbackQuery):
         await save_feedback_rating(attempt_id, rating)
         
         # Обновляем сообщение
-        await callback.message.edit_text(
+        await message_editor.show(
+            callback.message,
             f"✅ **Спасибо за оценку!**\n\n{MESSAGES['feedback_thanks']}\n\nВы можете продолжить изучение других тем.",
-            reply_markup=get_back_keyboard("main"),
-            parse_mode="Markdown"
+            reply_markup=get_back_keyboard("main")
         )
         
         await callback.answer()
@@ -706,6 +647,131 @@ async def handle_feedback(callback: CallbackQuery):
         logger.error(f"Ошибка в handle_feedback: {e}")
         await callback.answer("Ошибка сохранения оценки")
 
+# === АПЕЛЛЯЦИИ ===
+
+@router.callback_query(F.data.startswith("appeal_"))
+async def appeal_answer(callback: CallbackQuery):
+    """Оспорить вердикт ИИ по отдельному ответу"""
+    try:
+        answer_id = int(callback.data.split("_")[-1])
+        user_id = callback.from_user.id
+        
+        appeal = await create_answer_appeal(answer_id, user_id)
+        if not appeal:
+            await callback.answer("Этот ответ уже оспорен или его нельзя оспорить.", show_alert=True)
+            return
+        
+        try:
+            job_id = await schedule_appeal(user_id, appeal["attempt_id"], answer_id)
+        except Exception as e:
+            logger.error(f"Не удалось поставить апелляцию на ответ {answer_id} в очередь: {e}")
+            job_id = None
+        if not job_id:
+            # Без задачи апелляция так и осталась бы в ожидании; неудавшуюся можно подать снова
+            await fail_answer_appeal(answer_id)
+            await callback.answer("😔 Не удалось подать апелляцию. Попробуйте позже.", show_alert=True)
+            return
+        
+        await callback.answer(
+            "⚖️ Апелляция принята! Ответ перепроверит более точная модель, результат придет отдельным сообщением.",
+            show_alert=True
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в appeal_answer: {e}")
+        await callback.answer("Ошибка подачи апелляции")
+
+# === ПОИСК ===
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject):
+    """Поиск по теории и вопросам: /search <слова>"""
+    try:
+        query = (command.args or "").strip()
+        if not query:
+            await message.answer(MESSAGES["search_usage"], parse_mode="Markdown")
+            return
+        
+        results = await search_content(query, limit=LIMITS["search_results"])
+        await message.answer(
+            format_search_results(query, results),
+            reply_markup=get_search_results_keyboard(results),
+            parse_mode="Markdown"
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка в cmd_search: {e}")
+        await message.answer(MESSAGES["error_generic"])
+
+# === МОИ РЕЗУЛЬТАТЫ ===
+
+@router.callback_query(F.data == "menu_results", flags={"early_answer": True})
+@router.callback_query(F.data.startswith("results_after_"), flags={"early_answer": True})
+async def show_results(callback: CallbackQuery):
+    """Список завершенных тестов пользователя (страница после попытки из курсора)"""
+    try:
+        before_attempt_id = int(callback.data.split("_")[-1]) if callback.data.startswith("results_after_") else None
+        attempts, has_older = await get_results_history(
+            callback.from_user.id,
+            before_attempt_id=before_attempt_id,
+            limit=LIMITS["results_per_page"]
+        )
+        
+        if not attempts and before_attempt_id is None:
+            await message_editor.show(callback.message, MESSAGES["results_empty"], reply_markup=get_back_keyboard("main"))
+            await callback.answer()
+            return
+        
+        keyboard = get_results_keyboard(
+            attempts,
+            older_cursor=attempts[-1]["attempt_id"] if has_older else None,
+            is_first_page=before_attempt_id is None
+        )
+        await message_editor.show(callback.message, MESSAGES["results_menu"], reply_markup=keyboard)
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в show_results: {e}")
+        await callback.answer("Ошибка загрузки результатов")
+
+@router.callback_query(F.data == "result_page_current", flags={"early_answer": True})
+async def result_page_current(callback: CallbackQuery):
+    """Нажатие на номер страницы отчета"""
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("result_view_"))
+async def view_result(callback: CallbackQuery):
+    """Сохраненный итоговый отчет по попытке"""
+    try:
+        _, _, attempt_id, page = callback.data.split("_")
+        attempt_id, page = int(attempt_id), int(page)
+        
+        attempt = await get_attempt_report(callback.from_user.id, attempt_id)
+        if not attempt:
+            await callback.answer("Результат не найден", show_alert=True)
+            return
+        
+        if attempt["final_report"]:
+            report = Markdown(attempt["final_report"])
+        else:
+            score = f"{attempt['score']:.0%}" if attempt["score"] is not None else "—"
+            report = Markdown(render("result_no_report", score=score))
+        date = datetime.fromisoformat(attempt["attempt_timestamp"]).strftime("%d.%m.%Y %H:%M")
+        pages = paginate(render("result_report", title=content(attempt["block_title"]), date=date, report=report))
+        
+        page = min(max(page, 1), len(pages))
+        text, parse_mode = pages[page - 1]
+        await message_editor.show(
+            callback.message, text,
+            reply_markup=get_result_report_keyboard(attempt_id, page, len(pages)),
+            parse_mode=parse_mode
+        )
+        await callback.answer()
+        
+    except Exception as e:
+        logger.error(f"Ошибка в view_result: {e}")
+        await callback.answer("Ошибка загрузки отчета")
+
 # === ОБРАБОТЧИК НЕИЗВЕСТНЫХ CALLBACK ===
 
 @router.callback_query()
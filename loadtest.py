@@ -0,0 +1,181 @@
+"""Нагрузочный тест webhook-режима
+
+Поднимает локальную заглушку Bot API и отправляет синтетические обновления на webhook бота.
+Бот запускается отдельно и смотрит в заглушку, например:
+
+    BOT_MODE=webhook TELEGRAM_API_BASE=http://127.0.0.1:8081 WEBHOOK_SECRET=test \\
+        DATABASE_PATH=loadtest.db python main.py
+    python loadtest.py --updates 2000 --concurrency 100 --secret test
+
+Исходящие запросы бота к заглушке тоже ограничены TELEGRAM_GLOBAL_RATE —
+для замера пропускной способности самого бота его можно поднять.
+
+Отчет: время ответа webhook (подтверждение приема) и время до первого вызова
+Bot API для чата (полная обработка обновления), перцентили и пропускная способность.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, List
+from aiohttp import web, ClientSession
+
+USER_ID_BASE = 9_000_000_000
+
+class FakeBotAPI:
+    """Заглушка Bot API: отвечает правдоподобными объектами и запоминает время первого вызова по чату"""
+    
+    def __init__(self):
+        self.message_ids = itertools.count(1)
+        self.first_call: Dict[int, float] = {}
+        self.calls = 0
+    
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        data = dict(await request.post())
+        self.calls += 1
+        
+        chat_id = data.get("chat_id")
+        if chat_id is None and "callback_query_id" in data:
+            chat_id = data["callback_query_id"].split(":")[0]
+        if chat_id is not None:
+            self.first_call.setdefault(int(chat_id), time.monotonic())
+        
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif method.startswith(("send", "edit")):
+            chat = int(chat_id) if chat_id is not None else 0
+            result = {
+                "message_id": int(data.get("message_id") or next(self.message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat, "type": "private"},
+                "text": data.get("text", "")
+            }
+        else:
+            result = True
+        
+        return web.json_response({"ok": True, "result": result})
+
+def make_updates(count: int, callback_data: str) -> List[Dict]:
+    """Синтетические обновления: /start и нажатие кнопки от каждого пользователя"""
+    updates = []
+    for i in range(count):
+        user_id = USER_ID_BASE + i
+        user = {"id": user_id, "is_bot": False, "first_name": f"Load{i}", "username": f"load{i}"}
+        chat = {"id": user_id, "type": "private"}
+        if callback_data and i % 2:
+            updates.append({
+                "update_id": i + 1,
+                "callback_query": {
+                    "id": f"{user_id}:{i}",
+                    "from": user,
+                    "chat_instance": str(user_id),
+                    "data": callback_data,
+                    "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "menu"}
+                }
+            })
+        else:
+            updates.append({
+                "update_id": i + 1,
+                "message": {
+                    "message_id": i + 1,
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "from": user,
+                    "text": "/start"
+                }
+            })
+    return updates
+
+def percentiles(values: List[float]) -> str:
+    """Строка с p50/p95/p99/max в миллисекундах"""
+    if not values:
+        return "нет данных"
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return f"p50={pick(0.50):.0f}мс p95={pick(0.95):.0f}мс p99={pick(0.99):.0f}мс max={values[-1] * 1000:.0f}мс"
+
+async def wait_for_webhook(url: str, timeout: float) -> bool:
+    """Дождаться, пока бот (запущенный после заглушки) начнет принимать соединения"""
+    deadline = time.monotonic() + timeout
+    async with ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                    return True
+            except Exception:
+                await asyncio.sleep(0.2)
+    return False
+
+async def run_loadtest(args: argparse.Namespace):
+    """Поднять заглушку, отправить обновления и напечатать отчет"""
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+    print(f"Заглушка Bot API: http://127.0.0.1:{args.api_port}")
+    
+    if not await wait_for_webhook(args.webhook, args.wait):
+        print(f"Webhook {args.webhook} недоступен")
+        await runner.cleanup()
+        return
+    
+    updates = make_updates(args.updates, args.callback)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    sent_at: Dict[int, float] = {}
+    ack_latencies: List[float] = []
+    errors = 0
+    
+    async def send(session: ClientSession, update: Dict):
+        nonlocal errors
+        chat_id = (update.get("message") or update["callback_query"]["message"])["chat"]["id"]
+        async with semaphore:
+            started = time.monotonic()
+            sent_at[chat_id] = started
+            try:
+                async with session.post(args.webhook, data=json.dumps(update),
+                                        headers={**headers, "Content-Type": "application/json"}) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except Exception:
+                errors += 1
+                return
+            ack_latencies.append(time.monotonic() - started)
+    
+    try:
+        started = time.monotonic()
+        async with ClientSession() as session:
+            await asyncio.gather(*(send(session, update) for update in updates))
+        sent_seconds = time.monotonic() - started
+        
+        # Ждем, пока бот обработает обновления (или истечет таймаут)
+        deadline = time.monotonic() + args.wait
+        while len(api.first_call) < len(sent_at) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        
+        processing = [api.first_call[chat] - sent for chat, sent in sent_at.items() if chat in api.first_call]
+        print(f"Обновлений: {len(updates)}, параллельно: {args.concurrency}, ошибок: {errors}")
+        print(f"Отправка: {sent_seconds:.2f}с ({len(updates) / sent_seconds:.0f} обновлений/с)")
+        print(f"Ответ webhook: {percentiles(ack_latencies)}")
+        print(f"До первого ответа бота: {percentiles(processing)}"
+              f" (обработано {len(processing)}/{len(sent_at)})")
+        print(f"Вызовов Bot API: {api.calls}")
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-режима бота")
+    parser.add_argument("--webhook", default="http://127.0.0.1:8080/webhook", help="Адрес webhook бота")
+    parser.add_argument("--secret", default="", help="WEBHOOK_SECRET бота")
+    parser.add_argument("--api-port", type=int, default=8081, help="Порт заглушки Bot API")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--callback", default="menu_main", help="callback_data для половины обновлений (пусто — только /start)")
+    parser.add_argument("--wait", type=float, default=30.0, help="Сколько ждать обработки, секунд")
+    asyncio.run(run_loadtest(parser.parse_args()))
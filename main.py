@@ -2,15 +2,27 @@ import asyncio
 import logging
 import os
 import sys
+import signal
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 # Добавляем текущую директорию в путь для импортов
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import config
 from database.db_functions import init_database
+from ai.ai_processor import close_openai_client
+from ai.grading_worker import start_local_worker, stop_worker_gracefully
+from utils.task_registry import task_registry
+from utils.bot_factory import create_bot
+from utils.broadcast import resume_broadcasts
+from middleware.send_scheduler import background_priority
 from middleware.auth_middleware import AuthMiddleware
+from middleware.callback_ack import CallbackAckMiddleware
+from middleware.idempotency import CallbackIdempotencyMiddleware
+from fsm.event_isolation import ChatEventIsolation
+from fsm.sqlite_storage import SQLiteStorage
 from handlers import user_handlers, admin_handlers
 
 # Настройка логирования
@@ -63,9 +75,10 @@ async def create_prompt_template():
 - Если ответ содержит основную суть, но неполный - считай его достаточным
 - Если ответ содержит грубые ошибки или полностью неверен - считай недостаточным
 - Рекомендации должны быть конкретными и ссылаться на материал
+- confidence — твоя уверенность в вердикте от 0 до 1; для пограничных и неоднозначных ответов ставь ниже 0.75
 
 ### Формат вывода (ТОЛЬКО JSON):
-{{"is_sufficient": boolean, "recommendation": "краткая рекомендация для студента"}}"""
+{{"is_sufficient": boolean, "confidence": число от 0 до 1, "recommendation": "краткая рекомендация для студента"}}"""
         
         with open(template_path, 'w', encoding='utf-8') as f:
             f.write(template_content)
@@ -80,54 +93,163 @@ async def setup_bot():
         # Создаем шаблон промпта
         await create_prompt_template()
         
+        # После остановки в этом же процессе (перезапуск из run.py) реестр снова принимает задачи
+        task_registry.reset()
+        
         # Инициализируем базу данных
         logger.info("Инициализация базы данных...")
         await init_database()
         logger.info("База данных успешно инициализирована")
         
         # Создаем бота и диспетчер
-        bot = Bot(token=config.BOT_TOKEN)
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
-        
-        # Регистрируем middleware (ВАЖНО: в правильном порядке!)
-        dp.message.middleware(AuthMiddleware())
-        dp.callback_query.middleware(AuthMiddleware())
-        
-        # Регистрируем роутеры (ВАЖНО: admin_handlers ПЕРЕД user_handlers для приоритета)
-        dp.include_router(admin_handlers.router)
-        dp.include_router(user_handlers.router)
+        bot = create_bot()
+        grading_worker = None
+        drained = False
+        try:
+            # Состояния FSM переживают перезапуск; диспетчер закрывает хранилище первым
+            # обработчиком shutdown, поздние записи после этого пишутся в БД сразу
+            storage = SQLiteStorage()
+            await storage.init()
+            # Апдейты одного чата обрабатываются по очереди, разных чатов — параллельно
+            dp = Dispatcher(storage=storage, events_isolation=ChatEventIsolation())
+            
+            # Регистрируем middleware (ВАЖНО: в правильном порядке!)
+            dp.message.middleware(AuthMiddleware())
+            dp.callback_query.middleware(AuthMiddleware())
+            dp.callback_query.middleware(CallbackAckMiddleware())
+            
+            # Повторные нажатия отсекаем до FSM middleware, чтобы они не вставали в очередь чата
+            dp.update.outer_middleware.unregister(dp.fsm)
+            dp.update.outer_middleware(CallbackIdempotencyMiddleware())
+            dp.update.outer_middleware(dp.fsm)
+            
+            # Регистрируем роутеры (ВАЖНО: admin_handlers ПЕРЕД user_handlers для приоритета)
+            # Роутеры модульные: при перезапуске в том же процессе отвязываем их от прошлого диспетчера
+            for router in (admin_handlers.router, user_handlers.router):
+                router._parent_router = None
+            dp.include_router(admin_handlers.router)
+            dp.include_router(user_handlers.router)
+            
+            # Вызывается после остановки polling, но до закрытия сессии бота
+            async def on_shutdown():
+                nonlocal drained
+                drained = True
+                await drain_background_work(grading_worker)
+            
+            dp.shutdown.register(on_shutdown)
+            
+            # Проверка ответов: внутри процесса или в отдельных воркерах, запускаемых run.py
+            if config.GRADING_WORKERS == 0:
+                grading_worker = await start_local_worker(bot)
+            else:
+                logger.info(f"Проверка ответов вынесена в процессы-воркеры: {config.GRADING_WORKERS}")
+            
+            # Продолжаем рассылки, прерванные прошлой остановкой
+            resumed = await resume_broadcasts(bot)
+            if resumed:
+                logger.info(f"Продолжено рассылок: {resumed}")
+            
+            logger.info("Бот настроен и готов к запуску")
+            
+            # Получаем информацию о боте
+            bot_info = await bot.get_me()
+            logger.info(f"Бот запущен: @{bot_info.username} ({bot_info.full_name})")
+            
+            # Уведомляем админов о запуске
+            with background_priority():
+                for admin_id in config.ALL_ADMINS:
+                    try:
+                        await bot.send_message(
+                            admin_id,
+                            f"🚀 **Бот {bot_info.full_name} запущен!**\n\n"
+                            f"📊 **Конфигурация:**\n"
+                            f"• Супер-админы: {len(config.SUPER_ADMINS)}\n"
+                            f"• Админы: {len(config.ADMINS)}\n"
+                            f"• Inline интерфейс: ✅\n"
+                            f"• AI анализ: ✅\n\n"
+                            f"Используйте /start для начала работы.",
+                            parse_mode="Markdown"
+                        )
+                    except Exception as e:
+                        logger.warning(f"Не удалось уведомить админа {admin_id}: {e}")
+            
+            if config.BOT_MODE == "webhook":
+                await run_webhook(bot, dp)
+            else:
+                # Снимаем webhook, если бот раньше работал в режиме webhook, иначе getUpdates не работает
+                await bot.delete_webhook(drop_pending_updates=False)
+            
+                # Запускаем polling
+                logger.info("Запуск polling...")
+                await dp.start_polling(bot, skip_updates=True, handle_as_tasks=True)
+        finally:
+            # Ошибка до запуска диспетчера (get_me, delete_webhook, запуск сервера) — его shutdown
+            # не вызывался, и воркер при перезапуске из run.py остался бы работать
+            if not drained:
+                await drain_background_work(grading_worker)
+            await bot.session.close()
         
-        logger.info("Бот настроен и готов к запуску")
-        
-        # Получаем информацию о боте
-        bot_info = await bot.get_me()
-        logger.info(f"Бот запущен: @{bot_info.username} ({bot_info.full_name})")
+    except Exception as e:
+        logger.error(f"Критическая ошибка при запуске бота: {e}")
+        raise
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запуск в режиме webhook: локальный aiohttp-сервер, обновления обрабатываются параллельно"""
+    app = web.Application()
+    
+    # Порядок важен: сначала shutdown диспетчера (ожидание фоновых задач), потом закрытие сессии бота
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=config.WEBHOOK_SECRET or None
+    ).register(app, path=config.WEBHOOK_PATH)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook-сервер слушает {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+    
+    try:
+        if config.WEBHOOK_URL:
+            # Накопившиеся за время перезапуска обновления не сбрасываем — Telegram доставит их
+            await bot.set_webhook(
+                url=config.WEBHOOK_URL + config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET or None,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+                drop_pending_updates=False
+            )
+            logger.info(f"Webhook зарегистрирован: {config.WEBHOOK_URL}{config.WEBHOOK_PATH}")
+        else:
+            logger.warning("WEBHOOK_URL не задан: webhook в Telegram не регистрируется")
         
-        # Уведомляем админов о запуске
-        for admin_id in config.ALL_ADMINS:
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
             try:
-                await bot.send_message(
-                    admin_id,
-                    f"🚀 **Бот {bot_info.full_name} запущен!**\n\n"
-                    f"📊 **Конфигурация:**\n"
-                    f"• Супер-админы: {len(config.SUPER_ADMINS)}\n"
-                    f"• Админы: {len(config.ADMINS)}\n"
-                    f"• Inline интерфейс: ✅\n"
-                    f"• AI анализ: ✅\n\n"
-                    f"Используйте /start для начала работы.",
-                    parse_mode="Markdown"
-                )
-            except Exception as e:
-                logger.warning(f"Не удалось уведомить админа {admin_id}: {e}")
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows
         
-        # Запускаем polling
-        logger.info("Запуск polling...")
-        await dp.start_polling(bot, skip_updates=True)
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки webhook-сервера")
         
-    except Exception as e:
-        logger.error(f"Критическая ошибка при запуске бота: {e}")
-        raise
+    finally:
+        # Webhook не удаляем: пока бот перезапускается, Telegram копит обновления
+        await runner.cleanup()
+
+async def drain_background_work(grading_worker=None):
+    """Дождаться фоновых задач перед закрытием сессий (недоделанные проверки вернутся в очередь)"""
+    try:
+        if grading_worker:
+            await stop_worker_gracefully(grading_worker)
+        else:
+            await task_registry.drain(config.SHUTDOWN_DRAIN_TIMEOUT)
+    finally:
+        await close_openai_client()
 
 async def shutdown_bot(bot: Bot):
     """Корректное завершение работы бота"""
@@ -164,6 +286,9 @@ def main():
         logger.info(f"👑 Супер-админов: {len(config.SUPER_ADMINS)}")
         logger.info(f"🛡️ Админов: {len(config.ADMINS)}")
         logger.info(f"🎨 Интерфейс: Inline")
+        logger.info(f"📡 Режим получения обновлений: {config.BOT_MODE}")
+        if config.BOT_MODE == "webhook" and not config.WEBHOOK_SECRET:
+            logger.warning("⚠️ WEBHOOK_SECRET не задан: запросы к webhook не проверяются")
         
     except Exception as e:
         logger.error(f"❌ Ошибка конфигурации: {e}")
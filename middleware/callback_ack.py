@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Set
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.flags import get_flag
+from aiogram.methods import AnswerCallbackQuery, Response, TelegramMethod
+from aiogram.types import CallbackQuery
+import config
+
+logger = logging.getLogger(__name__)
+
+class CallbackAckMiddleware(BaseMiddleware):
+    """Раннее подтверждение нажатий на кнопки
+
+    Для обработчиков с флагом early_answer: если обработчик не ответил на callback
+    за короткое окно, отвечаем пустым ответом сами, чтобы у пользователя сразу
+    пропал индикатор загрузки. Ответ обработчика после этого уже не показывается,
+    поэтому флаг ставится только обработчикам, которые отвечают без текста
+    (кроме сообщения об ошибке). Остальные отвечают на callback сами.
+    """
+
+    def __init__(self, grace: float = config.CALLBACK_ACK_GRACE):
+        self.grace = grace
+        self._acks: Set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not get_flag(data, "early_answer"):
+            return await handler(event, data)
+
+        timer = asyncio.get_running_loop().call_later(self.grace, self._spawn_ack, event)
+        try:
+            return await handler(event, data)
+        finally:
+            timer.cancel()
+
+    def _spawn_ack(self, event: CallbackQuery):
+        """Отправить пустой ответ на callback в фоне"""
+        task = asyncio.create_task(self._ack(event))
+        self._acks.add(task)
+        task.add_done_callback(self._acks.discard)
+
+    async def _ack(self, event: CallbackQuery):
+        try:
+            await event.answer()
+        except Exception as e:
+            logger.debug(f"Не удалось подтвердить callback {event.id}: {e}")
+
+class CallbackAnswerDeduplicator(BaseRequestMiddleware):
+    """Отвечает на каждый callback не более одного раза
+
+    Повторный answerCallbackQuery (обработчик ответил после раннего подтверждения)
+    не отправляется: Telegram все равно его отклонит.
+    """
+
+    def __init__(self, max_tracked: int = config.CALLBACK_ANSWERS_TRACKED):
+        self.max_tracked = max_tracked
+        self._answers: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.suppressed = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Response:
+        if not isinstance(method, AnswerCallbackQuery):
+            return await make_request(bot, method)
+
+        previous = self._answers.get(method.callback_query_id)
+        if previous is not None:
+            try:
+                response = await asyncio.shield(previous)
+                self.suppressed += 1
+                if method.text:
+                    logger.debug(f"Ответ на callback {method.callback_query_id} уже отправлен, текст не показан: {method.text}")
+                return response
+            except Exception:
+                pass  # Первый ответ не дошел — отправляем этот
+
+        answer = asyncio.get_running_loop().create_future()
+        self._answers[method.callback_query_id] = answer
+        while len(self._answers) > self.max_tracked:
+            self._answers.popitem(last=False)
+
+        try:
+            response = await make_request(bot, method)
+        except Exception as e:
+            self._answers.pop(method.callback_query_id, None)
+            answer.set_exception(e)
+            answer.exception()  # Исключение уже обработано вызывающим, не логируем его повторно
+            raise
+        answer.set_result(response)
+        return response
+
+callback_answer_deduplicator = CallbackAnswerDeduplicator()
@@ -0,0 +1,68 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+import config
+
+logger = logging.getLogger(__name__)
+
+CallbackKey = Tuple[int, str, Optional[int]]
+
+class CallbackIdempotencyMiddleware(BaseMiddleware):
+    """Отсекает повторные нажатия одной и той же кнопки
+
+    Нажатие с теми же пользователем, данными кнопки и сообщением, пока первое
+    еще обрабатывается или завершилось меньше window секунд назад, считается
+    двойным нажатием: на него отвечаем пустым ответом и не обрабатываем.
+    Регистрируется на апдейты до FSM middleware, чтобы дубликаты не вставали
+    в очередь чата.
+    """
+
+    def __init__(self, window: float = config.CALLBACK_DEDUP_WINDOW, max_tracked: int = config.CALLBACK_ANSWERS_TRACKED):
+        self.window = window
+        self.max_tracked = max_tracked
+        # Ключ нажатия -> время завершения обработки (None, пока обрабатывается)
+        self._seen: "OrderedDict[CallbackKey, Optional[float]]" = OrderedDict()
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        callback = event.callback_query
+        if callback is None or callback.data is None:
+            return await handler(event, data)
+
+        message_id = callback.message.message_id if callback.message else None
+        key = (callback.from_user.id, callback.data, message_id)
+
+        if self._is_duplicate(key):
+            self.dropped += 1
+            logger.debug(f"Повторное нажатие {callback.data} от пользователя {callback.from_user.id} отброшено")
+            try:
+                await callback.answer()
+            except Exception:
+                pass  # Ответ на дубликат не важен
+            return None
+
+        self._seen[key] = None
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_tracked:
+            self._seen.popitem(last=False)
+
+        try:
+            return await handler(event, data)
+        finally:
+            if key in self._seen:
+                self._seen[key] = time.monotonic()
+
+    def _is_duplicate(self, key: CallbackKey) -> bool:
+        """Нажатие еще обрабатывается или обработано только что"""
+        if key not in self._seen:
+            return False
+        finished_at = self._seen[key]
+        return finished_at is None or time.monotonic() - finished_at < self.window
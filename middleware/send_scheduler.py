@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+import config
+
+logger = logging.getLogger(__name__)
+
+class SendPriority:
+    """Приоритеты исходящих сообщений (меньше — важнее)"""
+    INTERACTIVE = 0  # Ответы на действия пользователя
+    BACKGROUND = 1  # Уведомления и прогресс фоновых задач
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+PACED_METHOD_PREFIXES = ("send", "edit", "copy", "forward")
+
+_send_priority: ContextVar[int] = ContextVar("send_priority", default=SendPriority.INTERACTIVE)
+
+@contextmanager
+def background_priority():
+    """Отправлять сообщения внутри блока с фоновым приоритетом"""
+    token = _send_priority.set(SendPriority.BACKGROUND)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+class ChatLimiter:
+    """Лимит отправки в один чат: ведро токенов с допустимой пачкой"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = 0.0
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Занять слот и вернуть, сколько секунд ждать до отправки"""
+        if self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.blocked_until - now)
+
+class SendScheduler(BaseRequestMiddleware):
+    """Очередь исходящих запросов к Bot API
+
+    Соблюдает глобальный лимит процесса и лимиты на чат, пропускает вперед
+    интерактивные ответы и сама повторяет запросы после TelegramRetryAfter.
+    """
+
+    def __init__(self, global_rate: float, max_retries: int = config.TELEGRAM_MAX_RETRIES):
+        self.interval = 1.0 / global_rate
+        self.max_retries = max_retries
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._next_slot = 0.0
+        self._pump_task: Optional[asyncio.Task] = None
+        self._chats: Dict[int, ChatLimiter] = {}
+        self._stats = {
+            "sent": 0,
+            "retried": 0,
+            "failed": 0,
+            "wait_total": {SendPriority.INTERACTIVE: 0.0, SendPriority.BACKGROUND: 0.0},
+            "wait_count": {SendPriority.INTERACTIVE: 0, SendPriority.BACKGROUND: 0},
+            "wait_max": 0.0
+        }
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod
+    ) -> Response:
+        if not method.__api_method__.lower().startswith(PACED_METHOD_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        priority = _send_priority.get()
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+                self._stats["sent"] += 1
+                return response
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    self._stats["failed"] += 1
+                    raise
+                self._stats["retried"] += 1
+                logger.warning(f"Flood control для чата {chat_id}: повтор через {e.retry_after} с")
+                self._block(chat_id, e.retry_after)
+
+    def _chat_limiter(self, chat_id: Any) -> Optional[ChatLimiter]:
+        """Лимитер чата (группы ограничены сильнее личных чатов)"""
+        if not isinstance(chat_id, int):
+            return None  # inline-сообщения и @username — только глобальный лимит
+
+        limiter = self._chats.get(chat_id)
+        if limiter is None:
+            if len(self._chats) >= config.TELEGRAM_TRACKED_CHATS:
+                self._forget_idle_chats()
+            if chat_id < 0:
+                limiter = ChatLimiter(config.TELEGRAM_GROUP_RATE, 1)
+            else:
+                limiter = ChatLimiter(config.TELEGRAM_CHAT_RATE, config.TELEGRAM_CHAT_BURST)
+            self._chats[chat_id] = limiter
+        return limiter
+
+    def _forget_idle_chats(self):
+        """Забыть лимитеры чатов, ведро которых уже полностью восстановилось"""
+        now = asyncio.get_running_loop().time()
+        self._chats = {
+            chat_id: limiter for chat_id, limiter in self._chats.items()
+            if limiter.blocked_until > now or now - limiter.updated < limiter.burst / limiter.rate
+        }
+
+    def _block(self, chat_id: Any, retry_after: float):
+        """Приостановить отправку после RetryAfter (в чат или, если чат неизвестен, всю очередь)"""
+        loop = asyncio.get_running_loop()
+        limiter = self._chat_limiter(chat_id)
+        if limiter:
+            limiter.blocked_until = max(limiter.blocked_until, loop.time() + retry_after)
+        else:
+            self._next_slot = max(self._next_slot, loop.time() + retry_after)
+
+    async def _acquire(self, chat_id: Any, priority: int):
+        """Дождаться слота в чате, затем глобального слота в порядке приоритета"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        limiter = self._chat_limiter(chat_id)
+        if limiter:
+            delay = limiter.reserve(started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        future = loop.create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        if self._pump_task is None or self._pump_task.done() or self._pump_task.get_loop() is not loop:
+            self._pump_task = loop.create_task(self._pump())
+        await future
+
+        waited = loop.time() - started
+        self._stats["wait_total"][priority] += waited
+        self._stats["wait_count"][priority] += 1
+        self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+    async def _pump(self):
+        """Выдавать глобальные слоты с заданным интервалом самым приоритетным ожидающим"""
+        loop = asyncio.get_running_loop()
+        while self._queue:
+            delay = self._next_slot - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # Ожидающий отменен
+
+            self._next_slot = max(loop.time(), self._next_slot) + self.interval
+            future.set_result(None)
+
+    def get_stats(self) -> Dict:
+        """Метрики очереди отправки"""
+        queued = {SendPriority.INTERACTIVE: 0, SendPriority.BACKGROUND: 0}
+        for priority, _, future in self._queue:
+            if not future.done():
+                queued[priority] = queued.get(priority, 0) + 1
+
+        def avg_wait_ms(priority: int) -> float:
+            count = self._stats["wait_count"][priority]
+            return self._stats["wait_total"][priority] / count * 1000 if count else 0.0
+
+        return {
+            "queued_interactive": queued[SendPriority.INTERACTIVE],
+            "queued_background": queued[SendPriority.BACKGROUND],
+            "sent": self._stats["sent"],
+            "retried": self._stats["retried"],
+            "failed": self._stats["failed"],
+            "avg_wait_interactive_ms": avg_wait_ms(SendPriority.INTERACTIVE),
+            "avg_wait_background_ms": avg_wait_ms(SendPriority.BACKGROUND),
+            "max_wait_ms": self._stats["wait_max"] * 1000,
+            "global_rate": 1.0 / self.interval,
+            "tracked_chats": len(self._chats)
+        }
+
+# Глобальный лимит делится между основным процессом и процессами-воркерами
+send_scheduler = SendScheduler(config.TELEGRAM_GLOBAL_RATE / (1 + config.GRADING_WORKERS))
@@ -5,6 +5,7 @@ import logging
 import signal
 import sys
 import os
+import multiprocessing
 from datetime import datetime
 from pathlib import Path
 
@@ -13,7 +14,10 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 import config
 from main import setup_bot, shutdown_bot
-from aiogram import Bot
+from ai.grading_worker import run_worker_process
+from utils.task_registry import task_registry
+from utils.bot_factory import create_bot
+from middleware.send_scheduler import background_priority
 
 # Настройка логирования для продакшена
 logging.basicConfig(
@@ -27,6 +31,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Сколько секунд сверх SHUTDOWN_DRAIN_TIMEOUT ждать воркер при остановке (возврат задач в очередь, закрытие сессий)
+WORKER_STOP_MARGIN = 15
+
 class BotRunner:
     """Класс для управления запуском и перезапуском бота"""
     
@@ -42,24 +49,29 @@ class BotRunner:
             logger.info(f"=== Запуск AI Mentor Bot (попытка {self.restart_count + 1}) ===")
             
             # Создаем бота для уведомлений
-            self.bot = Bot(token=config.BOT_TOKEN)
+            self.bot = create_bot()
             
             # Уведомляем админов о запуске/перезапуске
-            restart_msg = " (перезапуск)" if self.restart_count > 0 else ""
-            for admin_id in config.SUPER_ADMINS:
-                try:
-                    await self.bot.send_message(
-                        admin_id,
-                        f"🚀 Бот запускается{restart_msg}...\n"
-                        f"📅 Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
-                        f"🔄 Попытка: {self.restart_count + 1}"
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось уведомить админа {admin_id}: {e}")
+            with background_priority():
+                restart_msg = " (перезапуск)" if self.restart_count > 0 else ""
+                for admin_id in config.SUPER_ADMINS:
+                    try:
+                        await self.bot.send_message(
+                            admin_id,
+                            f"🚀 Бот запускается{restart_msg}...\n"
+                            f"📅 Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
+                            f"🔄 Попытка: {self.restart_count + 1}"
+                        )
+                    except Exception as e:
+                        logger.warning(f"Не удалось уведомить админа {admin_id}: {e}")
             
             # Запускаем основную логику бота
             await setup_bot()
             
+            # setup_bot возвращается штатно только после сигнала остановки
+            # (фоновые задачи к этому моменту уже дождались завершения)
+            self.should_restart = False
+            
         except KeyboardInterrupt:
             logger.info("Получен сигнал остановки (Ctrl+C)")
             self.should_restart = False
@@ -124,11 +136,12 @@ def setup_signal_handlers(runner):
     def signal_handler(signum, frame):
         logger.info(f"Получен сигнал {signum}")
         runner.should_restart = False
+        task_registry.stop_accepting()
         
-        # Принудительно останавливаем event loop
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            loop.stop()
+        # Во время polling сигналы перехватывает aiogram и останавливает бота штатно,
+        # с ожиданием фоновых задач. Сюда попадаем только вне polling (например, в паузе
+        # перед перезапуском) — тогда прерываем ожидание, как при Ctrl+C.
+        raise KeyboardInterrupt
     
     # Обработка сигналов остановки
     signal.signal(signal.SIGINT, signal_handler)
@@ -138,6 +151,41 @@ def setup_signal_handlers(runner):
     if hasattr(signal, 'SIGBREAK'):
         signal.signal(signal.SIGBREAK, signal_handler)
 
+def start_grading_workers(count: int) -> list:
+    """Запустить процессы-воркеры для проверки ответов"""
+    processes = []
+    # spawn: воркеры не наследуют состояние родителя и одинаково работают на Linux и Windows
+    context = multiprocessing.get_context("spawn")
+    
+    for worker_index in range(count):
+        process = context.Process(
+            target=run_worker_process,
+            args=(worker_index,),
+            name=f"grading-worker-{worker_index}",
+            daemon=True
+        )
+        process.start()
+        processes.append(process)
+        logger.info(f"Запущен воркер проверки #{worker_index} (PID {process.pid})")
+    
+    return processes
+
+def stop_grading_workers(processes: list, timeout: float = config.SHUTDOWN_DRAIN_TIMEOUT + WORKER_STOP_MARGIN):
+    """Остановить процессы-воркеры, дав им завершить текущие проверки
+    
+    Воркер ждет свои задачи SHUTDOWN_DRAIN_TIMEOUT секунд и затем возвращает
+    недоделанные в очередь, поэтому ждем его дольше на запас WORKER_STOP_MARGIN.
+    """
+    for process in processes:
+        if process.is_alive():
+            process.terminate()  # SIGTERM: воркер перестает брать новые задачи
+    
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning(f"Воркер {process.name} не завершился за {timeout} сек, принудительная остановка")
+            process.kill()
+
 def check_environment():
     """Проверка окружения перед запуском"""
     logger.info("Проверка окружения...")
@@ -190,6 +238,9 @@ def main():
     # Настраиваем обработчики сигналов
     setup_signal_handlers(runner)
     
+    # Запускаем воркеры проверки ответов (если проверка вынесена из процесса бота)
+    workers = start_grading_workers(config.GRADING_WORKERS)
+    
     # Запускаем бота
     try:
         asyncio.run(runner.run())
@@ -198,6 +249,8 @@ def main():
     except Exception as e:
         logger.error(f"Необработанная ошибка в main: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        stop_grading_workers(workers)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# config требует токены при импорте; тесты работают с отдельной временной БД
+_tmp_dir = tempfile.mkdtemp(prefix="mentor-tests-")
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp_dir, "bot.db")
+os.environ["FSM_DATABASE_PATH"] = os.path.join(_tmp_dir, "fsm.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,77 @@
+import io
+import pytest
+from utils.constants import LIMITS
+from utils.content_io import _read_csv, detect_format, normalize_block
+
+CSV_HEADER = "title,theory_text,video_file_id,pdf_file_id,question\n"
+
+def _records(text: str):
+    return list(_read_csv(io.StringIO(CSV_HEADER + text)))
+
+def test_read_csv_groups_consecutive_rows():
+    records = _records(
+        "ООП,Теория ООП,,,Что такое класс?\n"
+        "ООП,,,,Что такое объект?\n"
+        "SQL,Теория SQL,vid,,Что такое JOIN?\n"
+    )
+    assert [(line, record["title"], record["questions"]) for line, record in records] == [
+        (2, "ООП", ["Что такое класс?", "Что такое объект?"]),
+        (4, "SQL", ["Что такое JOIN?"])
+    ]
+    assert records[0][1]["theory_text"] == "Теория ООП"
+    assert records[1][1]["video_file_id"] == "vid"
+
+def test_read_csv_block_fields_from_later_rows():
+    [(_, record)] = _records("ООП,,,,Вопрос 1\nООП,Теория,,pdf,Вопрос 2\n")
+    assert record["theory_text"] == "Теория"
+    assert record["pdf_file_id"] == "pdf"
+
+def test_read_csv_skips_empty_questions():
+    [(_, record)] = _records("ООП,Теория,,,\nООП,,,,  \nООП,,,,Вопрос\n")
+    assert record["questions"] == ["Вопрос"]
+
+def test_read_csv_separated_rows_are_separate_blocks():
+    records = _records("ООП,,,,a\nSQL,,,,b\nООП,,,,c\n")
+    assert [record["title"] for _, record in records] == ["ООП", "SQL", "ООП"]
+
+def test_read_csv_missing_columns():
+    [(line, error)] = list(_read_csv(io.StringIO("title,text\nООП,x\n")))
+    assert line == 1
+    assert isinstance(error, ValueError)
+    assert "question" in str(error)
+
+def test_normalize_block_strips_and_drops_empty_fields():
+    block = normalize_block({
+        "title": "  ООП ", "theory_text": "  ", "video_file_id": None,
+        "questions": [" Что такое класс? ", "Что такое объект?"]
+    })
+    assert block == {
+        "title": "ООП", "theory_text": None, "video_file_id": None, "pdf_file_id": None,
+        "questions": ["Что такое класс?", "Что такое объект?"]
+    }
+
+def test_normalize_block_without_questions_keeps_them():
+    assert normalize_block({"title": "ООП"})["questions"] is None
+    assert normalize_block({"title": "ООП", "questions": []})["questions"] is None
+
+@pytest.mark.parametrize("record", [
+    {},
+    {"title": "   "},
+    {"title": 5},
+    {"title": "x" * (LIMITS["max_title_length"] + 1)},
+    {"title": "ООП", "theory_text": "x" * (LIMITS["max_theory_length"] + 1)},
+    {"title": "ООП", "questions": "Что такое класс?"},
+    {"title": "ООП", "questions": ["Вопрос", " "]},
+    {"title": "ООП", "questions": [1]},
+    {"title": "ООП", "questions": ["x" * (LIMITS["max_question_length"] + 1)]},
+])
+def test_normalize_block_rejects_invalid_records(record):
+    with pytest.raises(ValueError):
+        normalize_block(record)
+
+def test_detect_format():
+    assert detect_format("course.JSONL") == "jsonl"
+    assert detect_format("course.ndjson") == "jsonl"
+    assert detect_format("/tmp/course.csv") == "csv"
+    with pytest.raises(ValueError):
+        detect_format("course.xlsx")
@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+import config
+from database.db_functions import add_questions, create_content_block, init_database, move_question
+from utils.helpers import parse_questions
+
+def test_parse_questions_one_per_line():
+    assert parse_questions("1. Первый?\n2) Второй?\n- Третий?\n\n") == ["Первый?", "Второй?", "Третий?"]
+
+def test_parse_questions_paragraphs_span_lines():
+    text = "1. Что такое\nнаследование?\n\n2. Что такое\nполиморфизм?\r\n \r\n• Зачем интерфейсы?"
+    assert parse_questions(text) == [
+        "Что такое\nнаследование?",
+        "Что такое\nполиморфизм?",
+        "Зачем интерфейсы?"
+    ]
+
+def test_parse_questions_keeps_numbers_inside_text():
+    assert parse_questions("2024 год — что изменилось?\nВерсия 3.11 быстрее?") == [
+        "2024 год — что изменилось?",
+        "Версия 3.11 быстрее?"
+    ]
+
+def test_parse_questions_empty():
+    assert parse_questions(" \n\n ") == []
+
+def _block_order(block_id: int):
+    with sqlite3.connect(config.DATABASE_PATH) as db:
+        return [row[0] for row in db.execute(
+            "SELECT question_text FROM questions WHERE block_id = ? ORDER BY question_order, id", (block_id,)
+        )]
+
+def _make_block(title: str, texts):
+    async def make():
+        await init_database()
+        block_id = await create_content_block(title)
+        await add_questions(block_id, texts)
+        return block_id
+    return asyncio.run(make())
+
+def _question_ids(block_id: int):
+    with sqlite3.connect(config.DATABASE_PATH) as db:
+        return {text: qid for qid, text in db.execute(
+            "SELECT id, question_text FROM questions WHERE block_id = ?", (block_id,)
+        )}
+
+def test_move_question_swaps_neighbours():
+    block_id = _make_block("Перемещение", ["a", "b", "c"])
+    ids = _question_ids(block_id)
+
+    assert asyncio.run(move_question(ids["a"], 1))
+    assert _block_order(block_id) == ["b", "a", "c"]
+    assert asyncio.run(move_question(ids["c"], -1))
+    assert _block_order(block_id) == ["b", "c", "a"]
+    assert not asyncio.run(move_question(ids["b"], -1))
+    assert not asyncio.run(move_question(ids["a"], 1))
+
+def test_move_question_with_equal_orders():
+    block_id = _make_block("Одинаковый порядок", ["a", "b", "c", "d"])
+    ids = _question_ids(block_id)
+    with sqlite3.connect(config.DATABASE_PATH) as db:
+        db.execute("UPDATE questions SET question_order = 1 WHERE block_id = ?", (block_id,))
+
+    # При одинаковом порядке вопросы идут по id, и вопрос сдвигается ровно на одну позицию
+    assert asyncio.run(move_question(ids["a"], 1))
+    assert _block_order(block_id) == ["b", "a", "c", "d"]
+    with sqlite3.connect(config.DATABASE_PATH) as db:
+        db.execute("UPDATE questions SET question_order = 1 WHERE block_id = ?", (block_id,))
+    assert asyncio.run(move_question(ids["c"], -1))
+    assert _block_order(block_id) == ["a", "c", "b", "d"]
@@ -0,0 +1,79 @@
+from utils.constants import LIMITS
+from utils.rendering import build_theory_pages, format_final_report, is_valid_markdown, split_message
+
+def test_split_message_short_text_is_one_page():
+    assert split_message("abc", limit=10) == ["abc"]
+
+def test_split_message_prefers_paragraphs():
+    text = "aaaa\n\nbbbb\n\ncccc"
+    assert split_message(text, limit=10) == ["aaaa\n\nbbbb", "cccc"]
+
+def test_split_message_long_paragraph_falls_back_to_words():
+    text = "aaaa bbbb cccc\n\ndd"
+    pages = split_message(text, limit=9)
+    assert pages == ["aaaa bbbb", "cccc\n\ndd"]
+    assert all(len(page) <= 9 for page in pages)
+
+def test_split_message_cuts_words_longer_than_limit():
+    assert split_message("abcdefghij", limit=4) == ["abcd", "efgh", "ij"]
+
+def test_split_message_keeps_all_text():
+    text = "\n\n".join(f"абзац {i} " + "слово " * i for i in range(40))
+    pages = split_message(text, limit=50)
+    assert all(len(page) <= 50 for page in pages)
+    assert "".join(pages).replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+
+def test_valid_markdown_entities():
+    assert is_valid_markdown("plain text")
+    assert is_valid_markdown("*bold* _italic_ `code`")
+    assert is_valid_markdown("```\nblock * _ [\n```")
+    assert is_valid_markdown("[link](https://example.com)")
+
+def test_invalid_markdown_unclosed_entities():
+    assert not is_valid_markdown("*bold")
+    assert not is_valid_markdown("snake_case")
+    assert not is_valid_markdown("```code")
+    assert not is_valid_markdown("[text]")
+    assert not is_valid_markdown("[text](https://example.com")
+
+def test_markdown_escapes_outside_entities_only():
+    assert is_valid_markdown(r"snake\_case and 2\*3")
+    # Внутри сущности обратный слэш не экранирует: она закрывается на первом «*»
+    assert not is_valid_markdown(r"*a\*b*")
+
+def test_theory_pages_fit_message_and_caption_limits():
+    text = "\n\n".join("Абзац теории номер %d. " % i * 20 for i in range(30))
+    for has_media, limit in ((False, LIMITS["max_message_length"]), (True, LIMITS["max_caption_length"])):
+        pages = build_theory_pages("Блок", text, has_media)
+        assert len(pages) > 1
+        assert all(len(page) <= limit for page in pages)
+        assert all(page.startswith("📚 **Блок**\n\n") for page in pages)
+
+def test_theory_pages_fit_after_escaping():
+    # Незакрытая разметка экранируется и удлиняет текст
+    text = "[" * 3000
+    pages = build_theory_pages("Блок", text, has_media=True)
+    assert all(len(page) <= LIMITS["max_caption_length"] for page in pages)
+    assert "".join(page.split("\n\n", 1)[1] for page in pages) == "\\[" * 3000
+
+def test_theory_pages_escape_title():
+    pages = build_theory_pages("snake_case", "текст", has_media=False)
+    assert pages == ["📚 **snake\\_case**\n\nтекст"]
+
+def test_theory_pages_without_text():
+    pages = build_theory_pages("Блок", None, has_media=False)
+    assert pages == ["📚 **Блок**\n\nМатериалы для этого блока пока не загружены."]
+
+def test_final_report_numbers_recommendations_by_answer():
+    report = format_final_report([
+        {"is_sufficient": True, "recommendation": "хорошо"},
+        {"is_sufficient": False, "recommendation": "добавьте про __init__"},
+    ])
+    assert "✅ Достаточных ответов: 1/2" in report
+    assert "📈 Процент успешности: 50.0%" in report
+    assert "2. добавьте про \\_\\_init\\_\\_" in report
+    assert "1. хорошо" not in report
+
+def test_final_report_all_sufficient_and_empty():
+    assert "🎉" in format_final_report([{"is_sufficient": True, "recommendation": ""}])
+    assert "0/0" in format_final_report([])
@@ -0,0 +1,19 @@
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+import config
+from middleware.callback_ack import callback_answer_deduplicator
+from middleware.send_scheduler import send_scheduler
+
+def create_bot() -> Bot:
+    """Создать экземпляр бота с общей очередью отправки процесса
+    
+    Если в конфиге задан альтернативный Bot API сервер, запросы идут на него.
+    """
+    if config.TELEGRAM_API_BASE:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_BASE))
+    else:
+        session = AiohttpSession()
+    session.middleware(callback_answer_deduplicator)
+    session.middleware(send_scheduler)
+    return Bot(token=config.BOT_TOKEN, session=session)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+import config
+from database.db_functions import (
+    get_broadcast,
+    get_running_broadcasts,
+    get_broadcast_recipients,
+    save_broadcast_chunk,
+    finish_broadcast
+)
+from database.models import BroadcastStatus
+from middleware.send_scheduler import background_priority
+from utils.keyboards import get_broadcast_progress_keyboard
+from utils.message_editor import message_editor
+from utils.task_registry import task_registry
+
+logger = logging.getLogger(__name__)
+
+async def _send_chunk(bot: Bot, text: str, user_ids: List[int], concurrency: int) -> Dict:
+    """Отправить рассылку порции получателей пулом отправителей"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for user_id in user_ids:
+        queue.put_nowait(user_id)
+
+    result = {"sent": 0, "failed": 0, "blocked_user_ids": []}
+
+    async def sender():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            try:
+                await bot.send_message(user_id, text, parse_mode="Markdown")
+                result["sent"] += 1
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота — больше ему не пишем
+                result["blocked_user_ids"].append(user_id)
+            except TelegramBadRequest as e:
+                if "chat not found" in str(e):
+                    result["blocked_user_ids"].append(user_id)
+                else:
+                    logger.warning(f"Рассылка пользователю {user_id} не доставлена: {e}")
+                    result["failed"] += 1
+            except Exception as e:
+                logger.warning(f"Рассылка пользователю {user_id} не доставлена: {e}")
+                result["failed"] += 1
+
+    await asyncio.gather(*(sender() for _ in range(min(concurrency, len(user_ids)))))
+    return result
+
+async def run_broadcast(
+    bot: Bot,
+    broadcast_id: int,
+    chunk_size: int = config.BROADCAST_CHUNK_SIZE,
+    concurrency: int = config.BROADCAST_CONCURRENCY,
+    on_progress: Optional[Callable[[Dict], Awaitable[None]]] = None
+) -> Dict:
+    """Разослать сообщение порциями, начиная с курсора рассылки
+
+    Курсор и счетчики сохраняются после каждой порции, поэтому прерванная рассылка
+    продолжается с первой несохраненной порции (ее получатели могут получить сообщение повторно).
+    """
+    broadcast = await get_broadcast(broadcast_id)
+    if not broadcast:
+        raise ValueError(f"Рассылка #{broadcast_id} не найдена")
+
+    last_user_id = broadcast["last_user_id"]
+
+    with background_priority():
+        while True:
+            if not task_registry.accepting:
+                break  # Процесс останавливается — рассылка продолжится после перезапуска
+
+            # Отмену проверяем между порциями
+            broadcast = await get_broadcast(broadcast_id)
+            if broadcast["status"] != BroadcastStatus.RUNNING:
+                break
+
+            user_ids = await get_broadcast_recipients(last_user_id, chunk_size)
+            if not user_ids:
+                await finish_broadcast(broadcast_id, BroadcastStatus.COMPLETED)
+                break
+
+            chunk_started = time.monotonic()
+            result = await _send_chunk(bot, broadcast["text"], user_ids, concurrency)
+            last_user_id = user_ids[-1]
+
+            await save_broadcast_chunk(
+                broadcast_id, last_user_id,
+                sent=result["sent"],
+                failed=result["failed"],
+                blocked_user_ids=result["blocked_user_ids"],
+                elapsed_seconds=time.monotonic() - chunk_started
+            )
+
+            if on_progress:
+                await on_progress(await get_broadcast(broadcast_id))
+
+    broadcast = await get_broadcast(broadcast_id)
+    logger.info(
+        f"📣 Рассылка #{broadcast_id} ({broadcast['status']}): отправлено {broadcast['sent']}, "
+        f"заблокировали {broadcast['blocked']}, ошибок {broadcast['failed']}"
+    )
+    return broadcast
+
+def format_broadcast_report(broadcast: Dict) -> str:
+    """Текст отчета о рассылке"""
+    statuses = {
+        BroadcastStatus.RUNNING: "⏳ выполняется",
+        BroadcastStatus.COMPLETED: "✅ завершена",
+        BroadcastStatus.CANCELLED: "⛔ отменена"
+    }
+    processed = broadcast["sent"] + broadcast["blocked"] + broadcast["failed"]
+    throughput = processed / broadcast["elapsed_seconds"] if broadcast["elapsed_seconds"] > 0 else 0
+    return (
+        f"📣 **Рассылка #{broadcast['broadcast_id']}** — {statuses.get(broadcast['status'], broadcast['status'])}\n\n"
+        f"📊 Обработано: {processed}/{broadcast['total_users']}\n"
+        f"✅ Доставлено: {broadcast['sent']}\n"
+        f"🚫 Заблокировали бота: {broadcast['blocked']}\n"
+        f"❌ Ошибок: {broadcast['failed']}\n"
+        f"🚀 Скорость: {throughput:.1f} сообщ./с"
+    )
+
+async def broadcast_and_report(bot: Bot, broadcast_id: int):
+    """Выполнить рассылку, обновляя у админа сообщение с прогрессом"""
+    broadcast = await get_broadcast(broadcast_id)
+    chat_id, message_id = broadcast["progress_chat_id"], broadcast["progress_message_id"]
+
+    async def show_progress(report: Dict):
+        if chat_id:
+            await message_editor.update(
+                bot, chat_id, message_id,
+                format_broadcast_report(report),
+                reply_markup=get_broadcast_progress_keyboard(broadcast_id),
+                parse_mode="Markdown"
+            )
+
+    try:
+        report = await run_broadcast(bot, broadcast_id, on_progress=show_progress)
+        if chat_id:
+            await message_editor.update(
+                bot, chat_id, message_id,
+                format_broadcast_report(report),
+                parse_mode="Markdown",
+                final=True
+            )
+    except Exception as e:
+        logger.error(f"Ошибка рассылки #{broadcast_id}: {e}")
+
+def start_broadcast_task(bot: Bot, broadcast_id: int) -> asyncio.Task:
+    """Запустить рассылку в фоне (при остановке прогресс уже сохранен в БД)"""
+    return task_registry.spawn(broadcast_and_report(bot, broadcast_id), kind="broadcast")
+
+async def resume_broadcasts(bot: Bot) -> int:
+    """Продолжить рассылки, прерванные остановкой бота"""
+    broadcasts = await get_running_broadcasts()
+    for broadcast in broadcasts:
+        logger.info(f"📣 Продолжаем рассылку #{broadcast['broadcast_id']} с пользователя {broadcast['last_user_id']}")
+        start_broadcast_task(bot, broadcast["broadcast_id"])
+    return len(broadcasts)
@@ -21,11 +21,35 @@ MESSAGES = {
     "test_not_found": "❌ У вас нет незавершенных тестов.",
     "test_continued": "🔄 Продолжаем тест: **{title}**\n\n",
     
+    # Мои результаты
+    "results_menu": "📈 **Мои результаты**\n\nЗавершенные тесты, от новых к старым:",
+    "results_empty": "📈 **Мои результаты**\n\nВы еще не завершили ни одного теста.",
+    "result_report": "📄 **{title}** · {date}\n\n{report}",
+    "search_usage": "🔎 **Поиск**\n\nНапишите, что найти, после команды. Например: /search танкер",
+    "search_results": "🔎 **Поиск:** {query}\n\n{results}",
+    "search_result_block": "{number}. 📚 *{title}*\n{snippet}",
+    "search_result_question": "{number}. ❓ Вопрос из блока «{title}»\n{snippet}",
+    "search_empty": "🔎 По запросу «{query}» ничего не найдено.",
+    "admin_search_prompt": "🔎 **Поиск по контенту**\n\nПришлите слова из названия, теории или вопроса:",
+    
+    "result_no_report": "Подробный отчет по этой попытке не сохранился.\n\n📈 Процент успешности: {score}",
+    
     # Админ-панель
     "admin_panel": "👑 **Админ-панель**\n\nВыберите действие:",
     "admin_stats": "📊 **Статистика пользователей**\n\n{stats_text}",
+    "admin_user_search_prompt": "🔎 **Поиск пользователя**\n\nПришлите ID, @username или часть имени:",
+    "admin_user_search_results": "🔎 **Пользователи по запросу:** {query}\n\nНайдено: {count}",
+    "admin_user_search_empty": "🔎 По запросу «{query}» пользователи не найдены.",
     "admin_content": "⚙️ **Управление контентом**\n\nБлок {current}/{total}: **{title}**\n\n{preview}",
     "admin_content_updated": "✅ Контент успешно обновлен!",
+    "admin_questions": "❓ **Вопросы блока** «{title}»\n\n{questions}",
+    "admin_questions_empty": "Вопросов пока нет.",
+    "admin_question": "❓ **Вопрос {position}/{total}**\n\n{text}",
+    "questions_added": "✅ Добавлено вопросов: {count}",
+    "question_updated": "✅ Вопрос обновлен!",
+    "block_created": "✅ Блок «{title}» создан. Добавьте теорию и вопросы:",
+    "confirm_delete_block": "🗑️ Удалить блок «{title}» вместе с вопросами?\n\nСледующие блоки и прогресс пользователей сдвинутся на его место.",
+    "confirm_delete_question": "🗑️ Удалить вопрос?\n\n{text}",
     
     # Системные сообщения
     "maintenance_enabled": "🔧 Режим обслуживания включен",
@@ -38,7 +62,14 @@ MESSAGES = {
     # Редактирование контента
     "send_new_text": "📝 **Редактирование текста блока**\n\nПришлите новый текст:",
     "send_new_video": "🎥 **Изменение видео**\n\nПришлите новое видео или любой текст для удаления:",
+    "send_new_questions": "➕ **Новые вопросы**\n\nПришлите один или несколько вопросов: каждый с новой строки или абзацами через пустую строку. Нумерацию можно оставить.",
+    "send_question_text": "✏️ **Изменение вопроса**\n\nПришлите новый текст вопроса:",
+    "send_block_title": "➕ **Новый блок**\n\nПришлите название блока:",
+    "send_import_file": "📥 **Импорт контента**\n\nПришлите файл .jsonl или .csv (формат — как у /export\\_content). Блоки с теми же названиями обновятся, новые добавятся в конец.",
     "send_new_pdf": "📄 **Изменение PDF**\n\nПришлите новый PDF-файл или любой текст для удаления:",
+    "broadcast_prompt": "📣 **Рассылка**\n\nПришлите текст сообщения для всех пользователей (поддерживается Markdown):",
+    "broadcast_confirm": "📣 **Рассылка**\n\nВыше — так сообщение увидят пользователи.\nПолучателей: **{recipients}**\n\nОтправить?",
+    "broadcast_started": "📣 Рассылка #{broadcast_id} запущена...",
 }
 
 # Эмодзи и символы
@@ -64,7 +95,15 @@ EMOJI = {
 LIMITS = {
     "max_answer_length": 1000,
     "max_theory_length": 10000,
+    "max_question_length": 1000,
+    "max_title_length": 100,
+    "max_message_length": 4096,
+    "max_caption_length": 1024,
     "users_per_page": 10,
     "ai_timeout": 30,
-    "blocks_per_page": 5
+    "blocks_per_page": 5,
+    "results_per_page": 5,
+    "search_results": 8,
+    "user_search_results": 10,
+    "user_recent_items": 5
 }
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""Потоковый импорт и экспорт контента курса (блоки теории и вопросы)
+
+JSONL — один блок на строку:
+
+    {"title": "...", "theory_text": "...", "video_file_id": null, "pdf_file_id": null, "questions": ["...", "..."]}
+
+CSV — одна строка на вопрос, колонки title, theory_text, video_file_id,
+pdf_file_id, question. Поля блока заполняются в первой строке блока,
+следующие строки того же блока содержат только title и question.
+
+Файл читается и пишется порциями по CONTENT_IO_BATCH_SIZE блоков, поэтому
+память не зависит от размера курса. Блоки сопоставляются по названию:
+существующие обновляются, новые добавляются в конец. Пустые поля блок
+не меняют. Ошибочные записи пропускаются и попадают в отчет.
+"""
+import csv
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import config
+from database.db_functions import get_content_export_batch, import_content_batch
+from utils.constants import LIMITS
+
+FORMATS = ("jsonl", "csv")
+CSV_FIELDS = ("title", "theory_text", "video_file_id", "pdf_file_id", "question")
+BLOCK_FIELDS = ("title", "theory_text", "video_file_id", "pdf_file_id")
+MAX_REPORTED_ERRORS = 20
+
+def detect_format(path: str) -> str:
+    """Формат файла по расширению"""
+    suffix = Path(path).suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if suffix == ".csv":
+        return "csv"
+    raise ValueError(f"Неизвестный формат файла {Path(path).name}: ожидается .jsonl или .csv")
+
+# === ЧТЕНИЕ ===
+# Читатели отдают пары (номер строки, запись); испорченная запись — ValueError вместо словаря
+
+def _read_jsonl(file) -> Iterator[Tuple[int, object]]:
+    """Записи JSONL по строкам"""
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, ValueError(f"некорректный JSON ({e.msg})")
+            continue
+        if not isinstance(record, dict):
+            yield line_number, ValueError("ожидается объект с полями блока")
+            continue
+        yield line_number, record
+
+def _read_csv(file) -> Iterator[Tuple[int, object]]:
+    """Записи CSV: подряд идущие строки с одним title собираются в один блок"""
+    reader = csv.DictReader(file)
+    missing = {"title", "question"} - set(reader.fieldnames or ())
+    if missing:
+        yield 1, ValueError(f"нет колонок: {', '.join(sorted(missing))}")
+        return
+
+    record, line_number = None, 0
+    for row in reader:
+        title = (row.get("title") or "").strip()
+        if record is not None and title == record["title"]:
+            for field in BLOCK_FIELDS:
+                record[field] = record[field] or row.get(field)
+        else:
+            if record is not None:
+                yield line_number, record
+            record = {field: row.get(field) for field in BLOCK_FIELDS}
+            record["title"], record["questions"] = title, []
+            line_number = reader.line_num
+
+        question = (row.get("question") or "").strip()
+        if question:
+            record["questions"].append(question)
+
+    if record is not None:
+        yield line_number, record
+
+def _optional_text(record: Dict, field: str, max_length: Optional[int] = None) -> Optional[str]:
+    """Строковое поле записи (пустое — None)"""
+    value = record.get(field)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"поле {field} должно быть строкой")
+    value = value.strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f"поле {field} длиннее {max_length} символов")
+    return value or None
+
+def normalize_block(record: Dict) -> Dict:
+    """Проверить запись по тем же лимитам, что и редактор контента, и привести к виду для import_content_batch"""
+    title = _optional_text(record, "title", LIMITS["max_title_length"])
+    if not title:
+        raise ValueError("нет названия блока (title)")
+
+    questions = record.get("questions")
+    if questions is not None:
+        if not isinstance(questions, list):
+            raise ValueError("поле questions должно быть списком строк")
+        texts = []
+        for number, question in enumerate(questions, 1):
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError(f"вопрос №{number} пустой или не строка")
+            if len(question.strip()) > LIMITS["max_question_length"]:
+                raise ValueError(f"вопрос №{number} длиннее {LIMITS['max_question_length']} символов")
+            texts.append(question.strip())
+        questions = texts or None
+
+    return {
+        "title": title,
+        "theory_text": _optional_text(record, "theory_text", LIMITS["max_theory_length"]),
+        "video_file_id": _optional_text(record, "video_file_id"),
+        "pdf_file_id": _optional_text(record, "pdf_file_id"),
+        "questions": questions
+    }
+
+# === ИМПОРТ И ЭКСПОРТ ===
+
+async def import_content(path: str, fmt: Optional[str] = None,
+                         batch_size: int = config.CONTENT_IO_BATCH_SIZE, dry_run: bool = False) -> Dict:
+    """Загрузить блоки из файла порциями; dry_run — только проверить файл"""
+    fmt = fmt or detect_format(path)
+    report = {
+        "action": "import", "dry_run": dry_run, "blocks": 0, "created": 0, "updated": 0,
+        "questions": 0, "skipped": 0, "errors": []
+    }
+    seen_titles = set()
+    batch: List[Dict] = []
+    started = time.monotonic()
+
+    async def flush():
+        if batch and dry_run:
+            report["questions"] += sum(len(block["questions"] or ()) for block in batch)
+        elif batch:
+            for key, value in (await import_content_batch(batch)).items():
+                report[key] += value
+        report["blocks"] += len(batch)
+        batch.clear()
+
+    # utf-8-sig: файлы из Excel начинаются с BOM
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        records = _read_jsonl(file) if fmt == "jsonl" else _read_csv(file)
+        for line_number, record in records:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                block = normalize_block(record)
+                if block["title"] in seen_titles:
+                    raise ValueError(f"блок «{block['title']}» уже был выше в файле")
+            except ValueError as e:
+                report["skipped"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append(f"строка {line_number}: {e}")
+                continue
+
+            seen_titles.add(block["title"])
+            batch.append(block)
+            if len(batch) >= batch_size:
+                await flush()
+        await flush()
+
+    report["seconds"] = time.monotonic() - started
+    return report
+
+async def export_content(path: str, fmt: Optional[str] = None,
+                         batch_size: int = config.CONTENT_IO_BATCH_SIZE) -> Dict:
+    """Выгрузить все блоки с вопросами в файл порциями"""
+    fmt = fmt or detect_format(path)
+    report = {"action": "export", "blocks": 0, "questions": 0}
+    started = time.monotonic()
+
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file) if fmt == "csv" else None
+        if writer:
+            writer.writerow(CSV_FIELDS)
+
+        after_order = 0
+        while True:
+            blocks = await get_content_export_batch(after_order, batch_size)
+            if not blocks:
+                break
+            for block in blocks:
+                if writer:
+                    first_row = [block[field] or "" for field in BLOCK_FIELDS]
+                    questions = block["questions"] or [""]
+                    writer.writerow(first_row + [questions[0]])
+                    writer.writerows([block["title"], "", "", "", question] for question in questions[1:])
+                else:
+                    record = {field: block[field] for field in BLOCK_FIELDS}
+                    record["questions"] = block["questions"]
+                    file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                report["questions"] += len(block["questions"])
+            report["blocks"] += len(blocks)
+            after_order = blocks[-1]["block_order"]
+
+    report["seconds"] = time.monotonic() - started
+    return report
+
+def format_content_io_report(report: Dict) -> str:
+    """Текст отчета об импорте или экспорте (без разметки: в ошибках текст из файла)"""
+    seconds = report["seconds"]
+    rate = report["blocks"] / seconds if seconds > 0 else 0
+
+    if report["action"] == "export":
+        return (
+            f"📤 Экспорт контента\n\n"
+            f"📚 Блоков: {report['blocks']}\n"
+            f"❓ Вопросов: {report['questions']}\n"
+            f"⏱ {seconds:.2f} с, {rate:.0f} блоков/с"
+        )
+
+    if report["dry_run"]:
+        lines = [
+            "🔍 Проверка файла (без записи)\n",
+            f"✅ Корректных блоков: {report['blocks']}",
+            f"❓ Вопросов: {report['questions']}"
+        ]
+    else:
+        lines = [
+            "📥 Импорт контента\n",
+            f"🆕 Создано блоков: {report['created']}",
+            f"✏️ Обновлено блоков: {report['updated']}",
+            f"❓ Вопросов: {report['questions']}"
+        ]
+    lines.append(f"⚠️ Пропущено записей: {report['skipped']}")
+    lines.append(f"⏱ {seconds:.2f} с, {rate:.0f} блоков/с")
+    if report["errors"]:
+        lines.append("\nОшибки:")
+        lines.extend(report["errors"])
+        if report["skipped"] > len(report["errors"]):
+            lines.append(f"... и еще {report['skipped'] - len(report['errors'])}")
+    return "\n".join(lines)
@@ -101,12 +101,11 @@ def create_username_display(username: Optional[str], full_name: str, user_id: in
         return f"{full_name} (@{username})"
     return f"{full_name} (ID: {user_id})"
 
+_MARKDOWN_V2_ESCAPE_TABLE = str.maketrans({char: f'\\{char}' for char in '_*[]()~`>#+-=|{}.!'})
+
 def escape_markdown(text: str) -> str:
-    """Экранировать специальные символы Markdown"""
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    return text
+    """Экранировать специальные символы MarkdownV2 (за один проход)"""
+    return text.translate(_MARKDOWN_V2_ESCAPE_TABLE)
 
 def format_test_statistics(total_questions: int, correct_answers: int) -> str:
     """Форматировать статистику теста"""
@@ -190,4 +189,20 @@ def create_progress_message(current: int, total: int, action: str = "Обраб
     percentage = (current / total) * 100 if total > 0 else 0
     progress_bar = create_progress_bar(percentage, 15)
     
-    return f"{action}... {progress_bar} {current}/{total} ({percentage:.1f}%)"
\ No newline at end of file
+    return f"{action}... {progress_bar} {current}/{total} ({percentage:.1f}%)"
+
+def parse_questions(text: str) -> List[str]:
+    """Разобрать вставленный список вопросов
+    
+    Если вопросы разделены пустыми строками, вопросом считается абзац (может
+    занимать несколько строк), иначе — каждая строка. Нумерация и маркеры
+    списка в начале вопроса убираются.
+    """
+    text = text.strip().replace("\r\n", "\n")
+    parts = re.split(r"\n\s*\n", text) if re.search(r"\n\s*\n", text) else text.split("\n")
+    questions = []
+    for part in parts:
+        question = re.sub(r"^\s*(?:\d+[.)]|[-•*])\s*", "", part).strip()
+        if question:
+            questions.append(question)
+    return questions
@@ -1,5 +1,6 @@
+from datetime import datetime
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 
 # === ГЛАВНОЕ МЕНЮ ===
 
@@ -7,7 +8,8 @@ def get_main_menu_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     """Главное меню с inline кнопками"""
     buttons = [
         [InlineKeyboardButton(text="📚 Теория", callback_data="menu_theory")],
-        [InlineKeyboardButton(text="📝 Тесты", callback_data="menu_tests")]
+        [InlineKeyboardButton(text="📝 Тесты", callback_data="menu_tests")],
+        [InlineKeyboardButton(text="📈 Мои результаты", callback_data="menu_results")]
     ]
     
     if is_admin:
@@ -33,23 +35,39 @@ def get_theory_menu_keyboard(blocks: List[Dict]) -> InlineKeyboardMarkup:
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_theory_view_keyboard(block_id: int) -> InlineKeyboardMarkup:
-    """Клавиатура просмотра теории"""
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🎯 Начать тест", callback_data=f"test_start_{block_id}")],
-        [InlineKeyboardButton(text="🔙 К списку блоков", callback_data="menu_theory")]
-    ])
+def get_theory_view_keyboard(block_id: int, page: int = 1, total_pages: int = 1) -> InlineKeyboardMarkup:
+    """Клавиатура просмотра теории (с листанием страниц длинного текста)"""
+    buttons = []
+    
+    if total_pages > 1:
+        nav_buttons = []
+        if page > 1:
+            nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"theory_page_{block_id}_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="theory_page_current"))
+        if page < total_pages:
+            nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"theory_page_{block_id}_{page+1}"))
+        buttons.append(nav_buttons)
+    
+    buttons.append([InlineKeyboardButton(text="🎯 Начать тест", callback_data=f"test_start_{block_id}")])
+    buttons.append([InlineKeyboardButton(text="🔙 К списку блоков", callback_data="menu_theory")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # === ТЕСТЫ ===
 
-def get_tests_menu_keyboard(blocks: List[Dict], user_progress: int = 0) -> InlineKeyboardMarkup:
-    """Меню выбора тестов"""
+def get_tests_menu_keyboard(blocks: List[Dict], user_progress: int = 0,
+                            block_results: Dict[int, Dict] = None) -> InlineKeyboardMarkup:
+    """Меню выбора тестов (с лучшим результатом по уже сданным блокам)"""
     buttons = []
+    block_results = block_results or {}
     
     for block in blocks:
         if block["block_order"] <= user_progress + 1:
             # Доступный тест
             text = f"✅ {block['title']}" if block["block_order"] <= user_progress else block["title"]
+            result = block_results.get(block["id"])
+            if result:
+                text += f" · {result['best_score']:.0%}"
             buttons.append([
                 InlineKeyboardButton(
                     text=text,
@@ -69,15 +87,26 @@ def get_tests_menu_keyboard(blocks: List[Dict], user_progress: int = 0) -> Inlin
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_test_feedback_keyboard(attempt_id: int) -> InlineKeyboardMarkup:
-    """Клавиатура оценки результатов теста"""
-    return InlineKeyboardMarkup(inline_keyboard=[
+def get_test_feedback_keyboard(attempt_id: int, appealable_answers: List[Tuple[int, int]] = None) -> InlineKeyboardMarkup:
+    """Клавиатура оценки результатов теста (с кнопками апелляции по отдельным ответам)"""
+    buttons = [
         [
             InlineKeyboardButton(text="👍 Полезно", callback_data=f"feedback_positive_{attempt_id}"),
             InlineKeyboardButton(text="👎 Бесполезно", callback_data=f"feedback_negative_{attempt_id}")
-        ],
-        [InlineKeyboardButton(text="🔙 Главное меню", callback_data="menu_main")]
-    ])
+        ]
+    ]
+    
+    # Кнопки "Оспорить" для ответов с недостаточным вердиктом, по 3 в ряд
+    appeal_buttons = [
+        InlineKeyboardButton(text=f"⚖️ Оспорить №{number}", callback_data=f"appeal_{answer_id}")
+        for number, answer_id in appealable_answers or []
+    ]
+    for i in range(0, len(appeal_buttons), 3):
+        buttons.append(appeal_buttons[i:i + 3])
+    
+    buttons.append([InlineKeyboardButton(text="🔙 Главное меню", callback_data="menu_main")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 def get_active_test_keyboard(active_test: Dict) -> InlineKeyboardMarkup:
     """Клавиатура для выбора действия с активным тестом"""
@@ -106,10 +135,12 @@ def get_admin_menu_keyboard(is_super_admin: bool = False, maintenance_mode: bool
     buttons = [
         [InlineKeyboardButton(text="⚙️ Управление контентом", callback_data="admin_content")],
         [InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton(text="📉 Аналитика ИИ", callback_data="admin_ai_analytics")]
+        [InlineKeyboardButton(text="📉 Аналитика ИИ", callback_data="admin_ai_analytics")],
+        [InlineKeyboardButton(text="📤 Очередь отправки", callback_data="admin_send_queue")]
     ]
     
     if is_super_admin:
+        buttons.append([InlineKeyboardButton(text="📣 Рассылка", callback_data="admin_broadcast")])
         maintenance_text = "🛠️ Режим: ВКЛ" if maintenance_mode else "🛠️ Режим: ВЫКЛ"
         buttons.append([
             InlineKeyboardButton(text=maintenance_text, callback_data="admin_maintenance")
@@ -119,26 +150,30 @@ def get_admin_menu_keyboard(is_super_admin: bool = False, maintenance_mode: bool
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_admin_content_keyboard(block_id: int, current: int, total: int) -> InlineKeyboardMarkup:
-    """Клавиатура управления контентом"""
+def get_admin_content_keyboard(block_id: int, current: int, total: int,
+                               prev_block_id: int = None, next_block_id: int = None) -> InlineKeyboardMarkup:
+    """Клавиатура управления контентом (навигация по id соседних блоков)"""
     buttons = [
         [InlineKeyboardButton(text="✏️ Редактировать текст", callback_data=f"content_edit_text_{block_id}")],
         [InlineKeyboardButton(text="🎥 Изменить видео", callback_data=f"content_edit_video_{block_id}")],
         [InlineKeyboardButton(text="📄 Изменить PDF", callback_data=f"content_edit_pdf_{block_id}")],
-        [InlineKeyboardButton(text="🗑️ Удалить блок", callback_data=f"content_delete_{block_id}")]
+        [InlineKeyboardButton(text="❓ Вопросы", callback_data=f"content_questions_{block_id}")],
+        [InlineKeyboardButton(text="🗑️ Удалить блок", callback_data=f"content_delete_{block_id}")],
+        [
+            InlineKeyboardButton(text="➕ Новый блок", callback_data="content_new_block"),
+            InlineKeyboardButton(text="🔎 Поиск", callback_data="content_search")
+        ]
     ]
     
     # Навигация
     nav_buttons = []
-    if current > 1:
-        prev_id = current - 1
-        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"content_nav_{prev_id}"))
+    if prev_block_id is not None:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"content_nav_{prev_block_id}"))
     
     nav_buttons.append(InlineKeyboardButton(text=f"{current}/{total}", callback_data="content_current"))
     
-    if current < total:
-        next_id = current + 1
-        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"content_nav_{next_id}"))
+    if next_block_id is not None:
+        nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"content_nav_{next_block_id}"))
     
     if len(nav_buttons) > 1:
         buttons.append(nav_buttons)
@@ -147,6 +182,51 @@ def get_admin_content_keyboard(block_id: int, current: int, total: int) -> Inlin
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_admin_questions_keyboard(block_id: int, questions: List[Dict]) -> InlineKeyboardMarkup:
+    """Список вопросов блока: кнопки с номерами вопросов, по 5 в ряд"""
+    number_buttons = [
+        InlineKeyboardButton(text=str(number), callback_data=f"question_view_{question['id']}")
+        for number, question in enumerate(questions, 1)
+    ]
+    buttons = [number_buttons[i:i + 5] for i in range(0, len(number_buttons), 5)]
+    
+    buttons.append([InlineKeyboardButton(text="➕ Добавить вопросы", callback_data=f"questions_add_{block_id}")])
+    buttons.append([InlineKeyboardButton(text="🔙 К блоку", callback_data=f"content_nav_{block_id}")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_admin_question_keyboard(question: Dict) -> InlineKeyboardMarkup:
+    """Действия с вопросом"""
+    buttons = []
+    
+    move_buttons = []
+    if question["position"] > 1:
+        move_buttons.append(InlineKeyboardButton(text="⬆️ Выше", callback_data=f"question_move_{question['id']}_up"))
+    if question["position"] < question["total"]:
+        move_buttons.append(InlineKeyboardButton(text="⬇️ Ниже", callback_data=f"question_move_{question['id']}_down"))
+    if move_buttons:
+        buttons.append(move_buttons)
+    
+    buttons.append([InlineKeyboardButton(text="✏️ Изменить текст", callback_data=f"question_edit_{question['id']}")])
+    buttons.append([InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"question_delete_{question['id']}")])
+    buttons.append([InlineKeyboardButton(text="🔙 К вопросам", callback_data=f"content_questions_{question['block_id']}")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_questions_back_keyboard(block_id: int) -> InlineKeyboardMarkup:
+    """Возврат к вопросам блока"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔙 К вопросам", callback_data=f"content_questions_{block_id}")]
+    ])
+
+def get_block_created_keyboard(block_id: int) -> InlineKeyboardMarkup:
+    """Следующие шаги после создания блока"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✏️ Добавить теорию", callback_data=f"content_edit_text_{block_id}")],
+        [InlineKeyboardButton(text="❓ Добавить вопросы", callback_data=f"questions_add_{block_id}")],
+        [InlineKeyboardButton(text="⚙️ К блоку", callback_data=f"content_nav_{block_id}")]
+    ])
+
 def get_admin_stats_keyboard(current_page: int, total_pages: int, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
     """Клавиатура статистики с пагинацией"""
     buttons = []
@@ -165,10 +245,36 @@ def get_admin_stats_keyboard(current_page: int, total_pages: int, has_prev: bool
     if nav_buttons:
         buttons.append(nav_buttons)
     
+    buttons.append([InlineKeyboardButton(text="🔎 Найти пользователя", callback_data="stats_user_search")])
     buttons.append([InlineKeyboardButton(text="🔙 Админ-панель", callback_data="menu_admin")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_user_search_results_keyboard(users: List[Dict]) -> InlineKeyboardMarkup:
+    """Найденные пользователи (кнопка открывает карточку пользователя)"""
+    buttons = []
+    
+    for user in users:
+        username = f" (@{user['username']})" if user["username"] else ""
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"👤 {user['full_name']}{username}",
+                callback_data=f"admin_user_{user['user_id']}"
+            )
+        ])
+    
+    buttons.append([InlineKeyboardButton(text="🔎 Искать еще", callback_data="stats_user_search")])
+    buttons.append([InlineKeyboardButton(text="🔙 К статистике", callback_data="admin_stats")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_admin_user_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура карточки пользователя"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔎 Найти другого", callback_data="stats_user_search")],
+        [InlineKeyboardButton(text="🔙 К статистике", callback_data="admin_stats")]
+    ])
+
 # === АНАЛИТИКА ИИ ===
 
 def get_ai_analytics_keyboard() -> InlineKeyboardMarkup:
@@ -179,6 +285,7 @@ def get_ai_analytics_keyboard() -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="👍 Лучшие", callback_data="ai_analytics_best"),
             InlineKeyboardButton(text="👎 Худшие", callback_data="ai_analytics_worst")
         ],
+        [InlineKeyboardButton(text="⚡ Модели проверки", callback_data="ai_analytics_tiers")],
         [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_ai_analytics")],
         [InlineKeyboardButton(text="🔙 Админ-панель", callback_data="menu_admin")]
     ])
@@ -189,6 +296,104 @@ def get_ai_blocks_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="🔙 К аналитике ИИ", callback_data="admin_ai_analytics")]
     ])
 
+def get_send_queue_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура метрик очереди отправки"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_send_queue")],
+        [InlineKeyboardButton(text="🔙 Админ-панель", callback_data="menu_admin")]
+    ])
+
+# === РАССЫЛКИ ===
+
+def get_broadcast_draft_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура ввода текста рассылки"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_discard")]
+    ])
+
+def get_broadcast_confirm_keyboard(recipients: int) -> InlineKeyboardMarkup:
+    """Клавиатура подтверждения рассылки"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"✅ Отправить ({recipients})", callback_data="broadcast_confirm")],
+        [InlineKeyboardButton(text="✏️ Изменить текст", callback_data="admin_broadcast")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_discard")]
+    ])
+
+def get_broadcast_progress_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура выполняющейся рассылки"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⛔ Остановить рассылку", callback_data=f"broadcast_stop_{broadcast_id}")],
+        [InlineKeyboardButton(text="🔙 Админ-панель", callback_data="menu_admin")]
+    ])
+
+# === ПОИСК ===
+
+def get_search_results_keyboard(results: List[Dict], for_admin: bool = False) -> InlineKeyboardMarkup:
+    """Переход к найденным блокам (админу — в редактор контента)"""
+    buttons = []
+    seen_blocks = set()
+    
+    for result in results:
+        if result["block_id"] in seen_blocks:
+            continue
+        seen_blocks.add(result["block_id"])
+        callback_data = f"content_nav_{result['block_id']}" if for_admin else f"theory_view_{result['block_id']}"
+        buttons.append([InlineKeyboardButton(text=f"📚 {result['block_title']}", callback_data=callback_data)])
+    
+    if for_admin:
+        buttons.append([InlineKeyboardButton(text="🔎 Искать еще", callback_data="content_search")])
+        buttons.append([InlineKeyboardButton(text="🔙 Админ-панель", callback_data="menu_admin")])
+    else:
+        buttons.append([InlineKeyboardButton(text="🔙 Главное меню", callback_data="menu_main")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+# === МОИ РЕЗУЛЬТАТЫ ===
+
+def get_results_keyboard(attempts: List[Dict], older_cursor: Optional[int] = None,
+                         is_first_page: bool = True) -> InlineKeyboardMarkup:
+    """Список завершенных тестов пользователя (листание по курсору — id последней показанной попытки)"""
+    buttons = []
+    
+    for attempt in attempts:
+        score = f"{attempt['score']:.0%}" if attempt["score"] is not None else "—"
+        date = datetime.fromisoformat(attempt["attempt_timestamp"]).strftime("%d.%m.%Y")
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"{attempt['block_title']} · {score} · {date}",
+                callback_data=f"result_view_{attempt['attempt_id']}_1"
+            )
+        ])
+    
+    nav_buttons = []
+    if not is_first_page:
+        nav_buttons.append(InlineKeyboardButton(text="⏮️ Новые", callback_data="menu_results"))
+    if older_cursor:
+        nav_buttons.append(InlineKeyboardButton(text="Ранее ➡️", callback_data=f"results_after_{older_cursor}"))
+    if nav_buttons:
+        buttons.append(nav_buttons)
+    
+    buttons.append([InlineKeyboardButton(text="🔙 Главное меню", callback_data="menu_main")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+def get_result_report_keyboard(attempt_id: int, page: int = 1, total_pages: int = 1) -> InlineKeyboardMarkup:
+    """Клавиатура просмотра сохраненного отчета (с листанием длинного отчета)"""
+    buttons = []
+    
+    if total_pages > 1:
+        nav_buttons = []
+        if page > 1:
+            nav_buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"result_view_{attempt_id}_{page-1}"))
+        nav_buttons.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="result_page_current"))
+        if page < total_pages:
+            nav_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"result_view_{attempt_id}_{page+1}"))
+        buttons.append(nav_buttons)
+    
+    buttons.append([InlineKeyboardButton(text="🔙 К результатам", callback_data="menu_results")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 # === СИСТЕМНЫЕ ===
 
 def get_back_keyboard(destination: str) -> InlineKeyboardMarkup:
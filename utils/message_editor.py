@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, InlineKeyboardMarkup
+import config
+from utils.constants import LIMITS
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[int, int]
+
+def _render_state(text: str, reply_markup: Optional[InlineKeyboardMarkup], parse_mode: Optional[str]) -> Tuple:
+    """Сравнимое представление содержимого сообщения"""
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+    return (text, markup, parse_mode)
+
+def _is_not_modified(error: TelegramBadRequest) -> bool:
+    """Telegram отклонил правку, потому что содержимое не изменилось"""
+    return "message is not modified" in str(error)
+
+class MessageEditor:
+    """Правки сообщений бота
+
+    Помнит последнее отрисованное содержимое сообщения и пропускает правки без изменений,
+    объединяет частые правки прогресса в одну (отправляется последнее состояние)
+    и сам выбирает способ: правка текста, правка подписи к медиа или замена сообщения.
+    """
+
+    def __init__(self, debounce: float, max_tracked: int):
+        self.debounce = debounce
+        self.max_tracked = max_tracked
+        self._rendered: "OrderedDict[MessageKey, Dict]" = OrderedDict()
+        self._pending: Dict[MessageKey, Dict] = {}
+        self._locks: Dict[MessageKey, asyncio.Lock] = {}
+        self._timers: Dict[MessageKey, asyncio.Task] = {}
+        self._last_edit: Dict[MessageKey, float] = {}
+        self._stats = {"edited": 0, "skipped": 0, "coalesced": 0, "replaced": 0}
+
+    def _remember(self, key: MessageKey, state: Tuple, plain_text: Optional[str]):
+        """Запомнить отрисованное содержимое (старые записи вытесняются)"""
+        self._rendered[key] = {"state": state, "plain_text": plain_text}
+        self._rendered.move_to_end(key)
+        while len(self._rendered) > self.max_tracked:
+            evicted, _ = self._rendered.popitem(last=False)
+            self._locks.pop(evicted, None)
+            self._last_edit.pop(evicted, None)
+
+    def forget(self, chat_id: int, message_id: int):
+        """Забыть сообщение (например, после удаления)"""
+        self._rendered.pop((chat_id, message_id), None)
+        self._locks.pop((chat_id, message_id), None)
+        self._last_edit.pop((chat_id, message_id), None)
+
+    async def show(
+        self,
+        message: Message,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        parse_mode: Optional[str] = "Markdown",
+        keep_media: bool = False
+    ) -> Message:
+        """Показать экран в сообщении, по которому нажали кнопку
+
+        Текстовое сообщение редактируется, у медиа-сообщения правится подпись (если keep_media
+        и текст в нее помещается), иначе сообщение заменяется новым. Возвращает актуальное сообщение.
+        """
+        key = (message.chat.id, message.message_id)
+        state = _render_state(text, reply_markup, parse_mode)
+        current_text = message.text if message.text is not None else message.caption
+
+        # Пропускаем правку, только если сообщение с тех пор никто не менял
+        rendered = self._rendered.get(key)
+        if rendered and rendered["state"] == state and rendered["plain_text"] == current_text:
+            self._stats["skipped"] += 1
+            return message
+
+        if message.text is not None:
+            mode = "text"
+        elif keep_media and len(text) <= LIMITS["max_caption_length"]:
+            mode = "caption"
+        else:
+            mode = "replace"
+
+        if mode != "replace":
+            try:
+                if mode == "text":
+                    result = await message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+                else:
+                    result = await message.edit_caption(caption=text, reply_markup=reply_markup, parse_mode=parse_mode)
+                self._stats["edited"] += 1
+                self._remember(key, state, self._plain_text(result, current_text))
+                return result if isinstance(result, Message) else message
+            except TelegramBadRequest as e:
+                if _is_not_modified(e):
+                    self._stats["skipped"] += 1
+                    self._remember(key, state, current_text)
+                    return message
+                # Сообщение нельзя отредактировать (устарело или тип не подходит) — заменяем
+                logger.debug(f"Правка сообщения {key} невозможна, заменяем: {e}")
+
+        return await self._replace(message, text, reply_markup, parse_mode, state)
+
+    async def _replace(self, message: Message, text: str, reply_markup, parse_mode, state: Tuple) -> Message:
+        """Удалить сообщение и отправить вместо него новое"""
+        try:
+            await message.delete()
+        except TelegramBadRequest:
+            pass  # Слишком старое для удаления — просто оставляем
+        self.forget(message.chat.id, message.message_id)
+
+        new_message = await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        self._stats["replaced"] += 1
+        self._remember((new_message.chat.id, new_message.message_id), state, new_message.text)
+        return new_message
+
+    @staticmethod
+    def _plain_text(result, fallback: Optional[str]) -> Optional[str]:
+        """Текст сообщения после правки в том виде, в каком его вернет Telegram"""
+        if isinstance(result, Message):
+            return result.text if result.text is not None else result.caption
+        return fallback
+
+    async def update(
+        self,
+        bot: Bot,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        parse_mode: Optional[str] = None,
+        final: bool = False
+    ):
+        """Обновить текстовое сообщение прогресса
+
+        Промежуточные правки не чаще раза в debounce секунд: если за это время пришло
+        несколько состояний, отправляется только последнее. final отправляет состояние
+        сразу и дожидается отправки (итоговый результат не должен потеряться).
+        """
+        key = (chat_id, message_id)
+        if key in self._pending:
+            self._stats["coalesced"] += 1
+        self._pending[key] = {"bot": bot, "text": text, "reply_markup": reply_markup, "parse_mode": parse_mode}
+
+        if final:
+            timer = self._timers.pop(key, None)
+            if timer:
+                timer.cancel()  # Отложенная правка еще не началась — состояние отправим сами
+            try:
+                await self._flush(key, raise_errors=True)
+            finally:
+                self._locks.pop(key, None)
+                self._last_edit.pop(key, None)
+            return
+
+        if key in self._timers:
+            return  # Отложенная правка отправит последнее состояние
+
+        delay = self._last_edit.get(key, 0.0) + self.debounce - time.monotonic()
+        if delay <= 0:
+            await self._flush(key)
+        else:
+            self._timers[key] = asyncio.create_task(self._flush_later(key, delay))
+
+    async def _flush_later(self, key: MessageKey, delay: float):
+        """Отправить накопившееся состояние по истечении задержки"""
+        await asyncio.sleep(delay)
+        self._timers.pop(key, None)
+        await self._flush(key)
+
+    async def _flush(self, key: MessageKey, raise_errors: bool = False):
+        """Отправить последнее отложенное состояние сообщения (правки одного сообщения — по очереди)"""
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            pending = self._pending.pop(key, None)
+            if pending is None:
+                return  # Уже отправлено более поздней правкой
+
+            state = _render_state(pending["text"], pending["reply_markup"], pending["parse_mode"])
+            rendered = self._rendered.get(key)
+            if rendered and rendered["state"] == state:
+                self._stats["skipped"] += 1
+                return
+
+            self._last_edit[key] = time.monotonic()
+            try:
+                await pending["bot"].edit_message_text(
+                    pending["text"],
+                    chat_id=key[0],
+                    message_id=key[1],
+                    reply_markup=pending["reply_markup"],
+                    parse_mode=pending["parse_mode"]
+                )
+                self._stats["edited"] += 1
+            except TelegramBadRequest as e:
+                if not _is_not_modified(e):
+                    if raise_errors:
+                        raise
+                    logger.warning(f"Не удалось обновить сообщение {key}: {e}")
+                    return
+                self._stats["skipped"] += 1
+
+            self._remember(key, state, None)
+
+    def get_stats(self) -> Dict:
+        """Счетчики правок"""
+        return dict(self._stats, tracked=len(self._rendered))
+
+message_editor = MessageEditor(config.EDIT_DEBOUNCE_SECONDS, config.EDIT_TRACKED_MESSAGES)
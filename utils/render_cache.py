@@ -0,0 +1,166 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import config
+from database.db_functions import (
+    get_content_blocks, get_content_block_summaries, get_content_page, get_content_version,
+    get_questions_for_block
+)
+from utils.constants import MESSAGES
+from utils.keyboards import (
+    get_main_menu_keyboard, get_theory_menu_keyboard, get_theory_view_keyboard,
+    get_tests_menu_keyboard, get_back_keyboard
+)
+
+RenderKey = Tuple[str, int, int, bool]
+
+class RenderCache:
+    """Кэш отрисованных экранов и данных контента
+
+    Экран (текст, клавиатура и файлы медиа) строится один раз для ключа
+    (экран, версия контента, прогресс пользователя, админ ли он) и дальше
+    переиспользуется. Так же кэшируются списки блоков и вопросов, которые
+    обработчики раньше держали в FSM. Версия контента меняется при любом
+    изменении блоков, поэтому устаревшие записи просто перестают находиться.
+    """
+
+    def __init__(self, max_entries: int, version_ttl: float):
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self._screens: "OrderedDict[RenderKey, Dict]" = OrderedDict()
+        self._version = 0
+        self._version_checked = 0.0
+        self._stats = {"hits": 0, "misses": 0}
+
+    async def _get_version(self) -> int:
+        """Версия контента (из БД не чаще раза в version_ttl секунд)"""
+        now = time.monotonic()
+        if now - self._version_checked >= self.version_ttl:
+            version = await get_content_version()
+            if version != self._version:
+                self._screens.clear()  # Экраны старой версии больше не понадобятся
+                self._version = version
+            self._version_checked = now
+        return self._version
+
+    def invalidate(self):
+        """Перечитать версию контента при следующем запросе (после изменения контента)"""
+        self._version_checked = 0.0
+
+    async def get(
+        self,
+        screen: str,
+        build: Callable[[], Awaitable[Dict]],
+        progress: int = 0,
+        is_admin: bool = False
+    ) -> Dict:
+        """Готовый экран из кэша или построенный build()"""
+        key = (screen, await self._get_version(), progress, is_admin)
+        rendered = self._screens.get(key)
+        if rendered is not None:
+            self._screens.move_to_end(key)
+            self._stats["hits"] += 1
+            return rendered
+
+        self._stats["misses"] += 1
+        rendered = await build()
+        self._screens[key] = rendered
+        while len(self._screens) > self.max_entries:
+            self._screens.popitem(last=False)
+        return rendered
+
+    def get_stats(self) -> Dict:
+        """Счетчики попаданий в кэш"""
+        return dict(self._stats, screens=len(self._screens), content_version=self._version)
+
+render_cache = RenderCache(config.RENDER_CACHE_SIZE, config.CONTENT_VERSION_TTL)
+
+# === ДАННЫЕ КОНТЕНТА ===
+# Возвращаются общие для всех объекты — изменять их нельзя
+
+async def get_block_summaries() -> List[Dict]:
+    """Блоки контента без текста теории"""
+    async def build() -> Dict:
+        return {"blocks": await get_content_block_summaries()}
+
+    return (await render_cache.get("block_summaries", build))["blocks"]
+
+async def _block_questions(block_id: int) -> Dict:
+    """Вопросы блока списком и по id"""
+    async def build() -> Dict:
+        questions = await get_questions_for_block(block_id)
+        return {"questions": questions, "by_id": {question["id"]: question for question in questions}}
+
+    return await render_cache.get(f"questions_{block_id}", build)
+
+async def get_block_questions(block_id: int) -> List[Dict]:
+    """Вопросы блока по порядку"""
+    return (await _block_questions(block_id))["questions"]
+
+async def get_question_text(block_id: int, question_id: int) -> str:
+    """Текст вопроса по id (вопрос мог быть удален, пока шел тест)"""
+    question = (await _block_questions(block_id))["by_id"].get(question_id)
+    return question["question_text"] if question else "Вопрос удален. Отправьте любой ответ, чтобы продолжить."
+
+# === ЭКРАНЫ ===
+
+async def render_main_menu(is_admin: bool = False) -> Dict:
+    """Клавиатура главного меню (текст содержит имя пользователя и отрисовывается при показе)"""
+    async def build() -> Dict:
+        return {"reply_markup": get_main_menu_keyboard(is_admin=is_admin)}
+
+    return await render_cache.get("main_menu", build, is_admin=is_admin)
+
+async def render_theory_menu() -> Dict:
+    """Список блоков теории"""
+    async def build() -> Dict:
+        blocks = await get_content_blocks()
+        if not blocks:
+            return {
+                "text": "📚 **Теория**\n\nБлоки теории пока не добавлены.",
+                "reply_markup": get_back_keyboard("main")
+            }
+        return {"text": MESSAGES["theory_menu"], "reply_markup": get_theory_menu_keyboard(blocks)}
+
+    return await render_cache.get("theory_menu", build)
+
+async def render_tests_menu(progress: int, block_results: Dict[int, Dict] = None) -> Dict:
+    """Список тестов с учетом пройденных пользователем блоков и его лучших результатов
+
+    С результатами клавиатура у каждого пользователя своя и не кэшируется,
+    но список блоков берется из кэша.
+    """
+    if block_results:
+        blocks = await get_block_summaries()
+        return {
+            "text": MESSAGES["tests_menu"],
+            "reply_markup": get_tests_menu_keyboard(blocks, progress, block_results)
+        }
+
+    async def build() -> Dict:
+        blocks = await get_block_summaries()
+        if not blocks:
+            return {
+                "text": "📝 **Тесты**\n\nТесты пока не добавлены.",
+                "reply_markup": get_back_keyboard("main")
+            }
+        return {"text": MESSAGES["tests_menu"], "reply_markup": get_tests_menu_keyboard(blocks, progress)}
+
+    return await render_cache.get("tests_menu", build, progress=progress)
+
+async def render_theory_view(block_id: int, page: int = 1) -> Optional[Dict]:
+    """Страница блока теории: текст, клавиатура листания и файлы медиа (None, если страницы нет)"""
+    async def build() -> Dict:
+        content_page = await get_content_page(block_id, page)
+        if not content_page:
+            return {"missing": True}
+
+        return {
+            "text": content_page["text"],
+            "reply_markup": get_theory_view_keyboard(block_id, page, content_page["total_pages"]),
+            "video_file_id": content_page["video_file_id"],
+            "pdf_file_id": content_page["pdf_file_id"]
+        }
+
+    rendered = await render_cache.get(f"theory_view_{block_id}_{page}", build)
+    return None if rendered.get("missing") else rendered
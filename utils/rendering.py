@@ -0,0 +1,193 @@
+from string import Formatter
+from typing import Any, Dict, List, Optional, Tuple
+from database.models import SNIPPET_START, SNIPPET_END
+from utils.constants import MESSAGES, LIMITS
+
+# Символы разметки Telegram Markdown (legacy), которые экранируются обратным слэшем
+MARKDOWN_SPECIAL = "_*`["
+
+_ESCAPE_TABLE = str.maketrans({char: "\\" + char for char in MARKDOWN_SPECIAL})
+
+class Markdown(str):
+    """Фрагмент с готовой разметкой: подставляется в шаблон без экранирования"""
+
+def escape(text: Any) -> str:
+    """Экранировать разметку в пользовательском тексте (за один проход)"""
+    return str(text).translate(_ESCAPE_TABLE)
+
+def is_valid_markdown(text: str) -> bool:
+    """Проверить, что все сущности разметки закрыты (так же, как их разбирает Telegram)"""
+    i, length = 0, len(text)
+    while i < length:
+        char = text[i]
+        if char == "\\" and i + 1 < length and text[i + 1] in MARKDOWN_SPECIAL:
+            i += 2
+            continue
+
+        if char == "`" and text.startswith("```", i):
+            end = text.find("```", i + 3)
+            if end == -1:
+                return False
+            i = end + 3
+        elif char in "*_`":
+            # Внутри сущности экранирование не работает: она заканчивается на первом таком же символе
+            end = text.find(char, i + 1)
+            if end == -1:
+                return False
+            i = end + 1
+        elif char == "[":
+            close = text.find("]", i + 1)
+            if close == -1 or not text.startswith("(", close + 1):
+                return False
+            end = text.find(")", close + 2)
+            if end == -1:
+                return False
+            i = end + 1
+        else:
+            i += 1
+    return True
+
+def content(text: str) -> Markdown:
+    """Текст контента из БД: своя разметка сохраняется, если она корректна, иначе экранируется"""
+    return Markdown(text if is_valid_markdown(text) else escape(text))
+
+class Template:
+    """Шаблон сообщения, разобранный один раз
+
+    При подстановке значения экранируются, кроме фрагментов Markdown.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[Tuple[str, Optional[str], str]] = [
+            (literal, field, spec or "")
+            for literal, field, spec, _ in Formatter().parse(source)
+        ]
+
+    def render(self, **fields: Any) -> str:
+        """Подставить значения полей"""
+        chunks = []
+        for literal, field, spec in self._parts:
+            chunks.append(literal)
+            if field is None:
+                continue
+            value = fields[field]
+            if isinstance(value, Markdown):
+                chunks.append(value)
+            else:
+                chunks.append(escape(format(value, spec)))
+        return "".join(chunks)
+
+_templates: Dict[str, Template] = {key: Template(text) for key, text in MESSAGES.items()}
+
+def render(key: str, **fields: Any) -> str:
+    """Отрисовать сообщение из MESSAGES с экранированием подставляемых значений"""
+    return _templates[key].render(**fields)
+
+# Границы, по которым режется длинный текст, в порядке предпочтения
+_SPLIT_SEPARATORS = ("\n\n", "\n", " ")
+
+def split_message(text: str, limit: int = LIMITS["max_message_length"], separators: Tuple[str, ...] = _SPLIT_SEPARATORS) -> List[str]:
+    """Разбить длинный текст на страницы: по абзацам, затем по строкам, затем по словам"""
+    if len(text) <= limit:
+        return [text]
+    if not separators:
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+
+    separator, finer = separators[0], separators[1:]
+    pages = []
+    current = ""
+    for part in text.split(separator):
+        if len(part) > limit:
+            # Кусок длиннее страницы режется по более мелким границам
+            if current:
+                pages.append(current)
+            *full_pages, current = split_message(part, limit, finer)
+            pages.extend(full_pages)
+            continue
+
+        candidate = f"{current}{separator}{part}" if current else part
+        if len(candidate) > limit:
+            pages.append(current)
+            current = part
+        else:
+            current = candidate
+
+    if current:
+        pages.append(current)
+    return pages
+
+def paginate(text: str, limit: int = LIMITS["max_message_length"]) -> List[Tuple[str, Optional[str]]]:
+    """Страницы сообщения с parse_mode для каждой
+
+    Страница с незакрытой разметкой (например, разрезанная посередине сущности)
+    отправляется обычным текстом — лучше так, чем ошибка Telegram.
+    """
+    return [
+        (page, "Markdown" if is_valid_markdown(page) else None)
+        for page in split_message(text, limit)
+    ]
+
+def highlight(snippet: str) -> Markdown:
+    """Фрагмент результата поиска: текст экранируется, найденные слова выделяются жирным"""
+    return Markdown(escape(snippet).replace(SNIPPET_START, "*").replace(SNIPPET_END, "*"))
+
+def format_search_results(query: str, results: List[Dict]) -> str:
+    """Текст со списком результатов поиска"""
+    if not results:
+        return render("search_empty", query=query)
+    
+    lines = [
+        render(
+            "search_result_block" if result["kind"] == "block" else "search_result_question",
+            number=number, title=result["block_title"], snippet=highlight(result["snippet"])
+        )
+        for number, result in enumerate(results, 1)
+    ]
+    return render("search_results", query=query, results=Markdown("\n\n".join(lines)))
+
+def format_final_report(answers_analysis: List[Dict]) -> str:
+    """Итоговый отчет по тесту: счет и рекомендации по недостаточным ответам (номер — порядок ответа)"""
+    total_questions = len(answers_analysis)
+    sufficient_answers = sum(1 for analysis in answers_analysis if analysis["is_sufficient"])
+    
+    recommendations = [
+        f"{number}. {escape(analysis['recommendation'])}"
+        for number, analysis in enumerate(answers_analysis, 1)
+        if not analysis["is_sufficient"]
+    ]
+    
+    report_parts = [
+        f"📊 **Результаты анализа вашего теста:**\n",
+        f"✅ Достаточных ответов: {sufficient_answers}/{total_questions}",
+        f"📈 Процент успешности: {sufficient_answers / total_questions * 100 if total_questions else 0:.1f}%\n"
+    ]
+    
+    if recommendations:
+        report_parts.append("💡 **Рекомендации для улучшения:**\n")
+        report_parts.extend(recommendations)
+    else:
+        report_parts.append("🎉 **Отличная работа!** Все ваши ответы достаточно полные и правильные!")
+    
+    report_parts.append("\n📚 Продолжайте изучение следующих тем!")
+    return "\n".join(report_parts)
+
+def build_theory_pages(title: str, theory_text: Optional[str], has_media: bool) -> List[str]:
+    """Страницы блока теории: заголовок и часть текста, каждая в лимит Telegram
+
+    Если у блока есть медиа, страницы показываются в подписи к нему и должны
+    уложиться в лимит подписи.
+    """
+    limit = LIMITS["max_caption_length"] if has_media else LIMITS["max_message_length"]
+    title = content(title)
+    body = theory_text or "Материалы для этого блока пока не загружены."
+    header_length = len(render("theory_block", title=title, content=Markdown("")))
+
+    def fit(part: str) -> List[str]:
+        page = render("theory_block", title=title, content=content(part))
+        if len(page) <= limit or len(part) <= 1:
+            return [page]
+        # Экранирование удлинило страницу — делим ее пополам
+        return [page for half in split_message(part, len(part) // 2 + 1) for page in fit(half)]
+
+    return [page for part in split_message(body, limit - header_length) for page in fit(part)]
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine, Dict, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+class ShutdownInProgress(Exception):
+    """Процесс останавливается и не принимает новую фоновую работу"""
+
+class TaskRegistry:
+    """Реестр фоновых задач процесса (проверка ответов, распознавание голоса и т.д.)
+    
+    Позволяет при остановке перестать принимать новую работу, дождаться текущих задач
+    и сохранить для продолжения те, что не успели завершиться.
+    """
+    
+    def __init__(self):
+        self.accepting = True
+        self._tasks: Dict[asyncio.Task, Dict[str, Any]] = {}
+    
+    def spawn(self, coro: Coroutine, kind: str,
+              checkpoint: Optional[Callable[[], Awaitable[None]]] = None) -> asyncio.Task:
+        """Запустить задачу и зарегистрировать ее
+        
+        checkpoint вызывается, если задача не успела завершиться при остановке
+        и была прервана, — он должен сохранить работу для продолжения после перезапуска.
+        """
+        if not self.accepting:
+            coro.close()
+            raise ShutdownInProgress(f"Новые задачи ({kind}) не принимаются: идет остановка")
+        
+        task = asyncio.create_task(coro)
+        self._tasks[task] = {"kind": kind, "checkpoint": checkpoint}
+        task.add_done_callback(self._on_done)
+        return task
+    
+    async def run(self, coro: Coroutine, kind: str) -> Any:
+        """Выполнить корутину как зарегистрированную задачу и вернуть ее результат"""
+        return await self.spawn(coro, kind)
+    
+    def _on_done(self, task: asyncio.Task):
+        """Убрать завершенную задачу из реестра и залогировать необработанную ошибку"""
+        info = self._tasks.pop(task, None)
+        if task.cancelled():
+            return
+        exception = task.exception()
+        if exception and info:
+            logger.error(f"❌ Необработанная ошибка в фоновой задаче ({info['kind']}): {exception}")
+    
+    def reset(self):
+        """Снова принимать задачи (новый запуск бота в том же процессе после остановки)"""
+        self.accepting = True
+    
+    def stop_accepting(self):
+        """Перестать принимать новые задачи"""
+        if self.accepting:
+            self.accepting = False
+            logger.info(f"⏸️ Прием новых фоновых задач остановлен, в работе: {self.in_flight()}")
+    
+    def in_flight(self, kind: Optional[str] = None) -> int:
+        """Количество выполняющихся задач (всех или заданного типа)"""
+        if kind is None:
+            return len(self._tasks)
+        return sum(1 for info in self._tasks.values() if info["kind"] == kind)
+    
+    async def drain(self, timeout: float) -> int:
+        """Дождаться завершения задач; недоделанные прервать и сохранить. Возвращает число прерванных"""
+        self.stop_accepting()
+        if not self._tasks:
+            return 0
+        
+        logger.info(f"⏳ Ожидание завершения фоновых задач: {len(self._tasks)} (до {timeout} сек)")
+        _, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+        if not pending:
+            logger.info("✅ Все фоновые задачи завершены")
+            return 0
+        
+        # Снимаем информацию до отмены: done-callback удалит задачи из реестра
+        interrupted = [(task, self._tasks.get(task, {})) for task in pending]
+        for task, _ in interrupted:
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in interrupted), return_exceptions=True)
+        
+        for task, info in interrupted:
+            checkpoint = info.get("checkpoint")
+            # Задача могла успеть завершиться сама между таймаутом и отменой
+            if checkpoint is None or not task.cancelled():
+                continue
+            try:
+                await checkpoint()
+            except Exception as e:
+                logger.error(f"❌ Не удалось сохранить прерванную задачу ({info.get('kind')}): {e}")
+        
+        logger.warning(f"⚠️ Прервано незавершенных фоновых задач: {len(interrupted)}")
+        return len(interrupted)
+
+# Реестр задач текущего процесса
+task_registry = TaskRegistry()